@@ -1,6 +1,8 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash, Response, abort
-from models import db, Socio, Predio, Lectura, ConfiguracionTarifa, Usuario, AuditoriaLog, Configuracion, Factura
-from datetime import datetime, timezone
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, g, Response, abort, jsonify, stream_with_context
+from werkzeug.utils import secure_filename
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, Socio, Predio, Lectura, ConfiguracionTarifa, Usuario, AuditoriaLog, Configuracion, Factura, CargaMasiva, ErrorCarga, Trabajo, EstadisticaConsumo, ConsumoSector, Pago, MovimientoCuenta
+from datetime import datetime, timedelta, timezone
 import os
 import io
 import re
@@ -9,7 +11,32 @@ from io import TextIOWrapper
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_migrate import Migrate
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import contains_eager, joinedload
+from paginacion import paginar
+from cargas import procesar_archivo
+from facturacion import calcular_cobro, totales_por_periodo, facturar_periodo, generar_facturas_pendientes, emitir_facturas_periodo
+import tarifas
+import busqueda
+import pagos
+from saldos import cargar_lecturas, recalcular_saldos
+import planes
+from estadisticas import actualizar_estadisticas, recalcular_todo, actualizar_consumo_sectores, sumar_lectura_a_sector, claves_de_predios, recalcular_consumo_sectores
+from cartera import actualizar_cartera, recalcular_cartera, resumen_cartera, nombres_sectores
+import trabajos
+import auditoria
+import usuarios
+import impresion
+import semillas
+import metricas
+import detector_sql
+import uuid
+import time
+import threading
+import click
+import basedatos
+from basedatos import solo_lectura
 
 
 
@@ -17,8 +44,23 @@ app = Flask(__name__)
 
 # CONFIGURACIÓN
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'acueducto.db')
+basedatos.configurar(app, 'sqlite:///' + os.path.join(basedir, 'acueducto.db')) # URL y pool desde el entorno
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['CARGA_TAMANO_LOTE'] = 500 # Filas por lote confirmado en las cargas masivas
+app.config['CARPETA_CARGAS'] = os.path.join(app.instance_path, 'cargas') # Archivos en espera de procesar
+app.config['TRABAJOS_HILOS'] = 2 # Trabajos en segundo plano que pueden correr a la vez
+app.config['TRABAJOS_LATIDO'] = 30 # Segundos entre señales de vida de los trabajos de cada proceso
+app.config['TAMANO_PAGINA'] = 50 # Filas por página en los listados
+app.config['IMPRESION_PROCESOS'] = os.cpu_count() or 1 # Procesos que renderizan los tirajes grandes de facturas
+app.config['IMPRESION_MINIMO_PARALELO'] = 1000 # Desde cuántas facturas se reparte el tiraje entre procesos
+# Método y costo del hash de contraseñas (formato de werkzeug). Más costo = login más lento
+# y claves más difíciles de romper; 'flask medir-hash' muestra cuánto tarda cada opción
+app.config['PASSWORD_HASH_METODO'] = os.environ.get('PASSWORD_HASH_METODO', 'scrypt:32768:8:1')
+# Detector de N+1 y consultas lentas (detector_sql.py): registra con --debug y falla con TESTING,
+# salvo que DETECTOR_SQL diga otra cosa (registrar, fallar, no)
+app.config['DETECTOR_SQL'] = os.environ.get('DETECTOR_SQL')
+app.config['DETECTOR_SQL_REPETICIONES'] = int(os.environ.get('DETECTOR_SQL_REPETICIONES', 10)) # Misma consulta por petición
+app.config['DETECTOR_SQL_LENTA_MS'] = int(os.environ.get('DETECTOR_SQL_LENTA_MS', 100))
 
 migrate = Migrate(app, db)
 login_manager = LoginManager(app)
@@ -26,18 +68,67 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Copia en caché por proceso (usuarios.py): la mayoría de peticiones no consultan la tabla
+    return usuarios.cargar(int(user_id))
 
 # NECESARIO PARA MENSAJES FLASH (Validaciones)
 app.secret_key = 'mi_clave_secreta_segura' 
 
 db.init_app(app)
+basedatos.preparar_motores(app, db)
 
-with app.app_context():
+def sembrar_tarifas():
+    if ConfiguracionTarifa.query.first():
+        return
+    # Primera versión de tarifas: se toma de la configuración anterior (si existe)
+    # y rige para todo el histórico, así los meses ya cobrados no cambian de valor.
+    config = Configuracion.query.first()
+    if config:
+        db.session.add(ConfiguracionTarifa(
+            cargo_fijo=config.cargo_fijo,
+            valor_m3=config.valor_m3,
+            limite_basico=config.limite_basico,
+            valor_m3_extra=config.valor_m3_exceso,
+            fecha_desde=datetime(2000, 1, 1)
+        ))
+        db.session.commit()
+
+def preparar_base():
+    # Tablas, índice de búsqueda y primera versión de tarifas; no toca lo que ya existe
     db.create_all()
-    if not ConfiguracionTarifa.query.first():
-        # ... (código de tarifa inicial igual al anterior) ...
-        pass
+    busqueda.crear_indice()
+    try:
+        sembrar_tarifas()
+    except OperationalError:
+        # Base de datos creada antes de las tarifas versionadas: 'flask db upgrade' la pone al día
+        db.session.rollback()
+
+# --- ARRANQUE ---
+# Importar este módulo no toca la base de datos: los procesos del tiraje de facturas
+# (impresion.py, con 'spawn') vuelven a importar el script principal, y si eso preparara
+# la base o marcara trabajos como interrumpidos dañaría lo que hace el proceso que los
+# lanzó. El proceso que atiende peticiones arranca con la primera de ellas.
+_arrancado = False
+_candado_arranque = threading.Lock()
+
+def arrancar():
+    global _arrancado
+    with _candado_arranque:
+        if _arrancado:
+            return
+        with app.app_context():
+            preparar_base()
+        trabajos.iniciar(app)
+        _arrancado = True
+
+@app.before_request
+def arrancar_con_la_primera_peticion():
+    if not _arrancado:
+        arrancar()
+
+auditoria.iniciar(app)
+metricas.iniciar(app) # Latencia, SQL y tamaño de cada petición para /metrics
+detector_sql.iniciar(app)
 
 #----- ROLES REQUERIDOS---
 def roles_requeridos(*roles):
@@ -51,6 +142,41 @@ def roles_requeridos(*roles):
         return decorated_function
     return decorator
 
+# --- AUDITORÍA ---
+# Toda petición autenticada que cambia datos y termina bien queda en la bitácora (auditoria.py),
+# sin escrituras extra en la petición. Las rutas describen lo que hicieron con auditar(); las
+# que no lo hacen solo se registran si confirmaron alguna escritura.
+def auditar(accion):
+    g.auditoria = accion
+
+@app.after_request
+def auditar_escritura(respuesta):
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and respuesta.status_code < 400 \
+            and current_user.is_authenticated:
+        accion = g.get('auditoria')
+        if accion is None and auditoria.escritura_confirmada():
+            accion = f"{request.method} {request.path}"
+        if accion:
+            auditoria.registrar(accion, current_user.id, request.endpoint)
+    return respuesta
+
+
+_hash_de_relleno = None
+
+def hash_de_relleno():
+    global _hash_de_relleno
+    if _hash_de_relleno is None:
+        _hash_de_relleno = generate_password_hash(uuid.uuid4().hex, app.config['PASSWORD_HASH_METODO'])
+    return _hash_de_relleno
+
+
+
+def guardar_archivo_carga(archivo):
+    # Copia el archivo subido a disco por bloques para que lo procese un trabajo en segundo plano
+    os.makedirs(app.config['CARPETA_CARGAS'], exist_ok=True)
+    ruta = os.path.join(app.config['CARPETA_CARGAS'], f"{uuid.uuid4().hex}.csv")
+    archivo.save(ruta)
+    return ruta
 
 
 # --- RUTAS ---
@@ -64,10 +190,6 @@ def index():
     return render_template('index.html', socios=total_socios, predios=total_predios)
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    return Usuario.query.get(int(user_id))
-
 # RUTA LOGIN (Simplificada para empezar)
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -75,11 +197,20 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
+        inicio = time.perf_counter()
         user = Usuario.query.filter_by(username=username).first()
         
-        # IMPORTANTE: Usamos el método check_password para comparar hashes
-        if user and user.check_password(password):
+        # IMPORTANTE: Usamos el método check_password para comparar hashes. Si el usuario no
+        # existe se verifica contra un hash de relleno, así ambos casos tardan lo mismo
+        valido = user.check_password(password) if user else check_password_hash(hash_de_relleno(), password)
+        app.logger.info("Inicio de sesión %s en %.0f ms", "válido" if valido else "fallido",
+                        (time.perf_counter() - inicio) * 1000)
+        if valido:
+            if user.hash_desactualizado():
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
+            auditar("Inició sesión")
             flash('Bienvenido al sistema Aguamir', 'success')
             return redirect(url_for('index'))
         else:
@@ -134,6 +265,7 @@ def nuevo_socio():
             )
             db.session.add(nuevo)
             db.session.commit()
+            auditar(f"Creó el socio {nuevo.nombre} (cédula {nuevo.cedula})")
             flash('Socio creado exitosamente.', 'success')
             return redirect(url_for('lista_socios'))
             
@@ -148,8 +280,19 @@ def nuevo_socio():
 @app.route('/socios')
 @login_required # <--- Solo usuarios registrados pueden entrar
 def lista_socios():
-    todos_los_socios = Socio.query.order_by(Socio.nombre).all()
-    return render_template('lista_socios.html', socios=todos_los_socios)
+    q = request.args.get('q', '').strip()
+
+    # Cada socio con su número de predios en la misma consulta (sin N+1 en la plantilla). Con
+    # una subconsulta por fila y no GROUP BY: la página sale del índice por nombre sin ordenar la tabla
+    total_predios = db.session.query(func.count(Predio.id)).filter(Predio.socio_id == Socio.id).scalar_subquery()
+    consulta = db.session.query(Socio, total_predios.label('total_predios'))
+    if q:
+        consulta = consulta.filter(db.or_(Socio.nombre.ilike(f"%{q}%"), Socio.cedula.startswith(q)))
+
+    socios, siguiente = paginar(consulta, [Socio.nombre, Socio.id],
+                                lambda fila: (fila.Socio.nombre, fila.Socio.id),
+                                request.args.get('despues'), app.config['TAMANO_PAGINA'])
+    return render_template('lista_socios.html', socios=socios, siguiente=siguiente, q=q)
 
 # --- EDITAR SOCIO ---
 @app.route('/socio/editar/<int:id>', methods=['GET', 'POST'])
@@ -164,6 +307,7 @@ def editar_socio(id):
         # pero si lo necesitas, puedes agregarla aquí.
         
         db.session.commit()
+        auditar(f"Editó el socio {socio.nombre} (cédula {socio.cedula})")
         flash('Datos actualizados correctamente', 'success')
         return redirect(url_for('lista_socios'))
     
@@ -173,14 +317,17 @@ def editar_socio(id):
 @app.route('/predio/nuevo', methods=['GET', 'POST'])
 @login_required # <--- Solo usuarios registrados pueden entrar
 def nuevo_predio():
-    # Consultamos todos los socios para el menú desplegable
-    socios = Socio.query.order_by(Socio.nombre).all()
-    
     if request.method == 'POST':
         numero_cuenta = request.form['numero_cuenta'].strip()
         serial_medidor = request.form['serial_medidor'].strip()
         sector = request.form['sector']
-        socio_id = request.form['socio_id']
+
+        # El dueño se indica por cédula (única) en lugar de listar todos los socios
+        socio = Socio.query.filter_by(cedula=re.sub(r'\D', '', request.form['cedula_socio'])).first()
+        if not socio:
+            flash('Error: No existe un socio con esa cédula.', 'danger')
+            return redirect(url_for('nuevo_predio'))
+        socio_id = socio.id
 
         # Validación: El número de cuenta debe ser único
         existe = Predio.query.filter_by(numero_cuenta=numero_cuenta).first()
@@ -197,38 +344,72 @@ def nuevo_predio():
         
         try:
             db.session.add(nuevo)
+            db.session.flush()
+            actualizar_cartera([nuevo.id])
             db.session.commit()
+            auditar(f"Creó el predio {numero_cuenta} para el socio {socio.cedula}")
             flash('Predio registrado exitosamente.', 'success')
             return redirect(url_for('lista_predios'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error al registrar predio: {str(e)}', 'danger')
 
-    return render_template('nuevo_predio.html', socios=socios)
+    return render_template('nuevo_predio.html')
 
 @app.route('/predios')
 @login_required # <--- Solo usuarios registrados pueden entrar
 def lista_predios():
-    predios = Predio.query.all()
-    return render_template('lista_predios.html', predios=predios)
+    filtros = {
+        'sector': request.args.get('sector', ''),
+        'estado': request.args.get('estado', ''),
+        'q': request.args.get('q', '').strip()
+    }
+
+    # El dueño viene en el mismo JOIN (contains_eager): la plantilla no dispara consultas por fila
+    consulta = Predio.query.join(Predio.dueno).options(contains_eager(Predio.dueno))
+    if filtros['sector']:
+        consulta = consulta.filter(Predio.sector == filtros['sector'])
+    if filtros['estado']:
+        consulta = consulta.filter(Predio.estado == filtros['estado'])
+    if filtros['q']:
+        consulta = consulta.filter(db.or_(
+            Predio.numero_cuenta.startswith(filtros['q']),
+            Socio.nombre.ilike(f"%{filtros['q']}%")
+        ))
+
+    predios, siguiente = paginar(consulta, [Predio.numero_cuenta], lambda p: (p.numero_cuenta,),
+                                 request.args.get('despues'), app.config['TAMANO_PAGINA'])
+    sectores = nombres_sectores()
+    return render_template('lista_predios.html', predios=predios, siguiente=siguiente,
+                           filtros=filtros, sectores=sectores)
 
 @app.route('/predio/editar/<int:id>', methods=['GET', 'POST'])
 @login_required # <--- Solo usuarios registrados pueden entrar
 def editar_predio(id):
     predio = Predio.query.get_or_404(id)
-    socios = Socio.query.order_by(Socio.nombre).all()
     
     if request.method == 'POST':
+        socio = Socio.query.filter_by(cedula=re.sub(r'\D', '', request.form['cedula_socio'])).first()
+        if not socio:
+            flash('Error: No existe un socio con esa cédula.', 'danger')
+            return redirect(url_for('editar_predio', id=id))
+
+        # Si cambia de sector, sus lecturas pasan al consumo del sector nuevo
+        periodos = claves_de_predios([id]) if request.form['sector'] != predio.sector else set()
+
         predio.serial_medidor = request.form['serial_medidor'].strip()
         predio.sector = request.form['sector']
         predio.estado = request.form['estado']
-        predio.socio_id = request.form['socio_id']
+        predio.socio_id = socio.id
+        actualizar_cartera([predio.id]) # Por si cambió de sector
+        actualizar_consumo_sectores(periodos | {(anio, mes, predio.sector) for anio, mes, _ in periodos})
         
         db.session.commit()
+        auditar(f"Editó el predio {predio.numero_cuenta} (sector {predio.sector}, estado {predio.estado})")
         flash('Predio actualizado con éxito', 'success')
         return redirect(url_for('lista_predios'))
     
-    return render_template('editar_predio.html', predio=predio, socios=socios)
+    return render_template('editar_predio.html', predio=predio)
 
 @app.route('/socio/<int:id>/predios')
 @login_required # <--- Solo usuarios registrados pueden entrar
@@ -262,20 +443,37 @@ def registrar_lectura(id):
             flash(f'La lectura actual ({lectura_act}) no puede ser menor a la anterior ({lectura_anterior})', 'danger')
             return redirect(url_for('registrar_lectura', id=id))
 
+        ahora = datetime.now()
+        if ultima and (ultima.anio, ultima.mes) == (ahora.year, ahora.month):
+            flash(f'El predio ya tiene lectura registrada para {ahora.month}/{ahora.year}.', 'danger')
+            return redirect(url_for('registrar_lectura', id=id))
+
+        # Cada lectura carga su valor al estado de cuenta, así que se necesita la tarifa del periodo
+        if not tarifas.tarifa_actual():
+            flash('Debe configurar las tarifas antes de registrar lecturas.', 'danger')
+            return redirect(url_for('registrar_lectura', id=id))
+
         consumo = lectura_act - lectura_anterior
         
         # Guardado en base de datos
         nueva = Lectura(
             predio_id=id,
-            mes=datetime.now().month,
-            anio=datetime.now().year,
+            mes=ahora.month,
+            anio=ahora.year,
             lectura_anterior=lectura_anterior,
             lectura_actual=lectura_act,
             consumo_mes=consumo
         )
         
         db.session.add(nueva)
+        db.session.flush()
+        actualizar_estadisticas([id])
+        sumar_lectura_a_sector(ahora.year, ahora.month, predio.sector, consumo)
+        cargar_lecturas([nueva])
+        actualizar_cartera([id])
+        metricas.contar(metricas.LECTURAS, origen='manual')
         db.session.commit()
+        auditar(f"Registró la lectura {lectura_act:g} de {predio.numero_cuenta} para {ahora.month}/{ahora.year}")
         flash('Lectura registrada correctamente', 'success')
         return redirect(url_for('lista_predios'))
 
@@ -290,6 +488,16 @@ def historial_predio(id):
     lecturas = Lectura.query.filter_by(predio_id=id).order_by(Lectura.anio.desc(), Lectura.mes.desc()).all()
     return render_template('historial_lecturas.html', predio=predio, lecturas=lecturas)
 
+@app.route('/predio/<int:id>/estado-cuenta')
+@login_required
+def estado_cuenta(id):
+    predio = Predio.query.get_or_404(id)
+    # Movimientos en orden cronológico, por páginas (índice predio_id, id)
+    consulta = MovimientoCuenta.query.filter_by(predio_id=id)
+    movimientos, siguiente = paginar(consulta, [MovimientoCuenta.id], lambda m: (m.id,),
+                                     request.args.get('despues'), app.config['TAMANO_PAGINA'])
+    return render_template('estado_cuenta.html', predio=predio, movimientos=movimientos, siguiente=siguiente)
+
 
 # --- RUTA PARA CARGA MASIVA DE LECTURAS ---
 @app.route('/lectura/carga-masiva', methods=['GET', 'POST'])
@@ -307,88 +515,67 @@ def carga_masiva():
             return redirect(request.url)
 
         try:
-            stream = io.StringIO(archivo.stream.read().decode("UTF8"), newline=None)
-            lector = csv.DictReader(stream)
-            
-            exitos = 0
-            errores = []
-            mes_actual = datetime.now().month
-            anio_actual = datetime.now().year
-
-            for fila in lector:
-                cuenta = fila['numero_cuenta'].strip()
-                lectura_str = fila['lectura_actual'].strip()
-                
-                if not lectura_str: continue # Saltar filas vacías
-
-                predio = Predio.query.filter_by(numero_cuenta=cuenta).first()
-                if predio:
-                    lectura_val = float(lectura_str)
-                    # Obtener anterior
-                    ult = Lectura.query.filter_by(predio_id=predio.id).order_by(Lectura.id.desc()).first()
-                    anterior = ult.lectura_actual if ult else 0
-                    
-                    if lectura_val >= anterior:
-                        nueva = Lectura(
-                            predio_id=predio.id,
-                            mes=mes_actual,
-                            anio=anio_actual,
-                            lectura_anterior=anterior,
-                            lectura_actual=lectura_val,
-                            consumo_mes=lectura_val - anterior
-                        )
-                        db.session.add(nueva)
-                        exitos += 1
-                    else:
-                        errores.append(f"Cuenta {cuenta}: Lectura menor a la anterior.")
-                else:
-                    errores.append(f"Cuenta {cuenta}: No encontrada.")
+            # Guardamos el archivo en disco (por partes) y lo procesa un trabajo en segundo plano
+            ruta = guardar_archivo_carga(archivo)
+            trabajo = trabajos.encolar('carga_lecturas', procesar_archivo, 'lecturas', ruta, archivo.filename,
+                                       app.config['CARGA_TAMANO_LOTE'], datetime.now().month, datetime.now().year,
+                                       usuario_id=current_user.id)
+            auditar(f"Subió {archivo.filename} para carga masiva de lecturas (trabajo {trabajo.id})")
+            flash('Archivo recibido. La carga se está procesando en segundo plano.', 'info')
+            return redirect(url_for('ver_trabajo', id=trabajo.id))
 
-            db.session.commit()
-            
-            # DEFINIMOS LA VARIABLE O EL TEXTO DIRECTAMENTE
-            tipo_operacion = "Lecturas Mensuales"
-
-            log = AuditoriaLog(usuario_id=current_user.id, accion=f"Carga masiva de {tipo_operacion} realizada")
-            db.session.add(log)
-            db.session.commit()
-            
-            if errores:
-                for err in errores[:5]: # Mostrar solo los primeros 5 errores
-                    flash(err, 'warning')
-            
-            flash(f'Carga completada. {exitos} registros exitosos.', 'success')
-            return redirect(url_for('lista_predios'))
-            
         except Exception as e:
             db.session.rollback()
             flash(f'Error procesando el archivo: {str(e)}', 'danger')
 
-    return render_template('carga_masiva.html')
+    sectores = nombres_sectores()
+    return render_template('carga_masiva.html', sectores=sectores)
 
 # --- RUTA PARA DESCARGAR CSV PARA CARGA MASIVA DE LECTURAS ---
 @app.route('/lectura/descargar-plantilla')
 @login_required # <--- Solo usuarios registrados pueden entrar
 def descargar_plantilla():
-    # Obtener todos los predios
-    predios = Predio.query.all()
-    
-    # Crear un buffer en memoria para el CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Encabezados: Incluimos datos de referencia para que el operario no se pierda
-    writer.writerow(['numero_cuenta', 'socio', 'serial_medidor', 'lectura_actual'])
-    
-    for p in predios:
-        writer.writerow([p.numero_cuenta, p.dueno.nombre, p.serial_medidor, ''])
-    
-    output.seek(0)
-    
+    sector = request.args.get('sector', '')
+    estado = request.args.get('estado', '')
+
+    # Última lectura de cada predio (id más alto), para que el lector pueda comparar en campo
+    ultimas = db.session.query(
+        Lectura.predio_id, func.max(Lectura.id).label('max_id')
+    ).group_by(Lectura.predio_id).subquery()
+
+    # Una sola consulta con el dueño y la lectura anterior; nada de consultas por fila
+    consulta = db.session.query(
+        Predio.numero_cuenta, Socio.nombre, Predio.serial_medidor, Lectura.lectura_actual
+    ).join(Socio, Predio.socio_id == Socio.id).outerjoin(
+        ultimas, ultimas.c.predio_id == Predio.id
+    ).outerjoin(Lectura, Lectura.id == ultimas.c.max_id)
+    if sector:
+        consulta = consulta.filter(Predio.sector == sector)
+    if estado:
+        consulta = consulta.filter(Predio.estado == estado)
+    consulta = consulta.order_by(Predio.numero_cuenta).yield_per(1000)
+
+    def generar():
+        # El CSV se envía por partes a medida que llegan las filas: memoria constante
+        output = io.StringIO()
+        writer = csv.writer(output)
+
+        # Encabezados: Incluimos datos de referencia para que el operario no se pierda
+        writer.writerow(['numero_cuenta', 'socio', 'serial_medidor', 'lectura_anterior', 'lectura_actual'])
+
+        for i, (cuenta, socio, serial, anterior) in enumerate(consulta, start=1):
+            writer.writerow([cuenta, socio, serial, anterior if anterior is not None else 0, ''])
+            if i % 1000 == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
+
+    nombre = "plantilla_lecturas" + (f"_{secure_filename(sector)}" if sector else "") + ".csv"
     return Response(
-        output.getvalue(),
+        stream_with_context(generar()),
         mimetype="text/csv",
-        headers={"Content-disposition": "attachment; filename=plantilla_lecturas.csv"}
+        headers={"Content-disposition": f"attachment; filename={nombre}"}
     )
 
 # --- CARGA MASIVA DE SOCIOS ---
@@ -397,35 +584,12 @@ def descargar_plantilla():
 def carga_masiva_socios():
     if request.method == 'POST':
         archivo = request.files['archivo_csv']
-        stream = io.StringIO(archivo.stream.read().decode("UTF8"), newline=None)
-        lector = csv.DictReader(stream)
-        
-        resultados = {'exitos': 0, 'errores': []}
-        
-        for fila in lector:
-            try:
-                nombre = fila['nombre'].strip()
-                cedula = re.sub(r'\D', '', fila['cedula'])
-                telefono = re.sub(r'\D', '', fila.get('telefono', ''))
-
-                if not nombre or not cedula:
-                    resultados['errores'].append(f"Fila omitida: Nombre o Cédula vacíos.")
-                    continue
-
-                if Socio.query.filter_by(cedula=cedula).first():
-                    resultados['errores'].append(f"Socio {cedula}: Ya existe en el sistema.")
-                    continue
-
-                nuevo = Socio(nombre=nombre, cedula=cedula, telefono=telefono)
-                db.session.add(nuevo)
-                resultados['exitos'] += 1
-            except Exception as e:
-                resultados['errores'].append(f"Error inesperado: {str(e)}")
-
-        db.session.commit()
-        # Guardamos los resultados en la sesión para mostrarlos en la tabla resumen
-        session['resumen_carga'] = resultados
-        return redirect(url_for('resumen_carga_view', tipo='socios'))
+        ruta = guardar_archivo_carga(archivo)
+        trabajo = trabajos.encolar('carga_socios', procesar_archivo, 'socios', ruta, archivo.filename,
+                                   app.config['CARGA_TAMANO_LOTE'], usuario_id=current_user.id)
+        auditar(f"Subió {archivo.filename} para carga masiva de socios (trabajo {trabajo.id})")
+        flash('Archivo recibido. La carga se está procesando en segundo plano.', 'info')
+        return redirect(url_for('ver_trabajo', id=trabajo.id))
 
     return render_template('carga_masiva_socios.html')
 
@@ -433,8 +597,19 @@ def carga_masiva_socios():
 @app.route('/carga/resumen/<tipo>')
 @login_required # <--- Solo usuarios registrados pueden entrar
 def resumen_carga_view(tipo):
-    resumen = session.get('resumen_carga', {'exitos': 0, 'errores': []})
-    return render_template('resumen_carga.html', resumen=resumen, tipo=tipo)
+    # El resultado de la carga está en la base de datos; sin ?carga= se muestra la última del usuario
+    carga_id = request.args.get('carga', type=int)
+    if carga_id:
+        carga = CargaMasiva.query.get_or_404(carga_id)
+    else:
+        carga = CargaMasiva.query.filter_by(tipo=tipo, usuario_id=current_user.id).order_by(
+            CargaMasiva.id.desc()
+        ).first_or_404()
+
+    # Los errores se muestran por páginas (índice carga_id): una carga puede tener miles
+    errores, siguiente = paginar(ErrorCarga.query.filter_by(carga_id=carga.id), [ErrorCarga.id],
+                                 lambda e: (e.id,), request.args.get('despues'), app.config['TAMANO_PAGINA'])
+    return render_template('resumen_carga.html', carga=carga, errores=errores, siguiente=siguiente, tipo=tipo)
 
 @app.route('/usuarios/nuevo', methods=['GET', 'POST'])
 @login_required
@@ -456,41 +631,121 @@ def nuevo_usuario():
             nuevo.set_password(password) # Encriptación automática
             db.session.add(nuevo)
             db.session.commit()
+            auditar(f"Creó el usuario {username} con rol {rol}")
             flash(f'Usuario {username} creado con éxito.', 'success')
             return redirect(url_for('index'))
 
     return render_template('nuevo_usuario.html')
 
+# --- BITÁCORA DE AUDITORÍA ---
+@app.route('/auditoria/bitacora')
+@login_required
+@roles_requeridos('admin', 'auditor')
+@solo_lectura
+def bitacora_auditoria():
+    # De lo más reciente a lo más antiguo, por páginas (índices usuario_id, id y ruta, id)
+    filtros = {
+        'usuario': request.args.get('usuario', type=int),
+        'ruta': request.args.get('ruta', ''),
+        'desde': request.args.get('desde', ''),
+        'hasta': request.args.get('hasta', ''),
+        'q': request.args.get('q', '').strip()
+    }
+    consulta = db.session.query(AuditoriaLog, Usuario.username).outerjoin(Usuario, AuditoriaLog.usuario_id == Usuario.id)
+    if filtros['usuario']:
+        consulta = consulta.filter(AuditoriaLog.usuario_id == filtros['usuario'])
+    if filtros['ruta']:
+        consulta = consulta.filter(AuditoriaLog.ruta == filtros['ruta'])
+    try:
+        if filtros['desde']:
+            consulta = consulta.filter(AuditoriaLog.fecha >= datetime.strptime(filtros['desde'], '%Y-%m-%d'))
+        if filtros['hasta']:
+            consulta = consulta.filter(AuditoriaLog.fecha < datetime.strptime(filtros['hasta'], '%Y-%m-%d') + timedelta(days=1))
+    except ValueError:
+        abort(400, "Las fechas deben tener el formato AAAA-MM-DD.")
+    if filtros['q']:
+        consulta = consulta.filter(AuditoriaLog.accion.ilike(f"%{filtros['q']}%"))
+
+    eventos, siguiente = paginar(consulta, [AuditoriaLog.id], lambda fila: (fila.AuditoriaLog.id,),
+                                 request.args.get('despues'), app.config['TAMANO_PAGINA'], descendente=True)
+
+    # Rutas que escriben (y tipos de trabajo) para el filtro, sin recorrer la bitácora
+    rutas = sorted(regla.endpoint for regla in app.url_map.iter_rules() if 'POST' in regla.methods)
+    rutas += [f"trabajo:{tipo}" for (tipo,) in db.session.query(Trabajo.tipo).distinct().order_by(Trabajo.tipo)]
+    return render_template('bitacora.html', eventos=eventos, siguiente=siguiente, filtros=filtros, rutas=rutas,
+                           usuarios=db.session.query(Usuario.id, Usuario.username).order_by(Usuario.username).all())
+
 #----- AUDOTORIA DE CONSUMOS
 
+@app.route('/reportes/consumo-sectores')
+@login_required
+@roles_requeridos('admin', 'auditor')
+@solo_lectura
+def consumo_sectores():
+    # Consumo por periodo y sector para decidir racionamientos. ?desde=2025-01&hasta=2026-06&sector=A
+    # Responde JSON por defecto, o CSV con ?formato=csv
+    def periodo(parametro):
+        if not request.args.get(parametro):
+            return None
+        try:
+            anio, mes = (int(x) for x in request.args[parametro].split('-'))
+        except ValueError:
+            abort(400, "Los periodos deben tener el formato AAAA-MM.")
+        return anio, mes
+
+    consulta = ConsumoSector.query
+    desde, hasta = periodo('desde'), periodo('hasta')
+    if desde:
+        consulta = consulta.filter(tuple_(ConsumoSector.anio, ConsumoSector.mes) >= tuple_(*desde))
+    if hasta:
+        consulta = consulta.filter(tuple_(ConsumoSector.anio, ConsumoSector.mes) <= tuple_(*hasta))
+    if 'sector' in request.args:
+        consulta = consulta.filter(ConsumoSector.sector.in_(request.args.getlist('sector')))
+    filas = consulta.order_by(ConsumoSector.anio, ConsumoSector.mes, ConsumoSector.sector).all()
+
+    columnas = ['anio', 'mes', 'sector', 'lecturas', 'medidores_activos', 'total', 'promedio', 'p50', 'p90', 'p95', 'maximo']
+    if request.args.get('formato') == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(columnas)
+        writer.writerows([getattr(f, c) for c in columnas] for f in filas)
+        return Response(output.getvalue(), mimetype="text/csv",
+                        headers={"Content-disposition": "attachment; filename=consumo_sectores.csv"})
+    return jsonify([{c: getattr(f, c) for c in columnas} for f in filas])
+
 @app.route('/auditoria/consumos')
 @login_required
 @roles_requeridos('admin', 'auditor')
+@solo_lectura
 def auditoria_consumos():
     mes_actual = datetime.now().month
     anio_actual = datetime.now().year
     
-    # Obtenemos todas las lecturas del mes actual
-    lecturas_mes = Lectura.query.filter_by(mes=mes_actual, anio=anio_actual).all()
-    
+    # La línea base de cada predio se mantiene al registrar lecturas (ver estadisticas.py),
+    # así el reporte sale de una sola consulta sin importar cuántas cuentas haya.
+    filas = db.session.query(
+        EstadisticaConsumo, Predio.numero_cuenta, Socio.nombre
+    ).join(Predio, Predio.id == EstadisticaConsumo.predio_id).join(Socio).filter(
+        EstadisticaConsumo.ultimo_anio == anio_actual,
+        EstadisticaConsumo.ultimo_mes == mes_actual
+    ).order_by(Predio.numero_cuenta).all()
+
     reporte = []
-    for lec in lecturas_mes:
-        # Calcular promedio de los últimos 3 meses (excluyendo el actual)
-        promedio = db.session.query(func.avg(Lectura.consumo_mes)).filter(
-            Lectura.predio_id == lec.predio_id,
-            Lectura.id != lec.id
-        ).scalar() or 0
-        
+    for est, cuenta, socio in filas:
+        # Promedio de los últimos 3 meses (excluyendo el actual)
+        promedio = est.promedio_3 or 0
+
         # Determinar estado de alerta
         alerta = False
-        if promedio > 0 and lec.consumo_mes > (promedio * 1.5):
+        if promedio > 0 and est.ultimo_consumo > (promedio * 1.5):
             alerta = True
-            
+
         reporte.append({
-            'cuenta': lec.predio.numero_cuenta,
-            'socio': lec.predio.dueno.nombre,
-            'actual': lec.consumo_mes,
-            'promedio': round(promedio, 2),
+            'cuenta': cuenta,
+            'socio': socio,
+            'actual': est.ultimo_consumo,
+            'promedio': promedio,
+            'desviacion': est.desviacion_3 or 0,
             'alerta': alerta
         })
         
@@ -511,163 +766,218 @@ def configurar_tarifas():
 
     if request.method == 'POST':
         config.nombre_acueducto = request.form['nombre']
-        config.cargo_fijo = float(request.form['cargo_fijo'])
-        config.valor_m3 = float(request.form['valor_m3'])
-        config.limite_basico = int(request.form['limite_basico'])
-        config.valor_m3_exceso = float(request.form['valor_m3_exceso'])
-        
-        db.session.commit()
-        
-        # Registrar en la bitácora de auditoría
-        log = AuditoriaLog(usuario_id=current_user.id, accion="Actualizó tarifas del sistema")
-        db.session.add(log)
+        # Las tarifas no se sobrescriben: se crea una versión nueva vigente desde el periodo elegido
+        try:
+            anio, mes = (int(x) for x in request.form['vigente_desde'].split('-'))
+            tarifas.guardar_tarifa(
+                cargo_fijo=float(request.form['cargo_fijo']),
+                valor_m3=float(request.form['valor_m3']),
+                limite_basico=int(request.form['limite_basico']),
+                valor_m3_exceso=float(request.form['valor_m3_exceso']),
+                anio=anio, mes=mes
+            )
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('configurar_tarifas'))
+
         db.session.commit()
+        tarifas.invalidar()
+        auditar(f"Actualizó tarifas del sistema, vigentes desde {mes}/{anio}")
         
         flash('Configuración actualizada correctamente', 'success')
         return redirect(url_for('index'))
 
-    return render_template('configuracion.html', config=config)
+    ahora = datetime.now()
+    return render_template('configuracion.html',
+                           config=config,
+                           tarifa=tarifas.tarifa_actual() or config,
+                           versiones=tarifas.historial(),
+                           periodo_actual=f"{ahora.year}-{ahora.month:02d}")
 
 @app.route('/facturacion/vista-previa')
 @login_required
 @roles_requeridos('admin', 'operador', 'auditor')
+@solo_lectura
 def vista_previa_facturacion():
-    # 1. Obtener tarifas actuales
-    config = Configuracion.query.first()
-    if not config:
+    # 1. Verificar que haya tarifas configuradas
+    if not tarifas.tarifa_actual():
         flash("Debe configurar las tarifas antes de ver la facturación.", "warning")
         return redirect(url_for('configurar_tarifas'))
 
-    # 2. Obtener lecturas del mes actual
+    # 2. Obtener lecturas del mes actual (cuenta y socio en la misma consulta, índice por periodo)
     ahora = datetime.now(timezone.utc)
-    #lecturas = Lectura.query.filter_by(mes=ahora.month, anio=ahora.year).all()
-    lecturas = Lectura.query.all()
-    
-    facturas_previa = []
-    total_recaudo_esperado = 0
+    lecturas = db.session.query(
+        Predio.numero_cuenta, Socio.nombre, Lectura.anio, Lectura.mes, Lectura.consumo_mes
+    ).select_from(Lectura).join(Predio).join(Socio).filter(
+        Lectura.anio == ahora.year, Lectura.mes == ahora.month
+    ).all()
 
-    for lec in lecturas:
-        consumo = lec.consumo_mes
-        subtotal_basico = 0
-        subtotal_exceso = 0
-        
-        # Lógica de cobro por niveles
-        if consumo <= config.limite_basico:
-            subtotal_basico = consumo * config.valor_m3
-        else:
-            subtotal_basico = config.limite_basico * config.valor_m3
-            subtotal_exceso = (consumo - config.limite_basico) * config.valor_m3_exceso
-            
-        total_pagar = config.cargo_fijo + subtotal_basico + subtotal_exceso
-        total_recaudo_esperado += total_pagar
-        
+    # 3. Cada periodo se calcula de una sola pasada con su tarifa vigente (ver facturacion.py)
+    totales = totales_por_periodo(lecturas)
+    total_recaudo_esperado = sum(totales)
+
+    facturas_previa = []
+    for lec, total_pagar in zip(lecturas, totales):
+        cargo_fijo = tarifas.tarifa_para(lec.anio, lec.mes).cargo_fijo
         facturas_previa.append({
-            'cuenta': lec.predio.numero_cuenta,
-            'socio': lec.predio.dueno.nombre,
-            'consumo': consumo,
-            'cargo_fijo': config.cargo_fijo,
-            'valor_consumo': subtotal_basico + subtotal_exceso,
+            'cuenta': lec.numero_cuenta,
+            'socio': lec.nombre,
+            'consumo': lec.consumo_mes,
+            'cargo_fijo': cargo_fijo,
+            'valor_consumo': total_pagar - cargo_fijo,
             'total': total_pagar
         })
 
     return render_template('vista_previa_facturacion.html', 
                            facturas=facturas_previa, 
                            total_recaudo=total_recaudo_esperado,
-                           mes=ahora.month, anio=ahora.year)
+                           mes=ahora.month, anio=ahora.year,
+                           sectores=nombres_sectores())
 
 
 @app.route('/facturacion/emitir-masivo', methods=['POST'])
 @login_required
 @roles_requeridos('admin', 'operador')
 def emitir_facturas_masivo():
-    config = Configuracion.query.first()
     ahora = datetime.now(timezone.utc)
-    # Buscamos lecturas que NO tengan factura asociada todavía
-    lecturas = Lectura.query.filter_by(mes=ahora.month, anio=ahora.year).all()
-    
-    contador = 0
-    for lec in lecturas:
-        if not Factura.query.filter_by(lectura_id=lec.id).first():
-            # (Aquí va la lógica de cálculo que ya hicimos...)
-            consumo = lec.consumo_mes
-            # ... calculo de total_pagar ...
-            
-            nueva_factura = Factura(
-                lectura_id=lec.id,
-                numero_factura=f"FAC-{ahora.year}-{lec.predio.numero_cuenta}-{lec.id}",
-                total_a_pagar=total_pagar,
-                estado='Pendiente'
-            )
-            db.session.add(nueva_factura)
-            contador += 1
-    
-    db.session.commit()
-    flash(f"Se han generado {contador} facturas correctamente.", "success")
-    return redirect(url_for('modulo_pos'))
+    # La emisión corre en segundo plano; el operador sigue el avance en la vista del trabajo
+    trabajo = trabajos.encolar('emitir_facturas', emitir_facturas_periodo, ahora.month, ahora.year,
+                               usuario_id=current_user.id)
+    auditar(f"Emitió las facturas de {ahora.month}/{ahora.year} (trabajo {trabajo.id})")
+    flash("La emisión de facturas del periodo se está procesando en segundo plano.", "info")
+    return redirect(url_for('ver_trabajo', id=trabajo.id))
+
+@app.route('/facturacion/impresion')
+@login_required
+@roles_requeridos('admin', 'operador')
+@solo_lectura
+def imprimir_facturas():
+    # Tiraje de impresión: todas las facturas del periodo (opcionalmente de un sector) en un
+    # solo documento, una por página, enviado por partes a medida que se renderiza
+    ahora = datetime.now(timezone.utc)
+    anio = request.args.get('anio', ahora.year, type=int)
+    mes = request.args.get('mes', ahora.month, type=int)
+    sector = request.args.get('sector', '').strip()
+
+    tarifa = tarifas.tarifa_para(anio, mes)
+    if tarifa is None:
+        flash("Debe configurar las tarifas antes de imprimir facturas.", "warning")
+        return redirect(url_for('vista_previa_facturacion'))
+
+    # Una sola consulta con la lectura, el predio y el socio de cada factura
+    consulta = db.session.query(
+        Factura.numero_factura, Factura.total_a_pagar, Factura.estado,
+        Predio.numero_cuenta, Predio.sector, Predio.serial_medidor, Predio.saldo,
+        Socio.nombre, Socio.cedula,
+        Lectura.lectura_anterior, Lectura.lectura_actual, Lectura.consumo_mes
+    ).join(Lectura, Factura.lectura_id == Lectura.id).join(
+        Predio, Lectura.predio_id == Predio.id
+    ).join(Socio, Predio.socio_id == Socio.id).filter(Lectura.anio == anio, Lectura.mes == mes)
+    if sector:
+        consulta = consulta.filter(Predio.sector == sector)
+
+    total = consulta.count()
+    if not total:
+        flash(f"No hay facturas emitidas para {mes}/{anio}{' en ese sector' if sector else ''}.", "info")
+        return redirect(url_for('vista_previa_facturacion'))
+
+    # La consulta se ejecuta aquí, todavía en el motor de solo lectura; las filas llegan por partes
+    filas = iter(consulta.order_by(Predio.sector, Predio.numero_cuenta).yield_per(1000))
+
+    def facturas():
+        for (numero, valor, estado, cuenta, sector_predio, serial, saldo,
+             socio, cedula, anterior, actual, consumo) in filas:
+            cobro = calcular_cobro(consumo, tarifa)
+            yield {
+                'numero_factura': numero, 'total': valor, 'estado': estado,
+                'cuenta': cuenta, 'sector': sector_predio, 'serial': serial, 'saldo': saldo,
+                'socio': socio, 'cedula': cedula, 'mes': mes, 'anio': anio,
+                'lectura_anterior': anterior, 'lectura_actual': actual, 'consumo': consumo,
+                'limite_basico': tarifa.limite_basico, 'cargo_fijo': cobro['cargo_fijo'],
+                'basico': cobro['basico'], 'exceso': cobro['exceso']
+            }
+
+    config = Configuracion.query.first()
+    empresa = {'nombre': getattr(config, 'nombre_acueducto', ''), 'nit': getattr(config, 'nit', '')}
+    procesos = app.config['IMPRESION_PROCESOS'] if total >= app.config['IMPRESION_MINIMO_PARALELO'] else 1
+    return stream_template('impresion_facturas.html', anio=anio, mes=mes, sector=sector, total=total,
+                           partes=impresion.renderizar(facturas(), empresa, procesos))
 
 @app.route('/pos')
 @login_required
 @roles_requeridos('admin', 'operador')
 def modulo_pos():
     search = request.args.get('search', '').strip()
+    predio_id = request.args.get('predio_id', type=int)
     resultado = None
-
-    if search:
-        # Buscamos el predio y su dueño
-        predio = Predio.query.join(Socio).filter(
-            db.or_(
-                Predio.numero_cuenta.ilike(f"%{search}%"),
-                Socio.nombre.ilike(f"%{search}%")
-            )
-        ).first()
-
-        if predio:
-            # Buscamos lecturas que NO tengan factura pagada
-            lecturas_pendientes = Lectura.query.filter(
-                Lectura.predio_id == predio.id
-            ).outerjoin(Factura).filter(
-                db.or_(Factura.id == None, Factura.estado != 'Pagado')
-            ).order_by(Lectura.anio.desc(), Lectura.mes.desc()).all()
-
-            config = Configuracion.query.first()
-            detalles = []
-            total_deuda = 0
-
-            for l in lecturas_pendientes:
-                # Cálculo de cobro para este mes específico
-                consumo = l.consumo_mes
-                v_basico = min(consumo, config.limite_basico) * config.valor_m3
-                v_exceso = max(0, consumo - config.limite_basico) * config.valor_m3_exceso
-                subtotal = config.cargo_fijo + v_basico + v_exceso
-                
-                total_deuda += subtotal
-                detalles.append({
-                    'id': l.id,
-                    'periodo': f"{l.mes}/{l.anio}",
-                    'ant': l.lectura_anterior,
-                    'act': l.lectura_actual,
-                    'con': consumo,
-                    'sub': subtotal
-                })
-
-            resultado = {
-                'predio': predio,
-                'detalles': detalles,
-                'total_deuda': total_deuda,
-                'cantidad_meses': len(detalles)
-            }
-
-    return render_template('pos.html', r=resultado)
+    candidatos = []
+    predio = None
+
+    if predio_id:
+        # El cajero eligió la cuenta exacta en el buscador
+        predio = Predio.query.get_or_404(predio_id)
+    elif search:
+        # Búsqueda por índice; si hay varias coincidencias el cajero elige, no adivinamos
+        candidatos = busqueda.buscar(search, 'predio', limite=10)
+        if len(candidatos) == 1:
+            predio = db.session.get(Predio, candidatos[0]['predio_id'])
+            candidatos = []
+
+    if predio:
+        # Meses sin pagar; cada uno con el valor de su factura o con la tarifa de su periodo
+        detalles = []
+        for l, factura, subtotal in pagos.pendientes(predio.id):
+            detalles.append({
+                'id': l.id,
+                'periodo': f"{l.mes}/{l.anio}",
+                'ant': l.lectura_anterior,
+                'act': l.lectura_actual,
+                'con': l.consumo_mes,
+                'sub': subtotal
+            })
+        total_deuda = sum(d['sub'] for d in detalles)
+
+        resultado = {
+            'predio': predio,
+            'saldo': predio.saldo, # Saldo del estado de cuenta (una sola fila, sin recalcular)
+            'clave': uuid.uuid4().hex, # Identifica este cobro: reenviar el formulario no cobra dos veces
+            'detalles': detalles,
+            'total_deuda': total_deuda,
+            'cantidad_meses': len(detalles)
+        }
+
+    return render_template('pos.html', r=resultado, candidatos=candidatos, search=search)
+
+@app.route('/api/buscar')
+@login_required
+def api_buscar():
+    # Autocompletado del POS y de los selectores de socio
+    tipo = 'socio' if request.args.get('tipo') == 'socio' else 'predio'
+    limite = min(request.args.get('limite', 10, type=int), 20)
+    return jsonify(busqueda.buscar(request.args.get('q', ''), tipo, limite))
+
+def auditar_pago(pago, predio):
+    # Repetir la petición con la misma clave devuelve el pago ya registrado sin escribir
+    # nada: no es otro cobro y no va otra vez a la bitácora
+    if pago and auditoria.escritura_confirmada():
+        auditar(f"Cobró el recibo N° {pago.id} de {predio.numero_cuenta}: {pago.meses} meses, "
+                f"$ {pago.total:,.0f} ({pago.metodo_pago})")
 
 @app.route('/pos/pagar/<int:factura_id>', methods=['POST'])
+@login_required
 def registrar_pago(factura_id):
     factura = Factura.query.get_or_404(factura_id)
-    factura.estado = 'Pagado'
-    factura.fecha_pago = datetime.now(timezone.utc)
-    factura.metodo_pago = 'Efectivo' # Por defecto en oficina
-    
-    db.session.commit()
-    flash(f"Pago registrado para la cuenta {factura.lectura.predio.numero_cuenta}", "success")
+    predio = factura.lectura.predio
+    try:
+        pago = pagos.cobrar(predio, current_user.id, lectura_ids={factura.lectura_id}, clave=request.form.get('clave'))
+    except ValueError:
+        flash("Esa factura ya estaba pagada.", "warning")
+        return redirect(url_for('modulo_pos'))
+
+    auditar_pago(pago, predio)
+
+    flash(f"Pago registrado para la cuenta {predio.numero_cuenta}", "success")
     # Aquí es donde dispararíamos la impresión del mini-recibo
     return redirect(url_for('modulo_pos'))
 
@@ -675,32 +985,10 @@ def registrar_pago(factura_id):
 @login_required
 @roles_requeridos('admin', 'operador')
 def generar_periodo():
-    config = Configuracion.query.first()
-    # Obtenemos todas las lecturas (puedes filtrar por mes/año si prefieres)
-    lecturas_sin_factura = Lectura.query.outerjoin(Factura).filter(Factura.id == None).all()
-    
-    count = 0
-    for lec in lecturas_sin_factura:
-        # Lógica de cálculo (puedes moverla a una función aparte luego)
-        consumo = lec.consumo_mes
-        if consumo <= config.limite_basico:
-            total = config.cargo_fijo + (consumo * config.valor_m3)
-        else:
-            total = config.cargo_fijo + (config.limite_basico * config.valor_m3) + \
-                    ((consumo - config.limite_basico) * config.valor_m3_exceso)
-        
-        nueva_f = Factura(
-            lectura_id=lec.id,
-            numero_factura=f"FAC-{lec.predio.numero_cuenta}-{lec.id}",
-            total_a_pagar=total,
-            estado='Pendiente'
-        )
-        db.session.add(nueva_f)
-        count += 1
-    
-    db.session.commit()
-    flash(f"¡Éxito! Se generaron {count} facturas para cobrar en el POS.", "success")
-    return redirect(url_for('modulo_pos'))
+    trabajo = trabajos.encolar('generar_periodo', generar_facturas_pendientes, usuario_id=current_user.id)
+    auditar(f"Generó las facturas pendientes (trabajo {trabajo.id})")
+    flash("La facturación del periodo se está generando en segundo plano.", "info")
+    return redirect(url_for('ver_trabajo', id=trabajo.id))
 
 @app.route('/factura/previa/<int:lectura_id>')
 @login_required
@@ -708,38 +996,35 @@ def generar_periodo():
 def factura_previa(lectura_id):
     lectura = Lectura.query.get_or_404(lectura_id)
     config = Configuracion.query.first()
-    
+    tarifa = tarifas.tarifa_para(lectura.anio, lectura.mes)
+    if tarifa is None:
+        flash(f"No hay tarifas vigentes para {lectura.mes}/{lectura.anio}.", "warning")
+        return redirect(url_for('configurar_tarifas'))
+
     # Calculamos en caliente para mostrar al socio
-    consumo = lectura.consumo_mes
-    basico = min(consumo, config.limite_basico) * config.valor_m3
-    exceso = max(0, consumo - config.limite_basico) * config.valor_m3_exceso
-    total = config.cargo_fijo + basico + exceso
+    cobro = calcular_cobro(lectura.consumo_mes, tarifa)
     
     return render_template('factura_formato.html', 
                            l=lectura, 
                            c=config, 
-                           total=total,
-                           basico=basico,
-                           exceso=exceso)
+                           t=tarifa, 
+                           total=cobro['total'],
+                           basico=cobro['basico'],
+                           exceso=cobro['exceso'])
 
 @app.route('/pos/pagar-directo/<int:lectura_id>', methods=['POST'])
 @login_required
 def registrar_pago_directo(lectura_id):
-    total = float(request.form.get('total'))
-    
-    # Creamos la factura en este preciso instante
-    nueva_factura = Factura(
-        lectura_id=lectura_id,
-        numero_factura=f"REC-{datetime.now().strftime('%Y%m%d%H%M')}",
-        total_a_pagar=total,
-        estado='Pagado', # Se marca pagado de una vez
-        fecha_pago=datetime.now(timezone.utc),
-        metodo_pago='Efectivo'
-    )
-    
-    db.session.add(nueva_factura)
-    db.session.commit()
-    
+    # El valor se calcula aquí con la tarifa del periodo; no se toma del formulario
+    lectura = Lectura.query.get_or_404(lectura_id)
+    try:
+        pago = pagos.cobrar(lectura.predio, current_user.id, lectura_ids={lectura_id}, clave=request.form.get('clave'))
+    except ValueError:
+        flash("Ese mes ya estaba pagado.", "warning")
+        return redirect(url_for('modulo_pos'))
+
+    auditar_pago(pago, lectura.predio)
+
     flash("Pago procesado con éxito.", "success")
     # Aquí redirigiríamos a una versión "Mini" del recibo para impresora térmica
     return redirect(url_for('modulo_pos'))
@@ -747,143 +1032,210 @@ def registrar_pago_directo(lectura_id):
 @app.route('/pos/pagar-masivo', methods=['POST'])
 @login_required
 def registrar_pago_masivo():
-    predio_id = request.form.get('predio_id')
-    # Volvemos a buscar las lecturas pendientes para procesar el pago
-    lecturas_a_pagar = Lectura.query.filter(
-        Lectura.predio_id == predio_id
-    ).outerjoin(Factura).filter(
-        db.or_(Factura.id == None, Factura.estado != 'Pagado')
-    ).all()
+    predio = Predio.query.get_or_404(request.form.get('predio_id', type=int))
+    try:
+        pago = pagos.cobrar(predio, current_user.id, clave=request.form.get('clave'))
+    except ValueError as e:
+        flash(str(e), "warning")
+        return redirect(url_for('modulo_pos', predio_id=predio.id))
 
-    config = Configuracion.query.first()
-    ahora = datetime.now(timezone.utc)
-    
-    for l in lecturas_a_pagar:
-        # Calculamos el total de ese mes específico
-        consumo = l.consumo_mes
-        basico = min(consumo, config.limite_basico) * config.valor_m3
-        exceso = max(0, consumo - config.limite_basico) * config.valor_m3_exceso
-        total_mes = config.cargo_fijo + basico + exceso
-
-        # Creamos el registro de pago para este mes
-        factura = Factura(
-            lectura_id=l.id,
-            numero_factura=f"REC-{predio_id}-{l.id}-{ahora.strftime('%y%m%d')}",
-            total_a_pagar=total_mes,
-            estado='Pagado',
-            fecha_pago=ahora,
-            metodo_pago='Efectivo'
-        )
-        db.session.add(factura)
+    auditar_pago(pago, predio)
 
-    db.session.commit()
-    flash(f"Se han pagado {len(lecturas_a_pagar)} meses correctamente.", "success")
+    flash(f"Se han pagado {pago.meses if pago else 0} meses correctamente.", "success")
     return redirect(url_for('modulo_pos'))
 
 @app.route('/pos/confirmar-pago', methods=['POST'])
 @login_required
 def confirmar_pago():
-    predio_id = request.form.get('predio_id')
-    # Recuperamos las lecturas que el operador vio en pantalla
-    lecturas_a_pagar = Lectura.query.filter(
-        Lectura.predio_id == predio_id
-    ).outerjoin(Factura).filter(
-        db.or_(Factura.id == None, Factura.estado != 'Pagado')
-    ).all()
-
-    if not lecturas_a_pagar:
+    predio = Predio.query.get_or_404(request.form.get('predio_id', type=int))
+    # Se cobran exactamente los meses que el cajero vio en pantalla, una sola vez por clave
+    lectura_ids = set(request.form.getlist('lectura_id', type=int)) or None
+    try:
+        pago = pagos.cobrar(predio, current_user.id, lectura_ids=lectura_ids, clave=request.form.get('clave'))
+    except ValueError as e:
+        flash(str(e), "warning")
+        return redirect(url_for('modulo_pos', predio_id=predio.id))
+
+    if not pago:
         flash("No hay meses pendientes para este socio.", "warning")
         return redirect(url_for('modulo_pos'))
 
-    config = Configuracion.query.first()
-    ahora = datetime.now(timezone.utc)
-    pago_id_grupo = ahora.strftime('%Y%m%d%H%M%S') # ID único para este grupo de meses
-    
-    facturas_generadas_ids = []
-
-    for l in lecturas_a_pagar:
-        # Cálculo exacto por mes
-        consumo = l.consumo_mes
-        basico = min(consumo, config.limite_basico) * config.valor_m3
-        exceso = max(0, consumo - config.limite_basico) * config.valor_m3_exceso
-        total_mes = config.cargo_fijo + basico + exceso
-
-        nueva_factura = Factura(
-            lectura_id=l.id,
-            numero_factura=f"REC-{pago_id_grupo}-{l.id}",
-            total_a_pagar=total_mes,
-            estado='Pagado',
-            fecha_pago=ahora,
-            metodo_pago='Efectivo'
-        )
-        db.session.add(nueva_factura)
-        db.session.flush() # Para obtener el ID antes del commit definitivo
-        facturas_generadas_ids.append(nueva_factura.id)
+    auditar_pago(pago, predio)
+    # Redirigimos a la vista de impresión del recibo
+    return redirect(url_for('imprimir_recibo', pago_id=pago.id))
 
-    db.session.commit()
-    
-    # Redirigimos a la vista de impresión con el grupo de facturas pagadas
-    return redirect(url_for('imprimir_recibo', grupo_id=pago_id_grupo, predio_id=predio_id))
-
-@app.route('/imprimir-recibo/<grupo_id>/<int:predio_id>')
+@app.route('/imprimir-recibo/<int:pago_id>')
 @login_required
-def imprimir_recibo(grupo_id, predio_id):
-    # Buscamos las facturas que acabamos de generar
-    facturas = Factura.query.filter(Factura.numero_factura.like(f"REC-{grupo_id}-%")).all()
-    predio = Predio.query.get(predio_id)
+def imprimir_recibo(pago_id):
+    # El recibo y sus facturas se buscan por llave (pago_id), con la lectura de cada una
+    pago = Pago.query.get_or_404(pago_id)
+    facturas = Factura.query.filter_by(pago_id=pago.id).options(joinedload(Factura.lectura)).order_by(
+        Factura.lectura_id
+    ).all()
     config = Configuracion.query.first()
     
-    total_pagado = sum(f.total_a_pagar for f in facturas)
-    
     return render_template('recibo_pago.html', 
+                           pago=pago,
                            facturas=facturas, 
-                           predio=predio, 
+                           predio=pago.predio, 
                            config=config, 
-                           total_pagado=total_pagado,
-                           fecha_pago=facturas[0].fecha_pago,
-                           grupo_id=grupo_id)
+                           total_pagado=pago.total,
+                           fecha_pago=pago.fecha)
 
 @app.route('/dashboard')
 @login_required
+@solo_lectura
 def dashboard():
-    ahora = datetime.now(timezone.utc)
-    
-    # --- ESTADÍSTICAS DE CARTERA ---
-    total_cuentas = Predio.query.count()
-    
-    # Cuentas al día: Aquellas que no tienen lecturas sin factura pagada
-    # (Usamos una subconsulta para encontrar predios con deuda)
-    subquery_deuda = db.session.query(Lectura.predio_id).outerjoin(Factura).filter(
-        db.or_(Factura.id == None, Factura.estado != 'Pagado')
-    ).subquery()
-    
-    cuentas_mora = Predio.query.filter(Predio.id.in_(subquery_deuda)).count()
-    cuentas_al_dia = total_cuentas - cuentas_mora
-
-    # --- RECAUDO DEL MES ACTUAL ---
-    recaudo_mes = db.session.query(db.func.sum(Factura.total_a_pagar)).filter(
-        db.func.extract('month', Factura.fecha_pago) == ahora.month,
-        db.func.extract('year', Factura.fecha_pago) == ahora.year,
-        Factura.estado == 'Pagado'
-    ).scalar() or 0
+    # --- ESTADÍSTICAS DE CARTERA Y RECAUDO ---
+    # Salen del resumen precalculado (cartera.py): unas pocas filas por sector, sin
+    # recorrer lecturas ni facturas, y con caché de algunos segundos entre visitas.
+    cartera = resumen_cartera()
 
     # --- DATOS PARA GRÁFICA DE CONSUMO (Últimos 6 meses) ---
+    # Del consumo agregado por periodo y sector, agrupando por año Y mes
     consumo_data = db.session.query(
-        Lectura.mes, 
-        db.func.sum(Lectura.consumo_mes)
-    ).group_by(Lectura.mes).order_by(Lectura.mes.desc()).limit(6).all()
+        ConsumoSector.anio,
+        ConsumoSector.mes,
+        db.func.sum(ConsumoSector.total)
+    ).group_by(ConsumoSector.anio, ConsumoSector.mes).order_by(
+        ConsumoSector.anio.desc(), ConsumoSector.mes.desc()
+    ).limit(6).all()
     
     # Invertimos para que el orden sea cronológico
-    meses_labels = [f"Mes {d[0]}" for d in consumo_data][::-1]
-    consumos_values = [d[1] for d in consumo_data][::-1]
+    meses_labels = [f"{d[1]:02d}/{d[0]}" for d in consumo_data][::-1]
+    consumos_values = [d[2] for d in consumo_data][::-1]
 
     return render_template('dashboard.html', 
-                           al_dia=cuentas_al_dia, 
-                           mora=cuentas_mora, 
-                           recaudo=recaudo_mes,
+                           al_dia=cartera['al_dia'], 
+                           mora=cartera['mora'], 
+                           recaudo=cartera['recaudo_mes'],
+                           sectores=cartera['sectores'],
                            meses=meses_labels,
                            consumos=consumos_values)
 
+# --- COMANDOS DE MANTENIMIENTO ---
+@app.cli.command('preparar-base')
+def preparar_base_cmd():
+    """Crea las tablas, el índice de búsqueda y la primera versión de tarifas si faltan."""
+    preparar_base()
+    print("Base de datos lista.")
+
+@app.cli.command('recalcular-estadisticas')
+def recalcular_estadisticas_cmd():
+    """Reconstruye la línea base de consumo de todos los predios."""
+    total = recalcular_todo()
+    print(f"Estadísticas de consumo recalculadas para {total} predios.")
+
+@app.cli.command('recalcular-cartera')
+def recalcular_cartera_cmd():
+    """Reconstruye el resumen de cartera y recaudo que muestra el dashboard."""
+    total = recalcular_cartera()
+    print(f"Cartera recalculada para {total} predios.")
+
+@app.cli.command('recalcular-consumo-sectores')
+def recalcular_consumo_sectores_cmd():
+    """Reconstruye el consumo agregado por periodo y sector."""
+    total = recalcular_consumo_sectores()
+    print(f"Consumo por sector recalculado para {total} periodos.")
+
+@app.cli.command('recalcular-saldos')
+def recalcular_saldos_cmd():
+    """Reconstruye el estado de cuenta y el saldo de todos los predios."""
+    total = recalcular_saldos()
+    print(f"Saldos recalculados para {total} predios.")
+
+@app.cli.command('facturar-periodo')
+@click.argument('anio', type=int)
+@click.argument('mes', type=int)
+def facturar_periodo_cmd(anio, mes):
+    """Factura las lecturas del periodo que todavía no tengan factura. Se puede repetir sin duplicar."""
+    try:
+        creadas = facturar_periodo(anio, mes)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    db.session.commit()
+    print(f"{creadas} facturas generadas para {mes}/{anio}.")
+
+@app.cli.command('reindexar-busqueda')
+def reindexar_busqueda_cmd():
+    """Reconstruye el índice de búsqueda de cuentas y socios."""
+    busqueda.reconstruir_indice()
+    print("Índice de búsqueda reconstruido.")
+
+@app.cli.command('medir-hash')
+@click.option('--metodo', multiple=True, help="Métodos a comparar, p. ej. scrypt:16384:8:1 o pbkdf2:sha256:600000")
+@click.option('--repeticiones', default=5)
+def medir_hash_cmd(metodo, repeticiones):
+    """Mide cuánto tarda verificar una contraseña con cada método de hash (PASSWORD_HASH_METODO)."""
+    for m in metodo or (app.config['PASSWORD_HASH_METODO'],):
+        hash_ = generate_password_hash('clave-de-prueba', m)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            check_password_hash(hash_, 'clave-de-prueba')
+            tiempos.append(time.perf_counter() - inicio)
+        print(f"{m}: {sorted(tiempos)[len(tiempos) // 2] * 1000:.0f} ms por inicio de sesión")
+
+@app.cli.command('verificar-planes')
+def verificar_planes_cmd():
+    """Falla si alguna consulta frecuente recorre una tabla completa (EXPLAIN QUERY PLAN)."""
+    if db.engine.dialect.name != 'sqlite':
+        print("La verificación de planes solo está disponible con SQLite.")
+        return
+
+    fallidas = 0
+    for nombre, (detalle, tablas) in planes.verificar().items():
+        print(f"{'FALLA' if tablas else 'OK':5} {nombre}: {' | '.join(detalle)}")
+        fallidas += bool(tablas)
+    if fallidas:
+        raise SystemExit(f"{fallidas} consulta(s) sin índice.")
+
+@app.cli.command('seed')
+@click.option('--socios', default=300, show_default=True, help="Socios a crear, cada uno con un predio")
+@click.option('--meses', default=24, show_default=True, help="Meses de lecturas y facturas antes del actual")
+@click.option('--proporcion-pago', default=0.85, show_default=True,
+              help="Probabilidad de que un socio pague lo pendiente cada mes (0 a 1)")
+@click.option('--sectores', help="Sectores con su peso, p. ej. 'Centro:4,Sector Alto:3,Sector Bajo:3'")
+@click.option('--semilla', type=int, help="Semilla del generador; la misma semilla produce los mismos datos")
+def seed_cmd(socios, meses, proporcion_pago, sectores, semilla):
+    """Llena una base vacía con datos de prueba: socios, predios, lecturas, facturas y pagos."""
+    if not 0 <= proporcion_pago <= 1:
+        raise SystemExit("--proporcion-pago debe estar entre 0 y 1.")
+    preparar_base()
+    inicio = time.perf_counter()
+    try:
+        creados = semillas.generar(socios, meses, proporcion_pago,
+                                   semillas.interpretar_sectores(sectores) if sectores else None, semilla)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"{creados['socios']} socios y predios, {creados['lecturas']} lecturas, {creados['facturas']} facturas, "
+          f"{creados['pagos']} pagos y {creados['movimientos']} movimientos en {time.perf_counter() - inicio:.1f} s.")
+
+# --- MÉTRICAS ---
+@app.route('/metrics')
+@login_required
+@roles_requeridos('admin')
+def metricas_prometheus():
+    # Formato de texto de Prometheus; son las de este proceso (ver metricas.py)
+    return Response(metricas.exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# --- TRABAJOS EN SEGUNDO PLANO ---
+@app.route('/trabajos/<int:id>')
+@login_required
+def ver_trabajo(id):
+    trabajo = Trabajo.query.get_or_404(id)
+    return render_template('trabajo.html', trabajo=trabajo)
+
+@app.route('/trabajos/<int:id>/estado')
+@login_required
+def estado_trabajo(id):
+    trabajo = Trabajo.query.get_or_404(id)
+    errores = []
+    if trabajo.carga_id:
+        errores = [e.mensaje for e in ErrorCarga.query.filter_by(carga_id=trabajo.carga_id)
+                   .order_by(ErrorCarga.fila).limit(20)]
+    return jsonify(trabajos.estado_json(trabajo, errores))
+
 if __name__ == '__main__':
     app.run(debug=True)
 
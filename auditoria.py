@@ -0,0 +1,129 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+from flask import g, has_request_context
+from models import db, AuditoriaLog
+from sqlalchemy import event, insert
+from basedatos import SesionAcueducto
+
+# --- BITÁCORA DE AUDITORÍA ---
+# registrar() solo pone el evento en una cola en memoria; un hilo del proceso lo escribe
+# junto con los demás cada INTERVALO segundos (o al juntar LOTE eventos) en un solo insert.
+# Así auditar no agrega ni una escritura ni un commit a la petición que hizo el cambio.
+# Si el proceso muere de golpe se pueden perder los eventos del último intervalo.
+INTERVALO = 1.0
+LOTE = 500
+
+_cola = queue.Queue()
+_app = None
+_hilo = None
+_pid = None
+_candado = threading.Lock()
+
+
+def iniciar(app):
+    global _app
+    _app = app
+    atexit.register(vaciar)
+
+
+def registrar(accion, usuario_id=None, ruta=None):
+    _cola.put({
+        'usuario_id': usuario_id,
+        'accion': accion[:255],
+        'ruta': ruta,
+        'fecha': datetime.now(timezone.utc)
+    })
+    _asegurar_hilo()
+
+
+def _asegurar_hilo():
+    # El hilo se crea con el primer evento de cada proceso (los servidores que hacen
+    # fork después de importar la aplicación no heredan hilos)
+    global _hilo, _pid
+    if _hilo is not None and _pid == os.getpid():
+        return
+    with _candado:
+        if _hilo is None or _pid != os.getpid():
+            _pid = os.getpid()
+            _hilo = threading.Thread(target=_escritor, name='auditoria', daemon=True)
+            _hilo.start()
+
+
+def _tomar_lote(espera):
+    try:
+        eventos = [_cola.get(timeout=espera)]
+    except queue.Empty:
+        return []
+    while len(eventos) < LOTE:
+        try:
+            eventos.append(_cola.get_nowait())
+        except queue.Empty:
+            break
+    return eventos
+
+
+def _escribir(eventos):
+    with _app.app_context():
+        try:
+            db.session.execute(insert(AuditoriaLog), eventos)
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            _app.logger.exception("No se pudieron guardar %d eventos de auditoría", len(eventos))
+            return False
+
+
+def _escritor():
+    pendientes = []
+    while True:
+        pendientes += _tomar_lote(INTERVALO)
+        # Si la base de datos falla, los eventos se reintentan en la siguiente vuelta
+        if pendientes and _escribir(pendientes):
+            pendientes = []
+
+
+# --- ESCRITURAS DE LA PETICIÓN ---
+# Una ruta que no describe lo que hizo con auditar() solo se registra si confirmó alguna
+# escritura: un formulario que vuelve con errores o una redirección por error no cambian nada.
+
+@event.listens_for(SesionAcueducto, 'after_flush')
+def _anotar_cambios(sesion, contexto):
+    sesion.info['escribio'] = True
+
+
+@event.listens_for(SesionAcueducto, 'do_orm_execute')
+def _anotar_sentencia(estado):
+    # Los insert/update masivos (session.execute) no pasan por el flush
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        estado.session.info['escribio'] = True
+
+
+@event.listens_for(SesionAcueducto, 'after_commit')
+def _confirmar_escritura(sesion):
+    if sesion.info.pop('escribio', False) and has_request_context():
+        g.escritura_confirmada = True
+
+
+@event.listens_for(SesionAcueducto, 'after_rollback')
+def _descartar_escritura(sesion):
+    sesion.info.pop('escribio', None)
+
+
+def escritura_confirmada():
+    """Si la petición en curso confirmó (commit) algún cambio en la base de datos."""
+    return g.get('escritura_confirmada', False)
+
+
+def vaciar():
+    """Escribe ya lo que haya en la cola, en el hilo que llama. Para el cierre del proceso y los comandos."""
+    if _app is None:
+        return
+    eventos = _tomar_lote(0)
+    while eventos:
+        _escribir(eventos)
+        eventos = _tomar_lote(0)
@@ -0,0 +1,122 @@
+# Prueba de carga del cobro en el POS: varias cajas cobrando las mismas cuentas a la vez,
+# con dobles clics (misma clave) y cajeros distintos (claves distintas) sobre cada cuenta.
+# Al final verifica que cada mes quedó pagado exactamente una vez.
+#
+#   python benchmarks/bench_cobro.py [--predios 200] [--meses 3] [--hilos 8] [--intentos 4]
+#
+# Usa una base SQLite temporal (DATABASE_URL), nunca la base real.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+carpeta = tempfile.mkdtemp(prefix='bench_cobro_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(carpeta, 'bench.db')
+
+from app import app, preparar_base
+from models import db, Socio, Predio, Lectura, Factura, Pago, Usuario, ConfiguracionTarifa
+from sqlalchemy import func, insert
+import pagos
+
+
+def preparar(n_predios, n_meses):
+    with app.app_context():
+        preparar_base()
+        usuario = Usuario(username='cajero', rol='operador')
+        usuario.set_password('cajero')
+        db.session.add(usuario)
+        db.session.add(ConfiguracionTarifa(cargo_fijo=5000, valor_m3=1200, limite_basico=20,
+                                           valor_m3_extra=2500, fecha_desde=datetime(2000, 1, 1)))
+        db.session.execute(insert(Socio), [
+            {'id': i, 'nombre': f'Socio {i}', 'cedula': str(10000000 + i)} for i in range(1, n_predios + 1)
+        ])
+        db.session.execute(insert(Predio), [
+            {'id': i, 'numero_cuenta': f'B-{i:06d}', 'socio_id': i, 'sector': f'S{i % 5}'}
+            for i in range(1, n_predios + 1)
+        ])
+        db.session.execute(insert(Lectura), [
+            {'predio_id': i, 'anio': 2026, 'mes': m, 'lectura_anterior': 0, 'lectura_actual': 10 * m,
+             'consumo_mes': 10 * m}
+            for i in range(1, n_predios + 1) for m in range(1, n_meses + 1)
+        ])
+        db.session.commit()
+
+        # Lo que cada cajero ve en pantalla antes de cobrar
+        pantallas = {}
+        for predio_id in range(1, n_predios + 1):
+            filas = pagos.pendientes(predio_id)
+            pantallas[predio_id] = ([l.id for l, _, _ in filas], sum(t for _, _, t in filas))
+        return pantallas
+
+
+def cliente():
+    c = app.test_client()
+    c.post('/login', data={'username': 'cajero', 'password': 'cajero'})
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cobro concurrente en el POS')
+    parser.add_argument('--predios', type=int, default=200)
+    parser.add_argument('--meses', type=int, default=3)
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--intentos', type=int, default=4, help='peticiones por cuenta (mitad dobles clics)')
+    args = parser.parse_args()
+
+    pantallas = preparar(args.predios, args.meses)
+
+    # Por cada cuenta: la mitad de los intentos repite la misma clave (doble clic) y la
+    # otra mitad son cajeros distintos que abrieron la misma cuenta al mismo tiempo
+    peticiones = []
+    for predio_id, (lectura_ids, _) in pantallas.items():
+        clave = uuid.uuid4().hex
+        for i in range(args.intentos):
+            peticiones.append((predio_id, lectura_ids, clave if i % 2 == 0 else uuid.uuid4().hex))
+
+    local = threading.local() # Una sesión iniciada (cajero) por hilo
+    def cobrar(peticion):
+        predio_id, lectura_ids, clave = peticion
+        if not hasattr(local, 'cliente'):
+            local.cliente = cliente()
+        c = local.cliente
+        inicio = time.perf_counter()
+        r = c.post('/pos/confirmar-pago', data={'predio_id': predio_id, 'clave': clave, 'lectura_id': lectura_ids})
+        return r.status_code, r.headers.get('Location', ''), time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as ejecutor:
+        resultados = list(ejecutor.map(cobrar, peticiones))
+    duracion = time.perf_counter() - inicio
+
+    with app.app_context():
+        pagos_hechos = Pago.query.count()
+        recaudado = db.session.query(func.sum(Pago.total)).scalar() or 0
+        repetidas = db.session.query(Factura.lectura_id).filter(Factura.estado == 'Pagado').group_by(
+            Factura.lectura_id).having(func.count() > 1).count()
+        sin_pagar = Lectura.query.count() - Factura.query.filter_by(estado='Pagado').count()
+
+    esperado = sum(total for _, total in pantallas.values())
+    errores = sum(1 for estado, _, _ in resultados if estado >= 500)
+    latencias = sorted(t for _, _, t in resultados)
+    print(f"Peticiones: {len(peticiones)}  Hilos: {args.hilos}  Duración: {duracion:.2f} s  "
+          f"({len(peticiones) / duracion:.0f} peticiones/s)")
+    print(f"Latencia p50: {latencias[len(latencias) // 2] * 1000:.1f} ms  "
+          f"p95: {latencias[int(len(latencias) * 0.95)] * 1000:.1f} ms  Errores 5xx: {errores}")
+    print(f"Pagos: {pagos_hechos} (esperados {args.predios})  Recaudo: $ {recaudado:,.0f} (esperado $ {esperado:,.0f})")
+    print(f"Meses pagados dos veces: {repetidas}  Meses sin pagar: {sin_pagar}")
+
+    ok = (pagos_hechos == args.predios and abs(recaudado - esperado) < 1e-6
+          and repetidas == 0 and sin_pagar == 0 and errores == 0)
+    print("OK: cada mes se cobró exactamente una vez" if ok else "FALLA")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Benchmark de la facturación de un periodo completo (INSERT ... SELECT en la base de datos).
+# Verifica que los totales coinciden con el motor de tarifas y que repetirla no crea nada.
+#
+#   python benchmarks/bench_emision.py [--predios 50000]
+#
+# Usa una base SQLite temporal (DATABASE_URL), nunca la base real.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+carpeta = tempfile.mkdtemp(prefix='bench_emision_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(carpeta, 'bench.db')
+
+from app import app, preparar_base
+from models import db, Socio, Predio, Lectura, Factura, ConfiguracionTarifa, CarteraSector
+from sqlalchemy import func, insert
+from facturacion import facturar_periodo, totales_por_periodo
+from cartera import recalcular_cartera
+
+
+def preparar(n_predios, semilla):
+    rng = random.Random(semilla)
+    db.session.add(ConfiguracionTarifa(cargo_fijo=5000, valor_m3=1200, limite_basico=20,
+                                       valor_m3_extra=2500, fecha_desde=datetime(2000, 1, 1)))
+    db.session.execute(insert(Socio), [
+        {'id': i, 'nombre': f'Socio {i}', 'cedula': str(10000000 + i)} for i in range(1, n_predios + 1)
+    ])
+    db.session.execute(insert(Predio), [
+        {'id': i, 'numero_cuenta': f'B-{i:06d}', 'socio_id': i, 'sector': f'S{i % 5}'}
+        for i in range(1, n_predios + 1)
+    ])
+    db.session.execute(insert(Lectura), [
+        {'predio_id': i, 'anio': 2026, 'mes': 1, 'lectura_anterior': 0, 'lectura_actual': c, 'consumo_mes': c}
+        for i, c in ((i, round(rng.lognormvariate(2.7, 0.5), 1)) for i in range(1, n_predios + 1))
+    ])
+    db.session.commit()
+    recalcular_cartera()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Facturación de un periodo completo')
+    parser.add_argument('--predios', type=int, default=50000)
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        preparar_base()
+        preparar(args.predios, args.semilla)
+
+        inicio = time.perf_counter()
+        creadas = facturar_periodo(2026, 1)
+        db.session.commit()
+        duracion = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        repetidas = facturar_periodo(2026, 1)
+        db.session.commit()
+        duracion_repetida = time.perf_counter() - inicio
+
+        lecturas = Lectura.query.order_by(Lectura.id).all()
+        esperados = dict(zip((l.id for l in lecturas), totales_por_periodo(lecturas)))
+        distintos = sum(1 for lectura_id, total in db.session.query(Factura.lectura_id, Factura.total_a_pagar)
+                        if abs(esperados[lectura_id] - total) > 1e-6)
+        saldo_cartera = db.session.query(func.sum(CarteraSector.saldo_pendiente)).scalar() or 0
+
+    print(f"Predios: {args.predios}  Facturas: {creadas}  Duración: {duracion:.2f} s  "
+          f"({creadas / duracion:.0f} facturas/s)")
+    print(f"Repetición: {repetidas} facturas nuevas en {duracion_repetida:.2f} s")
+    print(f"Totales distintos al motor de tarifas: {distintos}  "
+          f"Cartera: $ {saldo_cartera:,.0f} (esperado $ {sum(esperados.values()):,.0f})")
+
+    ok = (creadas == args.predios and repetidas == 0 and distintos == 0
+          and abs(saldo_cartera - sum(esperados.values())) < 1e-3)
+    print("OK" if ok else "FALLA")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# Benchmark del motor de tarifas: factura un periodo completo de lecturas sintéticas.
+#
+#   python benchmarks/bench_facturacion.py [--lecturas 50000] [--repeticiones 5]
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import facturacion
+from facturacion import calcular_cobro, calcular_totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del motor de tarifas')
+    parser.add_argument('--lecturas', type=int, default=50000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    tarifa = SimpleNamespace(cargo_fijo=5000.0, valor_m3=1200.0, limite_basico=20, valor_m3_exceso=2500.0)
+    rng = random.Random(args.semilla)
+    # Consumos residenciales: la mayoría bajo el límite básico, con una cola de consumos altos
+    consumos = [round(rng.lognormvariate(2.7, 0.5), 1) for _ in range(args.lecturas)]
+
+    tiempos = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        totales = calcular_totales(consumos, tarifa)
+        tiempos.append(time.perf_counter() - inicio)
+
+    # El cálculo por lotes debe coincidir con el cálculo individual
+    for consumo, total in zip(consumos[:1000], totales):
+        assert abs(calcular_cobro(consumo, tarifa)['total'] - total) < 1e-6
+
+    motor = 'numpy' if facturacion.np is not None else 'python'
+    print(f"Lecturas: {args.lecturas}  Motor: {motor}")
+    print(f"Mejor: {min(tiempos) * 1000:.1f} ms  Peor: {max(tiempos) * 1000:.1f} ms")
+    print(f"Recaudo esperado: $ {sum(totales):,.0f}")
+
+
+if __name__ == '__main__':
+    main()
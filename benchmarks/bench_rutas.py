@@ -0,0 +1,272 @@
+# Suite de rendimiento de las rutas calientes sobre datos sintéticos grandes.
+#
+#   python benchmarks/bench_rutas.py [--escalas 1000 10000 100000] [--meses 24] [--repeticiones 5]
+#                                    [--datos DIR] [--salida resultados.json]
+#   python benchmarks/bench_rutas.py --comparar antes.json despues.json [--tolerancia 0.2]
+#
+# Cada escala construye (o reutiliza desde --datos) una base SQLite con N predios y sus
+# últimos --meses meses de lecturas y facturas, generada con una semilla fija, y mide en ese
+# orden: dashboard, búsqueda del POS, carga masiva del mes actual, auditoría de consumos,
+# vista previa de facturación, generación de facturas y cobro en el POS. Cada escala corre
+# en su propio proceso para que las cachés de una no ayuden a la siguiente. La carga masiva y
+# la generación de facturas cambian los datos, así que se miden una sola vez por escala.
+#
+# Con --comparar se marcan como regresión las rutas cuya mediana empeoró más que la
+# tolerancia (y más de --minimo-ms); el proceso termina con código 1 si hay alguna.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+# --- DATOS SINTÉTICOS ---
+
+def construir_datos(n_predios, meses, semilla):
+    """Llena la base vacía de la aplicación con los datos de 'flask seed' y un usuario administrador."""
+    from app import app, preparar_base
+    from models import db, Usuario
+    import semillas
+
+    with app.app_context():
+        preparar_base()
+        usuario = Usuario(username='bench', rol='admin')
+        usuario.set_password('bench')
+        db.session.add(usuario)
+        db.session.commit()
+        semillas.generar(n_predios, meses, semilla=semilla)
+        db.session.execute(db.text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        db.session.commit()
+
+
+# --- MEDICIÓN ---
+
+def _resumen(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        'n': len(ordenados),
+        'min_ms': round(ordenados[0] * 1000, 2),
+        'p50_ms': round(ordenados[len(ordenados) // 2] * 1000, 2),
+        'p95_ms': round(ordenados[min(int(len(ordenados) * 0.95), len(ordenados) - 1)] * 1000, 2),
+        'max_ms': round(ordenados[-1] * 1000, 2)
+    }
+
+
+def _cronometrar(funcion, veces):
+    tiempos = []
+    for i in range(veces):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append(time.perf_counter() - inicio)
+    return _resumen(tiempos)
+
+
+def _esperar_trabajo(cliente, respuesta):
+    # Las cargas y la facturación corren en segundo plano: se mide hasta que el trabajo termina
+    trabajo_id = int(respuesta.headers['Location'].rstrip('/').split('/')[-1])
+    while True:
+        estado = cliente.get(f'/trabajos/{trabajo_id}/estado').get_json()
+        if estado['terminado']:
+            if estado['estado'] != 'Completado':
+                raise RuntimeError(f"El trabajo {trabajo_id} terminó como {estado['estado']}: {estado['mensaje']}")
+            return estado
+        time.sleep(0.02)
+
+
+def medir_escala(n_predios, repeticiones, semilla):
+    from app import app
+    from models import db, Predio, Lectura
+    from sqlalchemy import func
+    import pagos
+
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'bench', 'password': 'bench'})
+    rng = random.Random(semilla + 1)
+
+    def comprobar(respuesta, esperado=200):
+        if respuesta.status_code != esperado:
+            raise RuntimeError(f"{respuesta.request.path}: respuesta {respuesta.status_code}")
+        return respuesta
+
+    rutas = {}
+    rutas['dashboard'] = _cronometrar(lambda i: comprobar(cliente.get('/dashboard')), repeticiones)
+
+    cuentas = [f"CTA-{rng.randint(1, n_predios):06d}" for _ in range(repeticiones)]
+    rutas['modulo_pos_busqueda'] = _cronometrar(
+        lambda i: comprobar(cliente.get('/pos', query_string={'search': cuentas[i]})), repeticiones
+    )
+
+    # Carga masiva de la lectura del mes actual para todos los predios
+    with app.app_context():
+        ultimas = db.session.query(Lectura.predio_id, func.max(Lectura.lectura_actual)).group_by(Lectura.predio_id)
+        filas = [f"CTA-{predio_id:06d},{actual + round(rng.lognormvariate(2.7, 0.5), 1)}" for predio_id, actual in ultimas]
+    archivo = ("numero_cuenta,lectura_actual\n" + "\n".join(filas) + "\n").encode()
+
+    def carga(i):
+        from io import BytesIO
+        respuesta = comprobar(cliente.post('/lectura/carga-masiva', content_type='multipart/form-data',
+                                           data={'archivo_csv': (BytesIO(archivo), 'lecturas.csv')}), 302)
+        _esperar_trabajo(cliente, respuesta)
+    rutas['carga_masiva'] = _cronometrar(carga, 1)
+
+    rutas['auditoria_consumos'] = _cronometrar(lambda i: comprobar(cliente.get('/auditoria/consumos')), repeticiones)
+    rutas['vista_previa_facturacion'] = _cronometrar(
+        lambda i: comprobar(cliente.get('/facturacion/vista-previa')), repeticiones
+    )
+    rutas['generar_periodo'] = _cronometrar(
+        lambda i: _esperar_trabajo(cliente, comprobar(cliente.post('/facturacion/generar-periodo'), 302)), 1
+    )
+
+    # Cobro de predios distintos, con los meses que el cajero vería en pantalla
+    with app.app_context():
+        elegidos = rng.sample(range(1, n_predios + 1), min(repeticiones, n_predios))
+        cobros = [(predio_id, [l.id for l, _, _ in pagos.pendientes(predio_id)]) for predio_id in elegidos]
+
+    def cobrar(i):
+        predio_id, lectura_ids = cobros[i]
+        comprobar(cliente.post('/pos/confirmar-pago', data={'predio_id': predio_id, 'lectura_id': lectura_ids,
+                                                            'clave': f"bench-{i}"}), 302)
+    rutas['confirmar_pago'] = _cronometrar(cobrar, len(cobros))
+
+    with app.app_context():
+        conteo = {'predios': Predio.query.count(), 'lecturas': Lectura.query.count()}
+    return {'datos': conteo, 'rutas': rutas}
+
+
+def correr_escala(args):
+    # Proceso hijo: prepara la base de la escala y deja el resultado en --resultado-escala
+    from semillas import periodos_anteriores
+    anio, mes = periodos_anteriores(1)[0]
+    nombre = f"predios-{args.escala}-meses-{args.meses}-semilla-{args.semilla}-hasta-{anio}{mes:02d}.db"
+    carpeta = tempfile.mkdtemp(prefix='bench_rutas_')
+    base = os.path.join(carpeta, 'bench.db')
+    guardada = os.path.join(args.datos, nombre) if args.datos else None
+
+    inicio = time.perf_counter()
+    if guardada and os.path.exists(guardada):
+        shutil.copy(guardada, base)
+        os.environ['DATABASE_URL'] = 'sqlite:///' + base
+        reutilizada = True
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + base
+        construir_datos(args.escala, args.meses, args.semilla)
+        if guardada:
+            os.makedirs(args.datos, exist_ok=True)
+            shutil.copy(base, guardada)
+        reutilizada = False
+    preparacion = time.perf_counter() - inicio
+
+    resultado = medir_escala(args.escala, args.repeticiones, args.semilla)
+    resultado.update({'preparacion_s': round(preparacion, 2), 'datos_reutilizados': reutilizada})
+    with open(args.resultado_escala, 'w') as f:
+        json.dump(resultado, f)
+    shutil.rmtree(carpeta, ignore_errors=True)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def correr(args):
+    resultado = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'meses': args.meses,
+        'repeticiones': args.repeticiones,
+        'semilla': args.semilla,
+        'escalas': {}
+    }
+    for escala in args.escalas:
+        print(f"Escala {escala} predios...", flush=True)
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp:
+            parcial = tmp.name
+        comando = [sys.executable, os.path.abspath(__file__), '--escala', str(escala), '--meses', str(args.meses),
+                   '--repeticiones', str(args.repeticiones), '--semilla', str(args.semilla),
+                   '--resultado-escala', parcial]
+        if args.datos:
+            comando += ['--datos', args.datos]
+        subprocess.run(comando, check=True)
+        with open(parcial) as f:
+            resultado['escalas'][str(escala)] = json.load(f)
+        os.remove(parcial)
+
+        for ruta, medida in resultado['escalas'][str(escala)]['rutas'].items():
+            print(f"  {ruta:26} p50 {medida['p50_ms']:10.1f} ms   max {medida['max_ms']:10.1f} ms   (n={medida['n']})")
+
+    with open(args.salida, 'w') as f:
+        json.dump(resultado, f, indent=2)
+    print(f"Resultados en {args.salida}")
+
+
+# --- COMPARACIÓN ---
+
+def comparar(ruta_base, ruta_nueva, tolerancia, minimo_ms):
+    with open(ruta_base) as f:
+        base = json.load(f)
+    with open(ruta_nueva) as f:
+        nueva = json.load(f)
+    print(f"Base: {base.get('commit') or '?'} ({base['fecha']})   Nueva: {nueva.get('commit') or '?'} ({nueva['fecha']})")
+
+    regresiones = 0
+    for escala in sorted(set(base['escalas']) & set(nueva['escalas']), key=int):
+        print(f"Escala {escala} predios")
+        rutas_base = base['escalas'][escala]['rutas']
+        rutas_nueva = nueva['escalas'][escala]['rutas']
+        for ruta in rutas_base:
+            if ruta not in rutas_nueva:
+                continue
+            antes, despues = rutas_base[ruta]['p50_ms'], rutas_nueva[ruta]['p50_ms']
+            cambio = (despues - antes) / antes if antes else 0.0
+            if cambio > tolerancia and despues - antes > minimo_ms:
+                marca = 'REGRESIÓN'
+                regresiones += 1
+            elif cambio < -tolerancia and antes - despues > minimo_ms:
+                marca = 'mejora'
+            else:
+                marca = 'igual'
+            print(f"  {ruta:26} {antes:10.1f} -> {despues:10.1f} ms  {cambio:+7.1%}  {marca}")
+
+    print(f"{regresiones} regresión(es) con tolerancia {tolerancia:.0%}" if regresiones else "Sin regresiones")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rendimiento de las rutas calientes con datos sintéticos')
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--meses', type=int, default=24)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--datos', help='carpeta donde guardar y reutilizar las bases generadas')
+    parser.add_argument('--salida', default='bench_rutas.json')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVA'))
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='empeoramiento relativo admitido (0.2 = 20%%)')
+    parser.add_argument('--minimo-ms', type=float, default=5.0, help='diferencia absoluta mínima para marcar un cambio')
+    parser.add_argument('--escala', type=int, help=argparse.SUPPRESS) # Uso interno: una escala en este proceso
+    parser.add_argument('--resultado-escala', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.comparar:
+        sys.exit(1 if comparar(*args.comparar, args.tolerancia, args.minimo_ms) else 0)
+    if args.escala:
+        correr_escala(args)
+    else:
+        correr(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import re
+import unicodedata
+
+from models import db, Socio, Predio
+from sqlalchemy import text
+
+# Índice de búsqueda con SQLite FTS5, en dos tablas: una fila por predio (rowid = predio.id)
+# con su cuenta, medidor y los datos del dueño, y una fila por socio (rowid = socio.id) para
+# los selectores de dueño. Los triggers las mantienen al día aunque se inserte en bloque.
+# El tokenizador quita tildes, así "Peña" y "pena" encuentran lo mismo.
+
+_OPCIONES = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'"
+
+TABLAS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_predios USING fts5("
+    f"socio_id UNINDEXED, numero_cuenta, cedula, serial_medidor, nombre, {_OPCIONES})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS busqueda_socios USING fts5(cedula, nombre, {_OPCIONES})",
+]
+
+_FILA_SOCIO = """
+    INSERT INTO busqueda_socios(rowid, cedula, nombre) VALUES (new.id, new.cedula, new.nombre);
+"""
+_FILAS_PREDIO = """
+    INSERT INTO busqueda_predios(rowid, socio_id, numero_cuenta, cedula, serial_medidor, nombre)
+    SELECT p.id, s.id, p.numero_cuenta, s.cedula, coalesce(p.serial_medidor, ''), s.nombre
+    FROM predios p JOIN socios s ON s.id = p.socio_id WHERE {filtro};
+"""
+
+TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS busqueda_socio_ai AFTER INSERT ON socios BEGIN" + _FILA_SOCIO + "END",
+    "CREATE TRIGGER IF NOT EXISTS busqueda_socio_au AFTER UPDATE OF cedula, nombre ON socios BEGIN"
+    " DELETE FROM busqueda_socios WHERE rowid = old.id;"
+    " DELETE FROM busqueda_predios WHERE rowid IN (SELECT id FROM predios WHERE socio_id = old.id);"
+    + _FILA_SOCIO + _FILAS_PREDIO.format(filtro="p.socio_id = new.id") + "END",
+    "CREATE TRIGGER IF NOT EXISTS busqueda_socio_ad AFTER DELETE ON socios BEGIN"
+    " DELETE FROM busqueda_socios WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS busqueda_predio_ai AFTER INSERT ON predios BEGIN"
+    + _FILAS_PREDIO.format(filtro="p.id = new.id") + "END",
+    # Solo las columnas indexadas: el saldo del predio cambia con cada lectura y cada pago
+    "CREATE TRIGGER IF NOT EXISTS busqueda_predio_au AFTER UPDATE OF numero_cuenta, serial_medidor, socio_id ON predios BEGIN"
+    " DELETE FROM busqueda_predios WHERE rowid = old.id;"
+    + _FILAS_PREDIO.format(filtro="p.id = new.id") + "END",
+    "CREATE TRIGGER IF NOT EXISTS busqueda_predio_ad AFTER DELETE ON predios BEGIN"
+    " DELETE FROM busqueda_predios WHERE rowid = old.id; END",
+]
+
+# Pesos de bm25 por columna: cuenta y cédula pesan más que el medidor, y este más que el nombre
+PESOS = {'predio': "0, 10.0, 10.0, 5.0, 1.0", 'socio': "10.0, 1.0"}
+
+
+def disponible():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def crear_indice():
+    # Crea las tablas y los triggers si faltan; la primera vez los llena con lo que ya existe
+    if not disponible():
+        return
+    existia = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busqueda_predios'"
+    )).first()
+    for sql in TABLAS:
+        db.session.execute(text(sql))
+    # Los triggers se recrean siempre, así una base existente recibe la definición actual
+    for sql in TRIGGERS:
+        db.session.execute(text("DROP TRIGGER IF EXISTS " + re.search(r'EXISTS (\w+)', sql).group(1)))
+        db.session.execute(text(sql))
+    db.session.commit()
+    if not existia:
+        reconstruir_indice()
+
+
+def reconstruir_indice():
+    db.session.execute(text("DELETE FROM busqueda_socios"))
+    db.session.execute(text("DELETE FROM busqueda_predios"))
+    db.session.execute(text(
+        "INSERT INTO busqueda_socios(rowid, cedula, nombre) SELECT id, cedula, nombre FROM socios"
+    ))
+    db.session.execute(text(_FILAS_PREDIO.format(filtro="1 = 1")))
+    db.session.commit()
+
+
+def normalizar(texto):
+    # Minúsculas y sin tildes, igual que el tokenizador del índice
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _consulta_fts(termino):
+    # Cada palabra se busca por prefijo y todas deben aparecer: "juan pe" -> "juan"* "pe"*
+    palabras = re.findall(r'[\w-]+', normalizar(termino))
+    return ' '.join(f'"{p}"*' for p in palabras)
+
+
+def buscar(termino, tipo='predio', limite=10):
+    """Resultados ordenados por relevancia: [{tipo, socio_id, predio_id, numero_cuenta, ...}]."""
+    if not termino.strip():
+        return []
+
+    if not disponible():
+        return _buscar_sin_indice(termino, tipo, limite)
+
+    consulta = _consulta_fts(termino)
+    if not consulta:
+        return []
+
+    if tipo == 'socio':
+        columnas = "'socio' AS tipo, rowid AS socio_id, NULL AS predio_id, '' AS numero_cuenta, cedula, '' AS serial_medidor, nombre"
+    else:
+        columnas = "'predio' AS tipo, socio_id, rowid AS predio_id, numero_cuenta, cedula, serial_medidor, nombre"
+    tabla = 'busqueda_socios' if tipo == 'socio' else 'busqueda_predios'
+
+    # Todas las coincidencias se ordenan por relevancia en la misma consulta: cortar antes
+    # dejaría por fuera la mejor si llegó después en el orden de rowid
+    filas = db.session.execute(text(
+        f"SELECT {columnas} FROM {tabla} WHERE {tabla} MATCH :q"
+        f" ORDER BY bm25({tabla}, {PESOS[tipo]}) LIMIT :limite"
+    ), {'q': consulta, 'limite': limite}).mappings().all()
+    return [dict(f) for f in filas]
+
+
+def _buscar_sin_indice(termino, tipo, limite):
+    # Respaldo para motores sin FTS5: prefijo en los campos exactos y nombre que contenga
+    termino = termino.strip()
+    if tipo == 'socio':
+        filas = Socio.query.filter(db.or_(
+            Socio.cedula.startswith(termino), Socio.nombre.ilike(f"%{termino}%")
+        )).order_by(Socio.nombre).limit(limite).all()
+        return [{'tipo': 'socio', 'socio_id': s.id, 'predio_id': None, 'numero_cuenta': '',
+                 'cedula': s.cedula, 'serial_medidor': '', 'nombre': s.nombre} for s in filas]
+
+    filas = db.session.query(Predio, Socio).join(Socio, Predio.socio_id == Socio.id).filter(db.or_(
+        Predio.numero_cuenta.startswith(termino),
+        Predio.serial_medidor.startswith(termino),
+        Socio.cedula.startswith(termino),
+        Socio.nombre.ilike(f"%{termino}%")
+    )).order_by(Predio.numero_cuenta).limit(limite).all()
+    return [{'tipo': 'predio', 'socio_id': s.id, 'predio_id': p.id, 'numero_cuenta': p.numero_cuenta,
+             'cedula': s.cedula, 'serial_medidor': p.serial_medidor or '', 'nombre': s.nombre}
+            for p, s in filas]
@@ -0,0 +1,291 @@
+import csv
+import hashlib
+import os
+import re
+from io import TextIOWrapper
+from itertools import islice
+
+from models import db, Socio, Predio, Lectura, CargaMasiva, ErrorCarga
+from sqlalchemy import Integer, func, insert, literal, select, update
+from estadisticas import actualizar_estadisticas, actualizar_consumo_sectores, claves_de_periodo
+from cartera import actualizar_cartera
+from saldos import cargar_lecturas
+import metricas
+
+# Cantidad de filas que se resuelven e insertan por cada viaje a la base de datos.
+# SQLite limita el número de parámetros por consulta, así que no conviene subirlo mucho.
+TAMANO_LOTE = 500
+
+
+def partir_en_lotes(filas, tamano=TAMANO_LOTE):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- LECTURA DEL ARCHIVO ---
+
+def huella_archivo(stream, *contexto):
+    # Recorre el archivo por bloques (memoria constante) y vuelve al inicio
+    h = hashlib.sha256()
+    for dato in contexto:
+        h.update(f"{dato}|".encode())
+    for bloque in iter(lambda: stream.read(64 * 1024), b''):
+        h.update(bloque)
+    stream.seek(0)
+    return h.hexdigest()
+
+
+def leer_csv(stream):
+    # Decodifica el archivo a medida que se lee, sin cargarlo completo en memoria
+    return csv.DictReader(TextIOWrapper(stream, encoding='utf-8', newline=''))
+
+
+# --- SEGUIMIENTO DE LA CARGA ---
+
+def abrir_carga(tipo, nombre_archivo, huella, usuario_id):
+    """Devuelve (carga, retomada). Si el mismo archivo quedó interrumpido, se retoma.
+
+    Lanza ValueError si ese mismo archivo se está cargando en otro trabajo.
+    """
+    # Solo se retoma lo marcado como interrumpido (trabajos.py), nunca una carga que sigue
+    # corriendo. Reclamo atómico: si dos trabajos intentan retomarla a la vez, uno la obtiene.
+    interrumpida = CargaMasiva.query.filter_by(tipo=tipo, huella=huella, estado='Interrumpida').order_by(
+        CargaMasiva.id.desc()
+    ).first()
+    if interrumpida:
+        tomada = db.session.execute(update(CargaMasiva).where(
+            CargaMasiva.id == interrumpida.id, CargaMasiva.estado == 'Interrumpida'
+        ).values(estado='En proceso').execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if tomada:
+            return interrumpida, True
+
+    # La carga nueva se crea solo si no hay otra del mismo archivo en curso, en una sola sentencia
+    en_curso = select(CargaMasiva.id).where(
+        CargaMasiva.tipo == tipo, CargaMasiva.huella == huella, CargaMasiva.estado == 'En proceso'
+    ).exists()
+    carga_id = db.session.execute(insert(CargaMasiva).from_select(
+        ['tipo', 'nombre_archivo', 'huella', 'usuario_id'],
+        select(literal(tipo), literal(nombre_archivo), literal(huella), literal(usuario_id, Integer)).where(~en_curso)
+    ).returning(CargaMasiva.id)).scalar()
+    db.session.commit()
+    if carga_id is None:
+        raise ValueError("Este archivo ya se está cargando en otro trabajo. Espere a que termine.")
+    return db.session.get(CargaMasiva, carga_id), False
+
+
+def ejecutar_carga(carga, lector, procesar_lote, tamano_lote=TAMANO_LOTE, avance=None):
+    # Cada lote se confirma por separado junto con el avance de la carga, así una
+    # interrupción solo pierde el lote en curso y un error no tumba las filas anteriores.
+    filas = islice(enumerate(lector, start=1), carga.filas_procesadas, None)
+
+    for lote in partir_en_lotes(filas, tamano_lote):
+        desde, hasta = lote[0][0], lote[-1][0]
+        try:
+            exitos, errores = procesar_lote(lote)
+        except Exception as e:
+            db.session.rollback()
+            exitos = 0
+            errores = [(desde, f"Filas {desde}-{hasta} descartadas: {str(e)[:180]}")]
+
+        if errores:
+            db.session.execute(insert(ErrorCarga), [
+                {'carga_id': carga.id, 'fila': fila, 'mensaje': mensaje} for fila, mensaje in errores
+            ])
+        carga.filas_procesadas = hasta
+        carga.exitos += exitos
+        carga.total_errores += len(errores)
+        if avance:
+            avance(carga)
+        db.session.commit()
+
+    carga.estado = 'Completada'
+    db.session.commit()
+    return carga
+
+
+def procesar_archivo(trabajo, tipo, ruta, nombre_archivo, tamano_lote, mes=None, anio=None):
+    # Punto de entrada del trabajo en segundo plano (ver trabajos.py). El archivo subido
+    # se guardó en disco durante la petición y se borra al terminar, haya error o no.
+    if tipo == 'lecturas':
+        contexto = (tipo, mes, anio)
+        procesar_lote = lambda lote: procesar_lote_lecturas(lote, mes, anio)
+    else:
+        contexto = (tipo,)
+        procesar_lote = procesar_lote_socios
+
+    def avance(carga):
+        trabajo.procesados = carga.filas_procesadas
+        trabajo.exitos = carga.exitos
+        trabajo.errores = carga.total_errores
+
+    try:
+        with open(ruta, 'rb') as f:
+            huella = huella_archivo(f, *contexto)
+            trabajo.total = max(sum(1 for _ in f) - 1, 0) # Sin contar el encabezado
+            f.seek(0)
+
+            carga, retomada = abrir_carga(tipo, nombre_archivo, huella, trabajo.usuario_id)
+            trabajo.carga_id = carga.id
+            if retomada:
+                trabajo.mensaje = f"Se retomó una carga interrumpida desde la fila {carga.filas_procesadas + 1}."
+            avance(carga)
+            db.session.commit()
+
+            ejecutar_carga(carga, leer_csv(f), procesar_lote, tamano_lote, avance)
+    finally:
+        os.remove(ruta)
+
+    if tipo == 'lecturas':
+        # El consumo por sector se recalcula una sola vez al final y no en cada lote:
+        # cada periodo/sector se recorre completo para obtener los percentiles
+        actualizar_consumo_sectores(claves_de_periodo(anio, mes))
+        db.session.commit()
+
+
+# --- LECTURAS ---
+
+def _predios_por_cuenta(cuentas):
+    # Una sola consulta para todas las cuentas del lote: {numero_cuenta: predio_id}
+    filas = db.session.query(Predio.numero_cuenta, Predio.id).filter(
+        Predio.numero_cuenta.in_(cuentas)
+    ).all()
+    return dict(filas)
+
+
+def _ultimas_lecturas(predio_ids):
+    # Una sola consulta para la última lectura (id más alto) de cada predio del lote
+    ultimas = db.session.query(
+        Lectura.predio_id,
+        func.max(Lectura.id).label('max_id')
+    ).filter(Lectura.predio_id.in_(predio_ids)).group_by(Lectura.predio_id).subquery()
+
+    filas = db.session.query(Lectura.predio_id, Lectura.lectura_actual).join(
+        ultimas, Lectura.id == ultimas.c.max_id
+    ).all()
+    return dict(filas)
+
+
+def _con_lectura_en_periodo(predio_ids, mes, anio):
+    # Predios del lote que ya tienen lectura del periodo (solo se admite una, ver uq_lecturas_predio_periodo)
+    filas = db.session.query(Lectura.predio_id).filter(
+        Lectura.predio_id.in_(predio_ids), Lectura.anio == anio, Lectura.mes == mes
+    ).all()
+    return {f.predio_id for f in filas}
+
+
+def procesar_lote_lecturas(lote, mes, anio):
+    """Valida e inserta un lote de filas (numero_fila, {'numero_cuenta', 'lectura_actual'}).
+
+    Devuelve (exitos, errores) con errores como [(numero_fila, mensaje)]. No hace commit.
+    """
+    errores = []
+    pendientes = []
+    for numero, fila in lote:
+        cuenta = (fila.get('numero_cuenta') or '').strip()
+        lectura_str = (fila.get('lectura_actual') or '').strip()
+        if not lectura_str: continue # Saltar filas vacías
+        pendientes.append((numero, cuenta, lectura_str))
+
+    predios = _predios_por_cuenta({cuenta for _, cuenta, _ in pendientes}) if pendientes else {}
+    anteriores = _ultimas_lecturas(set(predios.values())) if predios else {}
+    registrados = _con_lectura_en_periodo(set(predios.values()), mes, anio) if predios else set()
+
+    nuevas = []
+    for numero, cuenta, lectura_str in pendientes:
+        predio_id = predios.get(cuenta)
+        if predio_id is None:
+            errores.append((numero, f"Cuenta {cuenta}: No encontrada."))
+            continue
+
+        if predio_id in registrados:
+            errores.append((numero, f"Cuenta {cuenta}: Ya tiene lectura para el periodo."))
+            continue
+
+        try:
+            lectura_val = float(lectura_str)
+        except ValueError:
+            errores.append((numero, f"Cuenta {cuenta}: Lectura no es un número válido."))
+            continue
+
+        anterior = anteriores.get(predio_id, 0)
+        if lectura_val < anterior:
+            errores.append((numero, f"Cuenta {cuenta}: Lectura menor a la anterior."))
+            continue
+
+        nuevas.append({
+            'predio_id': predio_id,
+            'mes': mes,
+            'anio': anio,
+            'lectura_anterior': anterior,
+            'lectura_actual': lectura_val,
+            'consumo_mes': lectura_val - anterior
+        })
+        # Si la cuenta se repite en el archivo, solo cuenta la primera fila
+        registrados.add(predio_id)
+
+    if nuevas:
+        # RETURNING trae los ids para enlazar cada cargo del estado de cuenta con su lectura
+        insertadas = db.session.execute(insert(Lectura).returning(
+            Lectura.id, Lectura.predio_id, Lectura.anio, Lectura.mes, Lectura.consumo_mes
+        ), nuevas).all()
+        cargar_lecturas(insertadas)
+        actualizar_estadisticas(n['predio_id'] for n in nuevas)
+        actualizar_cartera(n['predio_id'] for n in nuevas)
+        metricas.contar(metricas.LECTURAS, len(nuevas), origen='carga')
+
+    return len(nuevas), errores
+
+
+# --- SOCIOS ---
+
+def _cedulas_existentes(cedulas):
+    # Una sola consulta para todas las cédulas del lote
+    filas = db.session.query(Socio.cedula).filter(Socio.cedula.in_(cedulas)).all()
+    return {f.cedula for f in filas}
+
+
+def procesar_lote_socios(lote):
+    """Valida e inserta un lote de filas (numero_fila, {'nombre', 'cedula', 'telefono'}).
+
+    Devuelve (exitos, errores) con errores como [(numero_fila, mensaje)]. No hace commit.
+    """
+    errores = []
+    validas = []
+    for numero, fila in lote:
+        nombre = (fila.get('nombre') or '').strip()
+        cedula = re.sub(r'\D', '', fila.get('cedula') or '')
+        telefono = re.sub(r'\D', '', fila.get('telefono') or '')
+
+        if not nombre or not cedula:
+            errores.append((numero, "Fila omitida: Nombre o Cédula vacíos."))
+            continue
+        validas.append((numero, nombre, cedula, telefono))
+
+    # Las cédulas de lotes anteriores ya están confirmadas, así que esta consulta también
+    # detecta las repetidas entre lotes del mismo archivo
+    existentes = _cedulas_existentes({cedula for _, _, cedula, _ in validas}) if validas else set()
+
+    nuevos = []
+    primera_fila = {} # cédula -> fila del archivo donde apareció primero
+    for numero, nombre, cedula, telefono in validas:
+        if cedula in existentes:
+            errores.append((numero, f"Socio {cedula}: Ya existe en el sistema."))
+            continue
+        if cedula in primera_fila:
+            errores.append((numero, f"Socio {cedula}: Repetido en el archivo (fila {primera_fila[cedula]})."))
+            continue
+
+        primera_fila[cedula] = numero
+        nuevos.append({'nombre': nombre, 'cedula': cedula, 'telefono': telefono})
+
+    if nuevos:
+        db.session.execute(insert(Socio), nuevos)
+
+    return len(nuevos), sorted(errores)
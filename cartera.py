@@ -0,0 +1,174 @@
+import time
+from datetime import datetime, timezone
+
+from models import db, Predio, Lectura, Factura, CarteraPredio, CarteraSector, RecaudoDiario
+from sqlalchemy import func, insert
+from basedatos import insert_o_actualizar
+
+# Segundos que el dashboard reutiliza el resumen antes de volver a leer las tablas
+VIGENCIA_CACHE = 30
+
+_resumen = None
+_leido_en = 0.0
+
+_CAMPOS = ('predios', 'predios_mora', 'lecturas_pendientes', 'saldo_pendiente')
+
+
+# --- MANTENIMIENTO INCREMENTAL ---
+
+def _estado_predios(predio_ids):
+    # Lecturas sin factura pagada y saldo de sus facturas pendientes, en una sola consulta
+    pagada = db.session.query(Factura.id).filter(
+        Factura.lectura_id == Lectura.id, Factura.estado == 'Pagado'
+    ).exists()
+    pendiente = db.aliased(Factura)
+    filas = db.session.query(
+        Lectura.predio_id,
+        func.count(Lectura.id),
+        func.coalesce(func.sum(pendiente.total_a_pagar), 0.0)
+    ).outerjoin(
+        pendiente, db.and_(pendiente.lectura_id == Lectura.id, pendiente.estado == 'Pendiente')
+    ).filter(Lectura.predio_id.in_(predio_ids), ~pagada).group_by(Lectura.predio_id).all()
+    return {predio_id: (lecturas, saldo) for predio_id, lecturas, saldo in filas}
+
+
+def _sumar(modelo, claves, cambios):
+    # Una sola sentencia que crea la fila o le suma los cambios (col = col + delta). Con un
+    # UPDATE y luego un INSERT, dos transacciones que estrenan la misma fila a la vez no
+    # encuentran nada que actualizar y la segunda choca con la clave de la primera
+    sentencia = insert_o_actualizar(db.session, modelo).values(**claves, **cambios)
+    db.session.execute(sentencia.on_conflict_do_update(
+        index_elements=list(claves),
+        set_={campo: getattr(modelo, campo) + getattr(sentencia.excluded, campo) for campo in cambios}
+    ))
+
+
+def actualizar_cartera(predio_ids):
+    """Recalcula la cartera de los predios indicados y ajusta los totales de su sector.
+
+    Se llama en la misma transacción que escribe lecturas, facturas, pagos o cambia el
+    sector de un predio. No hace commit.
+    """
+    predio_ids = list(set(predio_ids))
+    if not predio_ids:
+        return
+    db.session.flush()
+
+    sectores = dict(db.session.query(Predio.id, func.coalesce(Predio.sector, '')).filter(
+        Predio.id.in_(predio_ids)
+    ))
+    estado = _estado_predios(predio_ids)
+    anteriores = {c.predio_id: c for c in CarteraPredio.query.filter(CarteraPredio.predio_id.in_(predio_ids))}
+
+    deltas = {}
+    def acumular(sector, signo, lecturas, saldo):
+        d = deltas.setdefault(sector, dict.fromkeys(_CAMPOS, 0))
+        d['predios'] += signo
+        d['predios_mora'] += signo * (lecturas > 0)
+        d['lecturas_pendientes'] += signo * lecturas
+        d['saldo_pendiente'] += signo * saldo
+
+    for predio_id in predio_ids:
+        fila = anteriores.get(predio_id)
+        if fila:
+            acumular(fila.sector, -1, fila.lecturas_pendientes, fila.saldo_pendiente)
+        if predio_id not in sectores: # El predio ya no existe
+            if fila:
+                db.session.delete(fila)
+            continue
+
+        if not fila:
+            fila = CarteraPredio(predio_id=predio_id)
+            db.session.add(fila)
+        fila.sector = sectores[predio_id]
+        fila.lecturas_pendientes, fila.saldo_pendiente = estado.get(predio_id, (0, 0.0))
+        acumular(fila.sector, 1, fila.lecturas_pendientes, fila.saldo_pendiente)
+
+    for sector, cambios in deltas.items():
+        cambios = {campo: valor for campo, valor in cambios.items() if valor}
+        if cambios:
+            _sumar(CarteraSector, {'sector': sector}, cambios)
+
+
+def registrar_recaudo(sector, total, pagos=1, fecha=None):
+    """Suma un pago al recaudo del día. No hace commit."""
+    fecha = fecha or datetime.now(timezone.utc).date()
+    _sumar(RecaudoDiario, {'fecha': fecha, 'sector': sector or ''}, {'pagos': pagos, 'total': total})
+
+
+def recalcular_cartera(tamano_lote=500):
+    """Reconstruye el resumen completo desde lecturas y facturas. Devuelve los predios procesados."""
+    db.session.query(CarteraPredio).delete()
+    db.session.query(CarteraSector).delete()
+    db.session.query(RecaudoDiario).delete()
+
+    procesados, ultimo_id = 0, 0
+    while True:
+        ids = [i for (i,) in db.session.query(Predio.id).filter(Predio.id > ultimo_id)
+               .order_by(Predio.id).limit(tamano_lote)]
+        if not ids:
+            break
+        actualizar_cartera(ids)
+        db.session.commit()
+        procesados += len(ids)
+        ultimo_id = ids[-1]
+
+    dia = func.date(Factura.fecha_pago)
+    filas = db.session.query(
+        dia, func.coalesce(Predio.sector, ''), func.count(Factura.id), func.sum(Factura.total_a_pagar)
+    ).join(Factura.lectura).join(Lectura.predio).filter(
+        Factura.estado == 'Pagado', Factura.fecha_pago != None
+    ).group_by(dia, func.coalesce(Predio.sector, '')).all()
+    if filas:
+        db.session.execute(insert(RecaudoDiario), [
+            {'fecha': datetime.strptime(str(f), '%Y-%m-%d').date(), 'sector': s, 'pagos': n, 'total': t}
+            for f, s, n, t in filas
+        ])
+    db.session.commit()
+    invalidar()
+    return procesados
+
+
+# --- LECTURA PARA EL DASHBOARD ---
+
+def invalidar():
+    global _resumen
+    _resumen = None
+
+
+def nombres_sectores():
+    """Sectores que tienen algún predio, para los filtros. Del resumen por sector, sin recorrer predios."""
+    return [s for (s,) in db.session.query(CarteraSector.sector).filter(
+        CarteraSector.predios > 0, CarteraSector.sector != ''
+    ).order_by(CarteraSector.sector)]
+
+
+def resumen_cartera():
+    """{'sectores': [...], 'predios', 'mora', 'al_dia', 'recaudo_mes'} con caché de VIGENCIA_CACHE segundos."""
+    global _resumen, _leido_en
+    if _resumen is not None and time.monotonic() - _leido_en <= VIGENCIA_CACHE:
+        return _resumen
+
+    hoy = datetime.now(timezone.utc).date()
+    sectores = CarteraSector.query.order_by(CarteraSector.sector).all()
+    recaudo_mes = db.session.query(func.sum(RecaudoDiario.total)).filter(
+        RecaudoDiario.fecha >= hoy.replace(day=1), RecaudoDiario.fecha <= hoy
+    ).scalar() or 0
+
+    predios = sum(s.predios for s in sectores)
+    mora = sum(s.predios_mora for s in sectores)
+    _resumen = {
+        'sectores': [{
+            'sector': s.sector or 'Sin sector',
+            'predios': s.predios,
+            'mora': s.predios_mora,
+            'lecturas_pendientes': s.lecturas_pendientes,
+            'saldo_pendiente': s.saldo_pendiente
+        } for s in sectores if s.predios],
+        'predios': predios,
+        'mora': mora,
+        'al_dia': predios - mora,
+        'recaudo_mes': recaudo_mes
+    }
+    _leido_en = time.monotonic()
+    return _resumen
@@ -0,0 +1,190 @@
+import os
+import re
+import sys
+import sysconfig
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+
+from models import db
+
+# --- DETECTOR DE CONSULTAS REPETIDAS Y LENTAS ---
+# En desarrollo (--debug) y en pruebas (TESTING) agrupa por forma las sentencias de cada
+# petición. Una forma que se repite DETECTOR_SQL_REPETICIONES veces o más (el N+1 típico:
+# una consulta por fila de un listado, casi siempre una relación perezosa) se registra con
+# la ruta y la línea de código o de plantilla que la disparó; en pruebas además la petición
+# falla con ConsultasRepetidas. Las sentencias que tardan más de DETECTOR_SQL_LENTA_MS se
+# registran con su plan (EXPLAIN). DETECTOR_SQL='registrar', 'fallar' o 'no' fija el modo.
+
+# Código que no es de la aplicación: al buscar el origen de una consulta se salta
+_LIBRERIAS = tuple({sysconfig.get_paths()[clave] for clave in ('stdlib', 'purelib', 'platlib')})
+
+_actual = ContextVar('detector_sql', default=None)
+
+_PARAMETRO = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_TEXTOS = re.compile(r"'(?:[^']|'')*'")
+_NUMEROS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTAS = re.compile(rf'\(\s*{_PARAMETRO}(?:\s*,\s*{_PARAMETRO})*\s*\)') # Los IN (?, ?, ...) de cualquier largo
+_ESPACIOS = re.compile(r'\s+')
+_CON_PLAN = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class ConsultasRepetidas(Exception):
+    pass
+
+
+def forma(sentencia):
+    """La sentencia sin valores: dos consultas con la misma forma solo difieren en los parámetros."""
+    sentencia = _NUMEROS.sub('?', _TEXTOS.sub('?', sentencia))
+    return _ESPACIOS.sub(' ', _LISTAS.sub('(?)', sentencia)).strip()
+
+
+def modo(app):
+    valor = app.config.get('DETECTOR_SQL')
+    if valor:
+        return None if valor == 'no' else valor
+    return 'fallar' if app.testing else 'registrar' if app.debug else None
+
+
+def _lugar():
+    # La línea más cercana a la consulta que no sea de una librería: una plantilla (con su
+    # línea real, no la del código que genera Jinja), un módulo de la aplicación o una prueba
+    marco = sys._getframe(1)
+    while marco is not None:
+        plantilla = marco.f_globals.get('__jinja_template__')
+        if plantilla is not None:
+            return f"{plantilla.name or '<plantilla>'}:{plantilla.get_corresponding_lineno(marco.f_lineno)}"
+        archivo = marco.f_code.co_filename
+        if archivo != __file__ and not archivo.startswith(_LIBRERIAS) and not archivo.startswith('<'):
+            return f"{os.path.relpath(archivo)}:{marco.f_lineno}"
+        marco = marco.f_back
+    return '?'
+
+
+class Vigilancia:
+    """Sentencias de una petición (o de un bloque vigilar()) agrupadas por forma."""
+
+    def __init__(self, origen, repeticiones, fallar):
+        self.origen = origen
+        self.repeticiones = repeticiones
+        self.fallar = fallar
+        self.formas = {} # forma -> [veces, segundos, lugar de la segunda ejecución]
+
+    def anotar(self, sentencia, segundos):
+        clave = forma(sentencia)
+        datos = self.formas.get(clave)
+        if datos is None:
+            self.formas[clave] = [1, segundos, None]
+            return
+        datos[0] += 1
+        datos[1] += segundos
+        if datos[2] is None: # Solo se busca el origen de las que se repiten
+            datos[2] = _lugar()
+
+    def repetidas(self):
+        """[(forma, veces, segundos, lugar)] de las formas que llegaron al umbral, de la más repetida a la menos."""
+        return sorted(((clave, veces, segundos, lugar) for clave, (veces, segundos, lugar) in self.formas.items()
+                       if veces >= self.repeticiones), key=lambda r: -r[1])
+
+    def cerrar(self):
+        repetidas = self.repetidas()
+        for clave, veces, segundos, lugar in repetidas:
+            current_app.logger.warning("Consulta repetida %d veces (%.0f ms) en %s desde %s: %s",
+                                       veces, segundos * 1000, self.origen, lugar, clave)
+        if repetidas and self.fallar:
+            clave, veces, _, lugar = repetidas[0]
+            raise ConsultasRepetidas(f"{self.origen}: {len(repetidas)} consulta(s) repetidas {self.repeticiones} "
+                                     f"veces o más; la peor, {veces} veces desde {lugar}: {clave}")
+
+
+@contextmanager
+def vigilar(repeticiones=None):
+    """Para pruebas de funciones sueltas: falla al salir si alguna consulta del bloque se repitió demasiado."""
+    vigilancia = Vigilancia('bloque vigilado', repeticiones or current_app.config['DETECTOR_SQL_REPETICIONES'], True)
+    token = _actual.set(vigilancia)
+    try:
+        yield vigilancia
+    finally:
+        _actual.reset(token)
+    vigilancia.cerrar()
+
+
+# --- ENGANCHE CON FLASK Y SQLALCHEMY ---
+
+def iniciar(app):
+    # Se llama después de db.init_app(); el modo se decide en cada petición, así que
+    # activar TESTING después de importar la aplicación también lo enciende
+    app.before_request(_empezar)
+    app.after_request(_terminar)
+    with app.app_context():
+        for motor in db.engines.values():
+            event.listen(motor, 'before_cursor_execute', _antes_de_sql)
+            event.listen(motor, 'after_cursor_execute', _despues_de_sql)
+
+
+def _empezar():
+    actual = modo(current_app)
+    _actual.set(Vigilancia(f"{request.method} {request.path}", current_app.config['DETECTOR_SQL_REPETICIONES'],
+                           actual == 'fallar') if actual else None)
+
+
+def _terminar(respuesta):
+    vigilancia = _actual.get()
+    if vigilancia is None:
+        return respuesta
+    if respuesta.is_streamed:
+        # Las plantillas por partes siguen consultando mientras se envían
+        respuesta.response = _cerrar_al_enviar(respuesta.response, vigilancia)
+    else:
+        _actual.set(None)
+        vigilancia.cerrar()
+    return respuesta
+
+
+def _cerrar_al_enviar(partes, vigilancia):
+    try:
+        yield from partes
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+        _actual.set(None)
+    vigilancia.cerrar()
+
+
+def _antes_de_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    conexion.info['detector_inicio'] = time.perf_counter()
+
+
+def _despues_de_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    inicio = conexion.info.pop('detector_inicio', None)
+    if inicio is None:
+        return
+    segundos = time.perf_counter() - inicio
+    vigilancia = _actual.get()
+    if vigilancia is not None:
+        vigilancia.anotar(sentencia, segundos)
+    # Las lentas también se buscan fuera de las peticiones (trabajos en segundo plano, comandos)
+    if (vigilancia is not None or (has_app_context() and modo(current_app))) \
+            and segundos * 1000 >= current_app.config['DETECTOR_SQL_LENTA_MS']:
+        plan = _plan(conexion, sentencia, parametros) if not varias else ['(executemany)']
+        current_app.logger.warning("Consulta lenta (%.0f ms) en %s desde %s: %s\n  Plan: %s",
+                                   segundos * 1000, vigilancia.origen if vigilancia else 'segundo plano',
+                                   _lugar(), _ESPACIOS.sub(' ', sentencia), ' | '.join(plan))
+
+
+def _plan(conexion, sentencia, parametros):
+    if not sentencia.lstrip().upper().startswith(_CON_PLAN):
+        return ['(sin plan)']
+    prefijo = 'EXPLAIN QUERY PLAN ' if conexion.dialect.name == 'sqlite' else 'EXPLAIN '
+    # Con el cursor del driver: el EXPLAIN no vuelve a pasar por estos eventos
+    cursor = conexion.connection.cursor()
+    try:
+        cursor.execute(prefijo + sentencia, parametros)
+        return [str(fila[-1]) for fila in cursor.fetchall()]
+    except Exception as e:
+        return [f"(no se pudo obtener el plan: {e})"]
+    finally:
+        cursor.close()
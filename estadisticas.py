@@ -0,0 +1,184 @@
+import math
+from datetime import datetime
+from statistics import fmean
+
+from models import db, Lectura, Predio, EstadisticaConsumo, ConsumoSector
+from sqlalchemy import Numeric, case, cast, func, insert, tuple_
+from basedatos import insert_o_actualizar
+
+VENTANAS = (3, 6, 12)
+
+
+def _ventana(consumos, n):
+    muestra = consumos[:n]
+    if not muestra:
+        return None, None
+    # Desviación poblacional en float: statistics.pstdev calcula con fracciones exactas y es
+    # decenas de veces más lenta, para un valor que de todos modos se redondea a centésimas
+    media = fmean(muestra)
+    return round(media, 2), round(math.sqrt(fmean([(x - media) ** 2 for x in muestra])), 2)
+
+
+def actualizar_estadisticas(predio_ids):
+    """Recalcula la línea base de consumo de los predios indicados.
+
+    Se llama en la misma transacción que inserta las lecturas. Cuesta una consulta
+    (las 13 lecturas más recientes de cada predio, con ROW_NUMBER) más un borrado y
+    un insert masivo, sin importar cuántos predios traiga el lote.
+    """
+    predio_ids = list(set(predio_ids))
+    if not predio_ids:
+        return
+
+    orden = func.row_number().over(
+        partition_by=Lectura.predio_id,
+        order_by=(Lectura.anio.desc(), Lectura.mes.desc(), Lectura.id.desc())
+    ).label('n')
+    recientes = db.session.query(
+        Lectura.predio_id, Lectura.anio, Lectura.mes, Lectura.consumo_mes, orden
+    ).filter(Lectura.predio_id.in_(predio_ids)).subquery()
+
+    filas = db.session.query(recientes).filter(recientes.c.n <= max(VENTANAS) + 1).order_by(
+        recientes.c.predio_id, recientes.c.n
+    ).all()
+
+    por_predio = {}
+    for fila in filas:
+        por_predio.setdefault(fila.predio_id, []).append(fila)
+
+    ahora = datetime.utcnow()
+    nuevas = []
+    for predio_id, lecturas in por_predio.items():
+        ultima, anteriores = lecturas[0], [l.consumo_mes for l in lecturas[1:]]
+        estadistica = {
+            'predio_id': predio_id,
+            'ultimo_anio': ultima.anio,
+            'ultimo_mes': ultima.mes,
+            'ultimo_consumo': ultima.consumo_mes,
+            'lecturas_base': len(anteriores),
+            'fecha_actualizacion': ahora
+        }
+        for n in VENTANAS:
+            estadistica[f'promedio_{n}'], estadistica[f'desviacion_{n}'] = _ventana(anteriores, n)
+        nuevas.append(estadistica)
+
+    EstadisticaConsumo.query.filter(EstadisticaConsumo.predio_id.in_(predio_ids)).delete(synchronize_session=False)
+    if nuevas:
+        db.session.execute(insert(EstadisticaConsumo), nuevas)
+
+
+def recalcular_todo(tamano_lote=500):
+    # Reconstruye la tabla completa; útil la primera vez o tras corregir lecturas a mano
+    ids = [i for (i,) in db.session.query(Lectura.predio_id).distinct().order_by(Lectura.predio_id)]
+    for inicio in range(0, len(ids), tamano_lote):
+        actualizar_estadisticas(ids[inicio:inicio + tamano_lote])
+        db.session.commit()
+    return len(ids)
+
+
+# --- CONSUMO POR PERIODO Y SECTOR ---
+# Las cargas masivas y los cambios de sector recalculan completo cada periodo/sector que tocan
+# (los percentiles no se pueden sumar por partes); el resto de la tabla no se toca. Una lectura
+# manual solo suma su consumo a la fila (sumar_lectura_a_sector).
+
+def _percentil(ordenados, p):
+    # Interpolación lineal entre las dos posiciones más cercanas
+    if not ordenados:
+        return None
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    siguiente = ordenados[min(i + 1, len(ordenados) - 1)]
+    return round(ordenados[i] + (siguiente - ordenados[i]) * (k - i), 2)
+
+
+def actualizar_consumo_sectores(claves):
+    """Recalcula las filas (anio, mes, sector) indicadas de consumo_sectores. No hace commit."""
+    claves = {(anio, mes, sector or '') for anio, mes, sector in claves}
+    if not claves:
+        return
+    db.session.flush()
+
+    sector = func.coalesce(Predio.sector, '')
+    por_periodo = {}
+    for anio, mes, s in claves:
+        por_periodo.setdefault((anio, mes), set()).add(s)
+
+    ahora = datetime.utcnow()
+    nuevas = []
+    for (anio, mes), sectores in por_periodo.items():
+        filas = db.session.query(sector, Lectura.consumo_mes).join(Lectura.predio).filter(
+            Lectura.anio == anio, Lectura.mes == mes, sector.in_(sectores)
+        ).order_by(sector, Lectura.consumo_mes).all()
+
+        consumos = {}
+        for s, consumo in filas:
+            consumos.setdefault(s, []).append(consumo)
+
+        for s, valores in consumos.items():
+            nuevas.append({
+                'anio': anio, 'mes': mes, 'sector': s,
+                'lecturas': len(valores),
+                'medidores_activos': sum(1 for v in valores if v > 0),
+                'total': sum(valores),
+                'promedio': round(fmean(valores), 2),
+                'p50': _percentil(valores, 50),
+                'p90': _percentil(valores, 90),
+                'p95': _percentil(valores, 95),
+                'maximo': valores[-1],
+                'fecha_actualizacion': ahora
+            })
+
+    ConsumoSector.query.filter(
+        tuple_(ConsumoSector.anio, ConsumoSector.mes, ConsumoSector.sector).in_(list(claves))
+    ).delete(synchronize_session=False)
+    if nuevas:
+        db.session.execute(insert(ConsumoSector), nuevas)
+
+
+def sumar_lectura_a_sector(anio, mes, sector, consumo):
+    """Suma una lectura nueva a su fila de consumo_sectores sin releer el periodo. No hace commit.
+
+    Lecturas, medidores activos, total, promedio y máximo quedan exactos. Los percentiles de una
+    fila que ya existía se mantienen hasta el próximo recálculo del periodo (una carga masiva o
+    'flask recalcular-consumo-sectores'): una lectura entre cientos apenas los mueve.
+    """
+    sentencia = insert_o_actualizar(db.session, ConsumoSector).values(
+        anio=anio, mes=mes, sector=sector or '', lecturas=1, medidores_activos=int(consumo > 0),
+        total=consumo, promedio=round(consumo, 2), p50=round(consumo, 2), p90=round(consumo, 2),
+        p95=round(consumo, 2), maximo=consumo, fecha_actualizacion=datetime.utcnow()
+    )
+    fila, nueva = ConsumoSector, sentencia.excluded
+    db.session.execute(sentencia.on_conflict_do_update(index_elements=['anio', 'mes', 'sector'], set_={
+        'lecturas': fila.lecturas + 1,
+        'medidores_activos': fila.medidores_activos + nueva.medidores_activos,
+        'total': fila.total + nueva.total,
+        'promedio': func.round(cast((fila.total + nueva.total) / (fila.lecturas + 1), Numeric), 2),
+        'maximo': case((fila.maximo >= nueva.maximo, fila.maximo), else_=nueva.maximo),
+        'fecha_actualizacion': nueva.fecha_actualizacion
+    }))
+
+
+def claves_de_predios(predio_ids):
+    # (anio, mes, sector) en los que aparecen las lecturas de estos predios
+    return set(db.session.query(Lectura.anio, Lectura.mes, Predio.sector).join(Lectura.predio).filter(
+        Lectura.predio_id.in_(list(set(predio_ids)))
+    ).distinct())
+
+
+def claves_de_periodo(anio, mes):
+    return set(db.session.query(Lectura.anio, Lectura.mes, Predio.sector).join(Lectura.predio).filter(
+        Lectura.anio == anio, Lectura.mes == mes
+    ).distinct())
+
+
+def recalcular_consumo_sectores():
+    # Reconstruye la tabla completa, un periodo a la vez
+    db.session.query(ConsumoSector).delete()
+    periodos = db.session.query(Lectura.anio, Lectura.mes, Predio.sector).join(Lectura.predio).distinct().all()
+    por_periodo = {}
+    for anio, mes, sector in periodos:
+        por_periodo.setdefault((anio, mes), set()).add((anio, mes, sector))
+    for claves in por_periodo.values():
+        actualizar_consumo_sectores(claves)
+        db.session.commit()
+    return len(por_periodo)
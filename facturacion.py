@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+
+from models import db, Predio, Lectura, Factura
+from sqlalchemy import DateTime, Float, String, case, cast, func, insert, literal, select
+from tarifas import tarifa_para
+from cartera import actualizar_cartera
+import metricas
+import saldos # Módulo y no nombres: saldos.py también usa este módulo
+
+try:
+    import numpy as np
+except ImportError: # NumPy es opcional: sin él los lotes se calculan en Python puro
+    np = None
+
+# Predios por cada llamada a actualizar_cartera después de facturar un periodo
+TAMANO_LOTE = 500
+
+
+# --- MOTOR DE TARIFAS ---
+# Única implementación del cobro por niveles:
+#   cargo_fijo + min(consumo, limite_basico) * valor_m3 + max(0, consumo - limite_basico) * valor_m3_exceso
+# 'tarifa' es cualquier objeto con esos cuatro atributos (normalmente un tarifas.Tarifa).
+
+def calcular_cobro(consumo, tarifa):
+    """Desglose del cobro de un solo consumo, para facturas y recibos individuales."""
+    basico = min(consumo, tarifa.limite_basico) * tarifa.valor_m3
+    exceso = max(0, consumo - tarifa.limite_basico) * tarifa.valor_m3_exceso
+    return {
+        'cargo_fijo': tarifa.cargo_fijo,
+        'basico': basico,
+        'exceso': exceso,
+        'total': tarifa.cargo_fijo + basico + exceso
+    }
+
+
+def calcular_totales(consumos, tarifa):
+    """Total a pagar de cada consumo de la lista, calculado en una sola pasada."""
+    limite = tarifa.limite_basico
+    if np is not None:
+        c = np.asarray(consumos, dtype=float)
+        totales = (tarifa.cargo_fijo
+                   + np.minimum(c, limite) * tarifa.valor_m3
+                   + np.maximum(c - limite, 0) * tarifa.valor_m3_exceso)
+        return totales.tolist()
+
+    cargo, valor, valor_exceso = tarifa.cargo_fijo, tarifa.valor_m3, tarifa.valor_m3_exceso
+    return [
+        cargo + (c if c < limite else limite) * valor + (c - limite if c > limite else 0) * valor_exceso
+        for c in consumos
+    ]
+
+
+def totales_por_periodo(lecturas):
+    """Total de cada lectura, cobrada con la tarifa vigente en su propio periodo.
+
+    Acepta cualquier objeto con anio, mes y consumo_mes. Agrupa por periodo y calcula
+    cada grupo de una sola pasada; el resultado conserva el orden de entrada.
+    """
+    grupos = {}
+    for i, lec in enumerate(lecturas):
+        grupos.setdefault((lec.anio, lec.mes), []).append(i)
+
+    totales = [0.0] * len(lecturas)
+    for (anio, mes), indices in grupos.items():
+        tarifa = tarifa_para(anio, mes)
+        if tarifa is None:
+            raise ValueError(f"No hay tarifas vigentes para {mes}/{anio}. Configúrelas antes de facturar.")
+        parciales = calcular_totales([lecturas[i].consumo_mes for i in indices], tarifa)
+        for i, total in zip(indices, parciales):
+            totales[i] = total
+    return totales
+
+
+# --- FACTURACIÓN POR PERIODO ---
+# Cada periodo se factura con un solo INSERT ... SELECT: la base de datos calcula el total con
+# la tarifa del periodo y arma el número de factura, sin traer las lecturas a Python.
+
+def _total_sql(tarifa):
+    # La misma fórmula de calcular_cobro, como expresión SQL sobre el consumo de la lectura
+    consumo = Lectura.consumo_mes
+    limite = literal(tarifa.limite_basico, Float)
+    return (literal(tarifa.cargo_fijo, Float)
+            + case((consumo < limite, consumo), else_=limite) * literal(tarifa.valor_m3, Float)
+            + case((consumo > limite, consumo - limite), else_=0.0) * literal(tarifa.valor_m3_exceso, Float))
+
+
+def _sin_factura():
+    return ~select(Factura.id).where(Factura.lectura_id == Lectura.id).exists()
+
+
+def facturar_periodo(anio, mes):
+    """Crea la factura de cada lectura del periodo que todavía no tenga ninguna y devuelve cuántas creó.
+
+    El número es FAC-{anio}-{cuenta}-{lectura}, así que repetirlo no duplica nada: solo
+    factura lo que falte. Ajusta la cartera de los predios del periodo y, si alguna factura
+    no vale lo mismo que el cargo de su lectura, el estado de cuenta. No hace commit.
+    """
+    tarifa = tarifa_para(anio, mes)
+    if tarifa is None:
+        raise ValueError(f"No hay tarifas vigentes para {mes}/{anio}. Configúrelas antes de facturar.")
+
+    numero = (literal('FAC-') + cast(Lectura.anio, String) + '-' + Predio.numero_cuenta
+              + '-' + cast(Lectura.id, String))
+    seleccion = select(
+        Lectura.id, numero, _total_sql(tarifa), literal('Pendiente'), literal(datetime.now(timezone.utc), DateTime)
+    ).join(Predio, Predio.id == Lectura.predio_id).where(Lectura.anio == anio, Lectura.mes == mes, _sin_factura())
+    creadas = db.session.execute(insert(Factura).from_select(
+        ['lectura_id', 'numero_factura', 'total_a_pagar', 'estado', 'fecha_emision'], seleccion
+    )).rowcount
+
+    if creadas:
+        saldos.ajustar_cargos(anio, mes)
+        predio_ids = [i for (i,) in db.session.query(Lectura.predio_id).filter(
+            Lectura.anio == anio, Lectura.mes == mes
+        ).distinct()]
+        for i in range(0, len(predio_ids), TAMANO_LOTE):
+            actualizar_cartera(predio_ids[i:i + TAMANO_LOTE])
+        metricas.contar(metricas.FACTURAS, creadas, origen='periodo')
+    return creadas
+
+
+def generar_facturas_pendientes(trabajo):
+    # Todas las lecturas que todavía no tienen factura, sin importar el periodo; cada
+    # periodo se confirma por separado, así el avance queda visible en el trabajo
+    periodos = db.session.query(Lectura.anio, Lectura.mes, func.count(Lectura.id)).filter(
+        _sin_factura()
+    ).group_by(Lectura.anio, Lectura.mes).order_by(Lectura.anio, Lectura.mes).all()
+    trabajo.total = sum(n for _, _, n in periodos)
+    db.session.commit()
+
+    for anio, mes, _ in periodos:
+        creadas = facturar_periodo(anio, mes)
+        trabajo.procesados += creadas
+        trabajo.exitos += creadas
+        db.session.commit()
+    trabajo.mensaje = f"{trabajo.exitos} facturas generadas en {len(periodos)} periodo(s)."
+
+
+def emitir_facturas_periodo(trabajo, mes, anio):
+    # Solo las lecturas del periodo indicado que no tengan factura asociada todavía
+    trabajo.total = db.session.query(func.count(Lectura.id)).filter(
+        Lectura.anio == anio, Lectura.mes == mes, _sin_factura()
+    ).scalar()
+    creadas = facturar_periodo(anio, mes)
+    trabajo.procesados = trabajo.exitos = creadas
+    trabajo.mensaje = f"{creadas} facturas generadas para {mes}/{anio}."
+    db.session.commit()
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+# --- IMPRESIÓN DE FACTURAS POR LOTES ---
+# Un tiraje es un solo documento HTML con todas las facturas de un periodo, una por página.
+# Las facturas se renderizan por grupos; en tirajes grandes los grupos se reparten entre
+# procesos, cada uno con la plantilla ya compilada. Este módulo no importa la aplicación ni
+# los modelos: los procesos solo reciben diccionarios y devuelven HTML.
+
+PLANTILLA = 'factura_impresa.html'
+FACTURAS_POR_GRUPO = 200
+
+_CARPETA_PLANTILLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+_plantilla = None # Plantilla compilada del proceso actual
+_procesos = None
+
+
+def _compilar():
+    global _plantilla
+    entorno = Environment(loader=FileSystemLoader(_CARPETA_PLANTILLAS), autoescape=select_autoescape())
+    _plantilla = entorno.get_template(PLANTILLA)
+
+
+def renderizar_grupo(facturas, empresa):
+    if _plantilla is None:
+        _compilar()
+    return _plantilla.render(facturas=facturas, empresa=empresa)
+
+
+def _pool(procesos):
+    # 'spawn' y no 'fork': el servidor tiene hilos y conexiones abiertas que no deben copiarse.
+    # Cada proceso nuevo vuelve a importar el script principal (app.py con 'python app.py');
+    # por eso app.py no prepara la base ni arranca trabajos al importarse (ver arrancar())
+    global _procesos
+    if _procesos is None:
+        _procesos = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_compilar)
+    return _procesos
+
+
+def _grupos(filas, tamano):
+    grupo = []
+    for fila in filas:
+        grupo.append(fila)
+        if len(grupo) == tamano:
+            yield grupo
+            grupo = []
+    if grupo:
+        yield grupo
+
+
+def renderizar(filas, empresa, procesos=1, tamano_grupo=FACTURAS_POR_GRUPO):
+    """Genera el HTML de las facturas por partes, en el orden de 'filas'.
+
+    Con procesos > 1 cada grupo se renderiza en otro proceso; solo hay unos pocos grupos en
+    vuelo a la vez, así la memoria no crece con el tamaño del tiraje.
+    """
+    if procesos <= 1:
+        for grupo in _grupos(filas, tamano_grupo):
+            yield renderizar_grupo(grupo, empresa)
+        return
+
+    ejecutor = _pool(procesos)
+    en_vuelo = deque()
+    for grupo in _grupos(filas, tamano_grupo):
+        en_vuelo.append(ejecutor.submit(renderizar_grupo, grupo, empresa))
+        if len(en_vuelo) >= 2 * procesos:
+            yield en_vuelo.popleft().result()
+    while en_vuelo:
+        yield en_vuelo.popleft().result()
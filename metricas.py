@@ -0,0 +1,194 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+from basedatos import SesionAcueducto
+
+# --- MÉTRICAS ---
+# Contadores e histogramas en memoria, expuestos en /metrics con el formato de texto de
+# Prometheus. Cada proceso lleva los suyos: con varios procesos del servidor, Prometheus
+# debe consultar cada uno (o sumar las series por instancia).
+
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+BYTES = (1000, 10000, 100000, 1000000, 10000000)
+
+_candado = threading.Lock()
+_metricas = []
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Valor que solo crece, uno por combinación de etiquetas."""
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, etiquetas
+        self._valores = {}
+        _metricas.append(self)
+
+    def sumar(self, valor=1, **etiquetas):
+        clave = tuple(etiquetas[e] for e in self.etiquetas)
+        with _candado:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with _candado:
+            valores = sorted(self._valores.items())
+        for clave, valor in valores:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}")
+        return lineas
+
+
+class Histograma:
+    """Conteo de observaciones por rango ('le' acumulado, como los espera Prometheus), con su suma."""
+
+    def __init__(self, nombre, ayuda, limites, etiquetas=()):
+        self.nombre, self.ayuda, self.limites, self.etiquetas = nombre, ayuda, limites, etiquetas
+        self._series = {} # etiquetas -> [conteos por rango (+Inf al final), suma]
+        _metricas.append(self)
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas[e] for e in self.etiquetas)
+        with _candado:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][bisect_left(self.limites, valor)] += 1
+            serie[1] += valor
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with _candado:
+            series = sorted((clave, list(conteos), suma) for clave, (conteos, suma) in self._series.items())
+        for clave, conteos, suma in series:
+            acumulado = 0
+            for limite, conteo in zip(self.limites + ('+Inf',), conteos):
+                acumulado += conteo
+                le = f'le="{limite}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}")
+        return lineas
+
+
+def exponer():
+    return '\n'.join(linea for metrica in _metricas for linea in metrica.exponer()) + '\n'
+
+
+# Peticiones
+PETICIONES = Contador('acueducto_peticiones_total', 'Peticiones atendidas.', ('endpoint', 'metodo', 'estado'))
+DURACION = Histograma('acueducto_peticion_segundos', 'Duración de cada petición, incluida la respuesta por partes.',
+                      SEGUNDOS, ('endpoint',))
+SQL_CONSULTAS = Histograma('acueducto_peticion_consultas_sql', 'Sentencias SQL ejecutadas por petición.',
+                           CONSULTAS, ('endpoint',))
+SQL_SEGUNDOS = Histograma('acueducto_peticion_sql_segundos', 'Tiempo en la base de datos por petición.',
+                          SEGUNDOS, ('endpoint',))
+RESPUESTA_BYTES = Histograma('acueducto_respuesta_bytes', 'Tamaño del cuerpo de cada respuesta.',
+                             BYTES, ('endpoint',))
+
+# Negocio: se suman al confirmar la transacción (ver contar())
+LECTURAS = Contador('acueducto_lecturas_ingresadas_total', 'Lecturas registradas.', ('origen',))
+FACTURAS = Contador('acueducto_facturas_generadas_total', 'Facturas creadas.', ('origen',))
+PAGOS = Contador('acueducto_pagos_confirmados_total', 'Pagos confirmados en caja.')
+RECAUDO = Contador('acueducto_recaudo_pesos_total', 'Valor cobrado en caja, en pesos.')
+
+
+# --- CONTADORES DE NEGOCIO ---
+# Se anotan en la sesión y solo cuentan si la transacción se confirma: un cobro que se
+# deshace por una carrera entre cajas no aparece como pago.
+
+def contar(contador, valor=1, **etiquetas):
+    db.session.info.setdefault('metricas', []).append((contador, valor, etiquetas))
+
+
+@event.listens_for(SesionAcueducto, 'after_commit')
+def _sumar_confirmados(sesion):
+    for contador, valor, etiquetas in sesion.info.pop('metricas', ()):
+        contador.sumar(valor, **etiquetas)
+
+
+@event.listens_for(SesionAcueducto, 'after_rollback')
+def _descartar(sesion):
+    sesion.info.pop('metricas', None)
+
+
+# --- MEDICIÓN DE PETICIONES ---
+
+def iniciar(app):
+    # Se llama después de db.init_app()
+    app.before_request(_empezar)
+    app.after_request(_terminar)
+    with app.app_context():
+        for motor in db.engines.values():
+            event.listen(motor, 'before_cursor_execute', _antes_de_sql)
+            event.listen(motor, 'after_cursor_execute', _despues_de_sql)
+
+
+def _antes_de_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    conexion.info['metricas_inicio'] = time.perf_counter()
+
+
+def _despues_de_sql(conexion, cursor, sentencia, parametros, contexto, varias):
+    # Solo cuenta lo que corre dentro de una petición (no los trabajos en segundo plano)
+    inicio = conexion.info.pop('metricas_inicio', None)
+    if inicio is not None and has_request_context():
+        medicion = g.get('metricas')
+        if medicion is not None:
+            medicion['consultas'] += 1
+            medicion['sql'] += time.perf_counter() - inicio
+
+
+def _empezar():
+    g.metricas = {'inicio': time.perf_counter(), 'consultas': 0, 'sql': 0.0}
+
+
+def _terminar(respuesta):
+    medicion = g.get('metricas')
+    if medicion is None:
+        return respuesta
+    endpoint = request.endpoint or 'sin_ruta'
+    PETICIONES.sumar(endpoint=endpoint, metodo=request.method, estado=respuesta.status_code)
+    if respuesta.is_streamed:
+        # El cuerpo se genera después de esta función: se mide cuando el servidor termina de enviarlo
+        respuesta.response = _medir_envio(respuesta.response, medicion, endpoint)
+    else:
+        _registrar(medicion, endpoint, respuesta.calculate_content_length() or 0)
+    return respuesta
+
+
+def _medir_envio(partes, medicion, endpoint):
+    enviados = 0
+    try:
+        for parte in partes:
+            enviados += len(parte.encode() if isinstance(parte, str) else parte)
+            yield parte
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+        _registrar(medicion, endpoint, enviados)
+
+
+def _registrar(medicion, endpoint, tamano):
+    DURACION.observar(time.perf_counter() - medicion['inicio'], endpoint=endpoint)
+    SQL_CONSULTAS.observar(medicion['consultas'], endpoint=endpoint)
+    SQL_SEGUNDOS.observar(medicion['sql'], endpoint=endpoint)
+    RESPUESTA_BYTES.observar(tamano, endpoint=endpoint)
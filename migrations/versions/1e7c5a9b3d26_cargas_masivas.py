@@ -0,0 +1,55 @@
+"""Cargas masivas reanudables y sus errores por fila
+
+Revision ID: 1e7c5a9b3d26
+Revises: 6b2e9d4a1c80
+Create Date: 2026-10-18 15:41:52.870113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e7c5a9b3d26'
+down_revision = '6b2e9d4a1c80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya las tablas al importar la aplicación
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('cargas_masivas'):
+        op.create_table('cargas_masivas',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tipo', sa.String(length=20), nullable=False),
+            sa.Column('nombre_archivo', sa.String(length=255), nullable=True),
+            sa.Column('huella', sa.String(length=64), nullable=True),
+            sa.Column('estado', sa.String(length=20), nullable=True),
+            sa.Column('filas_procesadas', sa.Integer(), nullable=True),
+            sa.Column('exitos', sa.Integer(), nullable=True),
+            sa.Column('total_errores', sa.Integer(), nullable=True),
+            sa.Column('usuario_id', sa.Integer(), nullable=True),
+            sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_cargas_masivas_huella', 'cargas_masivas', ['huella'])
+    if not inspector.has_table('errores_carga'):
+        op.create_table('errores_carga',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('carga_id', sa.Integer(), nullable=False),
+            sa.Column('fila', sa.Integer(), nullable=True),
+            sa.Column('mensaje', sa.String(length=255), nullable=True),
+            sa.ForeignKeyConstraint(['carga_id'], ['cargas_masivas.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_errores_carga_carga_id', 'errores_carga', ['carga_id'])
+
+
+def downgrade():
+    op.drop_index('ix_errores_carga_carga_id', table_name='errores_carga')
+    op.drop_table('errores_carga')
+    op.drop_index('ix_cargas_masivas_huella', table_name='cargas_masivas')
+    op.drop_table('cargas_masivas')
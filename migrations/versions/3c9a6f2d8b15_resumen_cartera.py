@@ -0,0 +1,55 @@
+"""Resumen de cartera por predio y sector, y recaudo diario
+
+Revision ID: 3c9a6f2d8b15
+Revises: 8f4b1d7e2a63
+Create Date: 2026-10-18 16:48:21.095734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a6f2d8b15'
+down_revision = '8f4b1d7e2a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya las tablas al importar la aplicación
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('cartera_predios'):
+        op.create_table('cartera_predios',
+            sa.Column('predio_id', sa.Integer(), nullable=False),
+            sa.Column('sector', sa.String(length=50), nullable=False),
+            sa.Column('lecturas_pendientes', sa.Integer(), nullable=True),
+            sa.Column('saldo_pendiente', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['predio_id'], ['predios.id'], ),
+            sa.PrimaryKeyConstraint('predio_id')
+        )
+    if not inspector.has_table('cartera_sectores'):
+        op.create_table('cartera_sectores',
+            sa.Column('sector', sa.String(length=50), nullable=False),
+            sa.Column('predios', sa.Integer(), nullable=True),
+            sa.Column('predios_mora', sa.Integer(), nullable=True),
+            sa.Column('lecturas_pendientes', sa.Integer(), nullable=True),
+            sa.Column('saldo_pendiente', sa.Float(), nullable=True),
+            sa.PrimaryKeyConstraint('sector')
+        )
+    if not inspector.has_table('recaudo_diario'):
+        op.create_table('recaudo_diario',
+            sa.Column('fecha', sa.Date(), nullable=False),
+            sa.Column('sector', sa.String(length=50), nullable=False),
+            sa.Column('pagos', sa.Integer(), nullable=True),
+            sa.Column('total', sa.Float(), nullable=True),
+            sa.PrimaryKeyConstraint('fecha', 'sector')
+        )
+    # El resumen se llena con 'flask recalcular-cartera'; hasta entonces el dashboard solo
+    # cuenta los predios que hayan tenido lecturas, facturas o pagos después de migrar
+
+
+def downgrade():
+    op.drop_table('recaudo_diario')
+    op.drop_table('cartera_sectores')
+    op.drop_table('cartera_predios')
@@ -0,0 +1,26 @@
+"""Tarifas versionadas por periodo
+
+Revision ID: 4f2a9c7e1b30
+Revises: dcee6c10b1be
+Create Date: 2026-10-17 09:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c7e1b30'
+down_revision = 'dcee6c10b1be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tarifas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('valor_m3', sa.Float(), nullable=False, server_default='1200.0'))
+
+
+def downgrade():
+    with op.batch_alter_table('tarifas', schema=None) as batch_op:
+        batch_op.drop_column('valor_m3')
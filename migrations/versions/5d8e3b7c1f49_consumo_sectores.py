@@ -0,0 +1,41 @@
+"""Consumo por periodo y sector
+
+Revision ID: 5d8e3b7c1f49
+Revises: 3c9a6f2d8b15
+Create Date: 2026-10-18 17:26:44.518802
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e3b7c1f49'
+down_revision = '3c9a6f2d8b15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya la tabla al importar la aplicación
+    if not sa.inspect(op.get_bind()).has_table('consumo_sectores'):
+        op.create_table('consumo_sectores',
+            sa.Column('anio', sa.Integer(), nullable=False),
+            sa.Column('mes', sa.Integer(), nullable=False),
+            sa.Column('sector', sa.String(length=50), nullable=False),
+            sa.Column('lecturas', sa.Integer(), nullable=True),
+            sa.Column('medidores_activos', sa.Integer(), nullable=True),
+            sa.Column('total', sa.Float(), nullable=True),
+            sa.Column('promedio', sa.Float(), nullable=True),
+            sa.Column('p50', sa.Float(), nullable=True),
+            sa.Column('p90', sa.Float(), nullable=True),
+            sa.Column('p95', sa.Float(), nullable=True),
+            sa.Column('maximo', sa.Float(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('anio', 'mes', 'sector')
+        )
+    # Los periodos anteriores se llenan con 'flask recalcular-consumo-sectores'
+
+
+def downgrade():
+    op.drop_table('consumo_sectores')
@@ -0,0 +1,44 @@
+"""Estadísticas de consumo por predio
+
+Revision ID: 6b2e9d4a1c80
+Revises: a4d9e2c7f015
+Create Date: 2026-10-18 15:20:08.114392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e9d4a1c80'
+down_revision = 'a4d9e2c7f015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya la tabla al importar la aplicación
+    if not sa.inspect(op.get_bind()).has_table('estadisticas_consumo'):
+        op.create_table('estadisticas_consumo',
+            sa.Column('predio_id', sa.Integer(), nullable=False),
+            sa.Column('ultimo_anio', sa.Integer(), nullable=True),
+            sa.Column('ultimo_mes', sa.Integer(), nullable=True),
+            sa.Column('ultimo_consumo', sa.Float(), nullable=True),
+            sa.Column('lecturas_base', sa.Integer(), nullable=True),
+            sa.Column('promedio_3', sa.Float(), nullable=True),
+            sa.Column('desviacion_3', sa.Float(), nullable=True),
+            sa.Column('promedio_6', sa.Float(), nullable=True),
+            sa.Column('desviacion_6', sa.Float(), nullable=True),
+            sa.Column('promedio_12', sa.Float(), nullable=True),
+            sa.Column('desviacion_12', sa.Float(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['predio_id'], ['predios.id'], ),
+            sa.PrimaryKeyConstraint('predio_id')
+        )
+        op.create_index('ix_estadisticas_consumo_periodo', 'estadisticas_consumo', ['ultimo_anio', 'ultimo_mes'])
+    # Las estadísticas se llenan con 'flask recalcular-estadisticas'
+
+
+def downgrade():
+    op.drop_index('ix_estadisticas_consumo_periodo', table_name='estadisticas_consumo')
+    op.drop_table('estadisticas_consumo')
@@ -0,0 +1,46 @@
+"""Indices para las consultas frecuentes y una lectura por predio y periodo
+
+Revision ID: 7b1d3e5a9c42
+Revises: 4f2a9c7e1b30
+Create Date: 2026-10-17 11:40:03.227115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b1d3e5a9c42'
+down_revision = '4f2a9c7e1b30'
+branch_labels = None
+depends_on = None
+
+
+# if_not_exists: las bases creadas con db.create_all() ya traen estos índices
+INDICES = [
+    ('lecturas', 'uq_lecturas_predio_periodo', ['predio_id', 'anio', 'mes'], True),
+    ('lecturas', 'ix_lecturas_predio_id', ['predio_id', 'id'], False),
+    ('lecturas', 'ix_lecturas_periodo', ['anio', 'mes'], False),
+    ('factura', 'ix_factura_lectura_id', ['lectura_id'], False),
+    ('factura', 'ix_factura_estado_fecha_pago', ['estado', 'fecha_pago'], False),
+]
+
+
+def upgrade():
+    # El índice único no se puede crear si ya hay lecturas repetidas en un periodo
+    repetidas = op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM (SELECT 1 FROM lecturas GROUP BY predio_id, anio, mes HAVING count(*) > 1)"
+    )).scalar()
+    if repetidas:
+        raise RuntimeError(
+            f"Hay {repetidas} combinaciones predio/periodo con más de una lectura. "
+            "Depúrelas antes de aplicar esta migración."
+        )
+
+    for tabla, nombre, columnas, unico in INDICES:
+        op.create_index(nombre, tabla, columnas, unique=unico, if_not_exists=True)
+
+
+def downgrade():
+    for tabla, nombre, columnas, unico in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla, if_exists=True)
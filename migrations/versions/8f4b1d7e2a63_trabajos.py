@@ -0,0 +1,56 @@
+"""Trabajos en segundo plano con el proceso que los corre y su latido
+
+Revision ID: 8f4b1d7e2a63
+Revises: 1e7c5a9b3d26
+Create Date: 2026-10-18 16:05:33.402917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4b1d7e2a63'
+down_revision = '1e7c5a9b3d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya la tabla al importar la aplicación, con o sin las
+    # columnas del latido (ver trabajos.py)
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('trabajos'):
+        op.create_table('trabajos',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('tipo', sa.String(length=50), nullable=False),
+            sa.Column('estado', sa.String(length=20), nullable=True),
+            sa.Column('total', sa.Integer(), nullable=True),
+            sa.Column('procesados', sa.Integer(), nullable=True),
+            sa.Column('exitos', sa.Integer(), nullable=True),
+            sa.Column('errores', sa.Integer(), nullable=True),
+            sa.Column('mensaje', sa.String(length=500), nullable=True),
+            sa.Column('carga_id', sa.Integer(), nullable=True),
+            sa.Column('usuario_id', sa.Integer(), nullable=True),
+            sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+            sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+            sa.Column('proceso', sa.String(length=100), nullable=True),
+            sa.Column('latido', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['carga_id'], ['cargas_masivas.id'], ),
+            sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        return
+
+    columnas = {c['name'] for c in inspector.get_columns('trabajos')}
+    with op.batch_alter_table('trabajos', schema=None) as batch_op:
+        if 'proceso' not in columnas:
+            batch_op.add_column(sa.Column('proceso', sa.String(length=100), nullable=True))
+        if 'latido' not in columnas:
+            batch_op.add_column(sa.Column('latido', sa.DateTime(), nullable=True))
+    # Los trabajos que ya estaban sin latido se dan por interrumpidos al arrancar
+
+
+def downgrade():
+    op.drop_table('trabajos')
@@ -0,0 +1,49 @@
+"""Pagos en caja como entidad propia
+
+Revision ID: 9c4e2f81a6d7
+Revises: 7b1d3e5a9c42
+Create Date: 2026-10-17 15:02:51.804417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e2f81a6d7'
+down_revision = '7b1d3e5a9c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() pudo haber creado ya la tabla al importar la aplicación
+    if not sa.inspect(op.get_bind()).has_table('pagos'):
+        op.create_table('pagos',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('predio_id', sa.Integer(), nullable=False),
+            sa.Column('usuario_id', sa.Integer(), nullable=True),
+            sa.Column('metodo_pago', sa.String(length=50), nullable=True),
+            sa.Column('total', sa.Float(), nullable=False),
+            sa.Column('meses', sa.Integer(), nullable=True),
+            sa.Column('fecha', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['predio_id'], ['predios.id'], ),
+            sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_pagos_predio_id', 'pagos', ['predio_id'])
+
+    with op.batch_alter_table('factura', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pago_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_factura_pago_id', 'pagos', ['pago_id'], ['id'])
+        batch_op.create_index('ix_factura_pago_id', ['pago_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('factura', schema=None) as batch_op:
+        batch_op.drop_index('ix_factura_pago_id')
+        batch_op.drop_constraint('fk_factura_pago_id', type_='foreignkey')
+        batch_op.drop_column('pago_id')
+
+    op.drop_index('ix_pagos_predio_id', table_name='pagos')
+    op.drop_table('pagos')
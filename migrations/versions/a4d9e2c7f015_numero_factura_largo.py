@@ -0,0 +1,30 @@
+"""Número de factura de hasta 40 caracteres
+
+Revision ID: a4d9e2c7f015
+Revises: f3c8a1d6b274
+Create Date: 2026-10-18 14:02:17.306418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e2c7f015'
+down_revision = 'f3c8a1d6b274'
+branch_labels = None
+depends_on = None
+
+
+# 'FAC-2025-CTA-000001-1' ya pasa de 20. SQLite no aplica el largo de VARCHAR (y cambiarlo
+# obligaría a reconstruir la tabla); los demás motores rechazaban el insert
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('factura', 'numero_factura', existing_type=sa.String(length=20),
+                        type_=sa.String(length=40), existing_nullable=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('factura', 'numero_factura', existing_type=sa.String(length=40),
+                        type_=sa.String(length=20), existing_nullable=True)
@@ -0,0 +1,44 @@
+"""Cobro idempotente: clave por pago y un solo pago por mes
+
+Revision ID: b5e8d1c3f920
+Revises: 9c4e2f81a6d7
+Create Date: 2026-10-17 16:25:10.377902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e8d1c3f920'
+down_revision = '9c4e2f81a6d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # db.create_all() pudo haber creado 'pagos' con la columna ya incluida
+    columnas = {c['name'] for c in sa.inspect(bind).get_columns('pagos')}
+    if 'clave_idempotencia' not in columnas:
+        with op.batch_alter_table('pagos', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('clave_idempotencia', sa.String(length=64), nullable=True))
+            batch_op.create_unique_constraint('uq_pagos_clave_idempotencia', ['clave_idempotencia'])
+
+    repetidas = bind.execute(sa.text(
+        "SELECT count(*) FROM (SELECT 1 FROM factura WHERE estado = 'Pagado' GROUP BY lectura_id HAVING count(*) > 1)"
+    )).scalar()
+    if repetidas:
+        raise RuntimeError(
+            f"Hay {repetidas} lecturas con más de una factura pagada. "
+            "Depúrelas antes de aplicar esta migración."
+        )
+    op.create_index('uq_factura_lectura_pagada', 'factura', ['lectura_id'], unique=True, if_not_exists=True,
+                    sqlite_where=sa.text("estado = 'Pagado'"), postgresql_where=sa.text("estado = 'Pagado'"))
+
+
+def downgrade():
+    op.drop_index('uq_factura_lectura_pagada', table_name='factura', if_exists=True)
+    with op.batch_alter_table('pagos', schema=None) as batch_op:
+        batch_op.drop_column('clave_idempotencia')
@@ -0,0 +1,56 @@
+"""Estado de cuenta: movimientos y saldo por predio
+
+Revision ID: d2a7c4e9b183
+Revises: b5e8d1c3f920
+Create Date: 2026-10-17 18:10:36.651290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c4e9b183'
+down_revision = 'b5e8d1c3f920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('predios', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('saldo', sa.Float(), nullable=False, server_default='0'))
+
+    # db.create_all() pudo haber creado ya la tabla al importar la aplicación
+    if not sa.inspect(op.get_bind()).has_table('movimientos_cuenta'):
+        op.create_table('movimientos_cuenta',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('predio_id', sa.Integer(), nullable=False),
+            sa.Column('fecha', sa.DateTime(), nullable=True),
+            sa.Column('tipo', sa.String(length=10), nullable=False),
+            sa.Column('descripcion', sa.String(length=100), nullable=True),
+            sa.Column('valor', sa.Float(), nullable=False),
+            sa.Column('saldo', sa.Float(), nullable=False),
+            sa.Column('lectura_id', sa.Integer(), nullable=True),
+            sa.Column('pago_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['lectura_id'], ['lecturas.id'], ),
+            sa.ForeignKeyConstraint(['pago_id'], ['pagos.id'], ),
+            sa.ForeignKeyConstraint(['predio_id'], ['predios.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_movimientos_cuenta_predio', 'movimientos_cuenta', ['predio_id', 'id'])
+        op.create_index('ix_movimientos_cuenta_lectura_id', 'movimientos_cuenta', ['lectura_id'])
+    # Los saldos se llenan con 'flask recalcular-saldos'
+
+
+def downgrade():
+    op.drop_index('ix_movimientos_cuenta_lectura_id', table_name='movimientos_cuenta')
+    op.drop_index('ix_movimientos_cuenta_predio', table_name='movimientos_cuenta')
+    op.drop_table('movimientos_cuenta')
+    # En SQLite la tabla predios se reconstruye y los triggers de búsqueda (busqueda.py) no lo
+    # permiten; se quitan aquí y la aplicación los vuelve a crear al iniciar
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('busqueda_socio_ai', 'busqueda_socio_au', 'busqueda_socio_ad',
+                        'busqueda_predio_ai', 'busqueda_predio_au', 'busqueda_predio_ad'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    with op.batch_alter_table('predios', schema=None) as batch_op:
+        batch_op.drop_column('saldo')
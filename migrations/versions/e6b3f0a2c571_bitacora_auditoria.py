@@ -0,0 +1,44 @@
+"""Bitácora de auditoría: ruta e índices para el visor
+
+Revision ID: e6b3f0a2c571
+Revises: d2a7c4e9b183
+Create Date: 2026-10-17 20:05:12.418903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3f0a2c571'
+down_revision = 'd2a7c4e9b183'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # La tabla solo la creaba db.create_all(); puede no existir o no tener la columna nueva
+    if not sa.inspect(bind).has_table('auditoria_log'):
+        op.create_table('auditoria_log',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('usuario_id', sa.Integer(), nullable=True),
+            sa.Column('accion', sa.String(length=255), nullable=True),
+            sa.Column('ruta', sa.String(length=100), nullable=True),
+            sa.Column('fecha', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['usuario_id'], ['usuario.id'], ),
+            sa.PrimaryKeyConstraint('id')
+        )
+    elif 'ruta' not in {c['name'] for c in sa.inspect(bind).get_columns('auditoria_log')}:
+        with op.batch_alter_table('auditoria_log', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('ruta', sa.String(length=100), nullable=True))
+
+    op.create_index('ix_auditoria_log_usuario', 'auditoria_log', ['usuario_id', 'id'], if_not_exists=True)
+    op.create_index('ix_auditoria_log_ruta', 'auditoria_log', ['ruta', 'id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_auditoria_log_ruta', table_name='auditoria_log')
+    op.drop_index('ix_auditoria_log_usuario', table_name='auditoria_log')
+    with op.batch_alter_table('auditoria_log', schema=None) as batch_op:
+        batch_op.drop_column('ruta')
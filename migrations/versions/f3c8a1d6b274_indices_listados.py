@@ -0,0 +1,33 @@
+"""Índices de los listados de socios y de los predios de cada socio
+
+Revision ID: f3c8a1d6b274
+Revises: e6b3f0a2c571
+Create Date: 2026-10-18 09:12:40.551206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a1d6b274'
+down_revision = 'e6b3f0a2c571'
+branch_labels = None
+depends_on = None
+
+
+# if_not_exists: las bases creadas con db.create_all() ya traen estos índices
+INDICES = [
+    ('socios', 'ix_socios_nombre', ['nombre', 'id']),
+    ('predios', 'ix_predios_socio_id', ['socio_id']),
+]
+
+
+def upgrade():
+    for tabla, nombre, columnas in INDICES:
+        op.create_index(nombre, tabla, columnas, if_not_exists=True)
+
+
+def downgrade():
+    for tabla, nombre, columnas in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla, if_exists=True)
@@ -1,9 +1,12 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+from basedatos import SesionAcueducto
+
+db = SQLAlchemy(session_options={'class_': SesionAcueducto})
 
 class Socio(db.Model):
     __tablename__ = 'socios'
@@ -16,6 +19,8 @@ class Socio(db.Model):
     # Relación: Un socio puede tener varios predios
     predios = db.relationship('Predio', backref='dueno', lazy=True)
 
+    __table_args__ = (db.Index('ix_socios_nombre', 'nombre', 'id'),) # Listado de socios por nombre
+
 class Predio(db.Model):
     __tablename__ = 'predios'
     id = db.Column(db.Integer, primary_key=True)
@@ -24,10 +29,13 @@ class Predio(db.Model):
     sector = db.Column(db.String(50))  # Útil para análisis de racionamiento
     estado = db.Column(db.String(20), default='Activo') # Activo, Suspendido, Corte
     socio_id = db.Column(db.Integer, db.ForeignKey('socios.id'), nullable=False)
+    saldo = db.Column(db.Float, nullable=False, default=0.0, server_default='0') # Lo que debe hoy; lo mantiene saldos.py
     
     # Relación: Un predio tiene muchas lecturas
     lecturas = db.relationship('Lectura', backref='predio', lazy=True)
 
+    __table_args__ = (db.Index('ix_predios_socio_id', 'socio_id'),) # Predios de un socio
+
 class Lectura(db.Model):
     __tablename__ = 'lecturas'
     id = db.Column(db.Integer, primary_key=True)
@@ -39,14 +47,38 @@ class Lectura(db.Model):
     consumo_mes = db.Column(db.Float, nullable=False) # Calculado: Actual - Anterior
     fecha_toma = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('uq_lecturas_predio_periodo', 'predio_id', 'anio', 'mes', unique=True), # Una lectura por predio y periodo
+        db.Index('ix_lecturas_predio_id', 'predio_id', 'id'), # Última lectura del predio
+        db.Index('ix_lecturas_periodo', 'anio', 'mes'),
+    )
+
 class ConfiguracionTarifa(db.Model):
+    # Versiones de tarifas: cada fila rige desde el periodo de 'fecha_desde' (día 1 del mes)
+    # hasta la siguiente versión. Las filas no se editan; un cambio de tarifas crea una fila nueva.
     __tablename__ = 'tarifas'
     id = db.Column(db.Integer, primary_key=True)
     cargo_fijo = db.Column(db.Float, nullable=False)
+    valor_m3 = db.Column(db.Float, nullable=False, default=1200.0) # Valor del m3 dentro del límite básico
     limite_basico = db.Column(db.Float, nullable=False) # m3 incluidos
     valor_m3_extra = db.Column(db.Float, nullable=False)
     fecha_desde = db.Column(db.DateTime, default=datetime.utcnow)
-    activa = db.Column(db.Boolean, default=True)
+    activa = db.Column(db.Boolean, default=True) # False cuando otra versión la reemplaza para el mismo periodo
+
+    @property
+    def valor_m3_exceso(self):
+        # Mismo nombre que usa el motor de tarifas (facturacion.py)
+        return self.valor_m3_extra
+
+# Lo que werkzeug escribe antes del primer '$' con cada PASSWORD_HASH_METODO. No es el texto
+# configurado: 'pbkdf2:sha256' queda como 'pbkdf2:sha256:1000000' y 'scrypt' como 'scrypt:32768:8:1'
+_prefijos_hash = {}
+
+def _prefijo_hash(metodo):
+    prefijo = _prefijos_hash.get(metodo)
+    if prefijo is None:
+        prefijo = _prefijos_hash[metodo] = generate_password_hash('', metodo).split('$', 1)[0]
+    return prefijo
 
 class Usuario(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,16 +87,28 @@ class Usuario(db.Model, UserMixin):
     rol = db.Column(db.String(20), default='operador') # admin, operador, auditor
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # El costo del hash se ajusta con PASSWORD_HASH_METODO (ver app.py)
+        self.password_hash = generate_password_hash(password, current_app.config['PASSWORD_HASH_METODO'])
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
+
+    def hash_desactualizado(self):
+        # Hash creado con otro método o costo: se rehace en el siguiente inicio de sesión
+        return self.password_hash.split('$', 1)[0] != _prefijo_hash(current_app.config['PASSWORD_HASH_METODO'])
     
 class AuditoriaLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
     accion = db.Column(db.String(255))
-    fecha = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    ruta = db.Column(db.String(100)) # Endpoint de Flask que hizo el cambio (o el trabajo en segundo plano)
+    fecha = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # El visor de auditoría filtra por usuario o por ruta y pagina por id
+        db.Index('ix_auditoria_log_usuario', 'usuario_id', 'id'),
+        db.Index('ix_auditoria_log_ruta', 'ruta', 'id'),
+    )
 
 class Configuracion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -82,12 +126,156 @@ class Factura(db.Model):
     # IMPORTANTE: Cambia 'Lectura.id' por 'lectura.id' (en minúsculas)
     lectura_id = db.Column(db.Integer, db.ForeignKey('lecturas.id'), nullable=False)
     
-    numero_factura = db.Column(db.String(20), unique=True)
+    numero_factura = db.Column(db.String(40), unique=True) # FAC-{anio}-{cuenta}-{lectura}: la cuenta sola llega a 20
     total_a_pagar = db.Column(db.Float)
     estado = db.Column(db.String(20), default='Pendiente')
     fecha_emision = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     fecha_pago = db.Column(db.DateTime, nullable=True)
     metodo_pago = db.Column(db.String(50), nullable=True)
+    pago_id = db.Column(db.Integer, db.ForeignKey('pagos.id'), nullable=True) # Pago (recibo) que la canceló
     
     # La relación sí puede usar el nombre de la Clase (Mayúscula)
-    lectura = db.relationship('Lectura', backref='factura_asociada')
\ No newline at end of file
+    lectura = db.relationship('Lectura', backref='factura_asociada')
+
+    __table_args__ = (
+        db.Index('ix_factura_lectura_id', 'lectura_id'), # Todos los outer join Lectura -> Factura
+        db.Index('ix_factura_estado_fecha_pago', 'estado', 'fecha_pago'), # Recaudo del dashboard
+        db.Index('ix_factura_pago_id', 'pago_id'), # Facturas de un recibo
+        # Un mes se paga una sola vez: si dos cajas lo cobran a la vez, la segunda falla al insertar
+        db.Index('uq_factura_lectura_pagada', 'lectura_id', unique=True,
+                 sqlite_where=db.text("estado = 'Pagado'"), postgresql_where=db.text("estado = 'Pagado'")),
+    )
+
+class Pago(db.Model):
+    # Un pago en caja (un recibo). Agrupa las facturas de los meses que se cancelaron juntos.
+    __tablename__ = 'pagos'
+    id = db.Column(db.Integer, primary_key=True)
+    predio_id = db.Column(db.Integer, db.ForeignKey('predios.id'), nullable=False, index=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id')) # Cajero
+    metodo_pago = db.Column(db.String(50), default='Efectivo')
+    total = db.Column(db.Float, nullable=False)
+    meses = db.Column(db.Integer, default=0)
+    fecha = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    clave_idempotencia = db.Column(db.String(64), unique=True) # Enviada por el formulario del POS: un doble clic no cobra dos veces
+
+    predio = db.relationship('Predio')
+    facturas = db.relationship('Factura', backref='pago', lazy=True)
+
+class MovimientoCuenta(db.Model):
+    # Estado de cuenta del predio: un cargo por cada mes cobrado y un abono por cada pago.
+    # 'saldo' es el saldo del predio justo después del movimiento (ver saldos.py).
+    __tablename__ = 'movimientos_cuenta'
+    id = db.Column(db.Integer, primary_key=True)
+    predio_id = db.Column(db.Integer, db.ForeignKey('predios.id'), nullable=False)
+    fecha = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    tipo = db.Column(db.String(10), nullable=False) # Cargo, Ajuste, Abono
+    descripcion = db.Column(db.String(100))
+    valor = db.Column(db.Float, nullable=False) # Positivo para cargos, negativo para abonos
+    saldo = db.Column(db.Float, nullable=False)
+    lectura_id = db.Column(db.Integer, db.ForeignKey('lecturas.id'), nullable=True, index=True) # Solo cargos y ajustes
+    pago_id = db.Column(db.Integer, db.ForeignKey('pagos.id'), nullable=True) # Solo abonos
+
+    __table_args__ = (db.Index('ix_movimientos_cuenta_predio', 'predio_id', 'id'),)
+
+class CargaMasiva(db.Model):
+    __tablename__ = 'cargas_masivas'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False) # lecturas, socios
+    nombre_archivo = db.Column(db.String(255))
+    huella = db.Column(db.String(64), index=True) # sha256 del archivo: permite retomar una carga interrumpida
+    estado = db.Column(db.String(20), default='En proceso') # En proceso, Interrumpida, Completada
+    filas_procesadas = db.Column(db.Integer, default=0) # Filas ya confirmadas (commit) en la base de datos
+    exitos = db.Column(db.Integer, default=0)
+    total_errores = db.Column(db.Integer, default=0)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
+    fecha_inicio = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    errores = db.relationship('ErrorCarga', backref='carga', lazy=True)
+
+class ErrorCarga(db.Model):
+    __tablename__ = 'errores_carga'
+    id = db.Column(db.Integer, primary_key=True)
+    carga_id = db.Column(db.Integer, db.ForeignKey('cargas_masivas.id'), nullable=False, index=True)
+    fila = db.Column(db.Integer) # Número de fila de datos dentro del archivo (sin contar el encabezado)
+    mensaje = db.Column(db.String(255))
+
+class Trabajo(db.Model):
+    __tablename__ = 'trabajos'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False) # carga_lecturas, carga_socios, generar_periodo, emitir_facturas
+    estado = db.Column(db.String(20), default='En cola') # En cola, En proceso, Completado, Fallido, Interrumpido
+    total = db.Column(db.Integer, default=0)
+    procesados = db.Column(db.Integer, default=0)
+    exitos = db.Column(db.Integer, default=0)
+    errores = db.Column(db.Integer, default=0)
+    mensaje = db.Column(db.String(500))
+    carga_id = db.Column(db.Integer, db.ForeignKey('cargas_masivas.id'), nullable=True) # Solo para cargas masivas
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'))
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_inicio = db.Column(db.DateTime, nullable=True)
+    fecha_fin = db.Column(db.DateTime, nullable=True)
+    proceso = db.Column(db.String(100)) # equipo:pid:aleatorio del proceso que lo corre (ver trabajos.py)
+    latido = db.Column(db.DateTime) # Última señal de vida de ese proceso
+
+class EstadisticaConsumo(db.Model):
+    # Línea base de consumo por predio, mantenida al registrar cada lectura (ver estadisticas.py).
+    # Los promedios y desviaciones se calculan sobre las lecturas ANTERIORES a la última,
+    # que es contra la que se compara en la auditoría.
+    __tablename__ = 'estadisticas_consumo'
+    predio_id = db.Column(db.Integer, db.ForeignKey('predios.id'), primary_key=True)
+    ultimo_anio = db.Column(db.Integer)
+    ultimo_mes = db.Column(db.Integer)
+    ultimo_consumo = db.Column(db.Float)
+    lecturas_base = db.Column(db.Integer, default=0) # Lecturas anteriores disponibles (máximo 12)
+    promedio_3 = db.Column(db.Float)
+    desviacion_3 = db.Column(db.Float)
+    promedio_6 = db.Column(db.Float)
+    desviacion_6 = db.Column(db.Float)
+    promedio_12 = db.Column(db.Float)
+    desviacion_12 = db.Column(db.Float)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_estadisticas_consumo_periodo', 'ultimo_anio', 'ultimo_mes'),)
+
+# --- RESUMEN DE CARTERA (ver cartera.py) ---
+# Se mantiene al escribir lecturas, facturas y pagos para que el dashboard no tenga que
+# recorrer todo el historial. 'sector' vacío ('') agrupa los predios sin sector.
+
+class CarteraPredio(db.Model):
+    __tablename__ = 'cartera_predios'
+    predio_id = db.Column(db.Integer, db.ForeignKey('predios.id'), primary_key=True)
+    sector = db.Column(db.String(50), nullable=False, default='') # Sector con el que se sumó a cartera_sectores
+    lecturas_pendientes = db.Column(db.Integer, default=0) # Lecturas sin factura pagada
+    saldo_pendiente = db.Column(db.Float, default=0.0) # Facturado y no pagado
+
+class CarteraSector(db.Model):
+    __tablename__ = 'cartera_sectores'
+    sector = db.Column(db.String(50), primary_key=True)
+    predios = db.Column(db.Integer, default=0)
+    predios_mora = db.Column(db.Integer, default=0)
+    lecturas_pendientes = db.Column(db.Integer, default=0)
+    saldo_pendiente = db.Column(db.Float, default=0.0)
+
+class RecaudoDiario(db.Model):
+    __tablename__ = 'recaudo_diario'
+    fecha = db.Column(db.Date, primary_key=True) # Día del pago (UTC, igual que Factura.fecha_pago)
+    sector = db.Column(db.String(50), primary_key=True)
+    pagos = db.Column(db.Integer, default=0) # Meses (facturas) pagados
+    total = db.Column(db.Float, default=0.0)
+
+class ConsumoSector(db.Model):
+    # Consumo agregado por periodo y sector para el análisis de racionamiento (ver estadisticas.py)
+    __tablename__ = 'consumo_sectores'
+    anio = db.Column(db.Integer, primary_key=True)
+    mes = db.Column(db.Integer, primary_key=True)
+    sector = db.Column(db.String(50), primary_key=True) # '' para predios sin sector
+    lecturas = db.Column(db.Integer, default=0) # Medidores leídos en el periodo
+    medidores_activos = db.Column(db.Integer, default=0) # Medidores con consumo mayor a cero
+    total = db.Column(db.Float, default=0.0)
+    promedio = db.Column(db.Float)
+    p50 = db.Column(db.Float)
+    p90 = db.Column(db.Float)
+    p95 = db.Column(db.Float)
+    maximo = db.Column(db.Float)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,41 @@
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+# Paginación por clave (keyset): en lugar de OFFSET, cada página arranca justo después de
+# la última fila de la anterior. El costo de una página no crece con el número de registros.
+
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(list(valores)).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None # Cursor manipulado o viejo: se vuelve a la primera página
+
+
+def paginar(consulta, columnas, clave, cursor, tamano, descendente=False):
+    """Devuelve (filas, cursor_siguiente) de una consulta ordenada por 'columnas'.
+
+    'columnas' debe identificar cada fila de forma única (la última suele ser el id) y
+    'clave(fila)' devuelve los valores de esas columnas para armar el siguiente cursor.
+    Con descendente=True las páginas van de los valores más altos a los más bajos.
+    """
+    despues = decodificar_cursor(cursor)
+    if despues is not None and len(despues) == len(columnas):
+        if descendente:
+            consulta = consulta.filter(tuple_(*columnas) < tuple_(*despues))
+        else:
+            consulta = consulta.filter(tuple_(*columnas) > tuple_(*despues))
+
+    # Pedimos una fila de más solo para saber si hay página siguiente
+    orden = [c.desc() for c in columnas] if descendente else columnas
+    filas = consulta.order_by(*orden).limit(tamano + 1).all()
+    siguiente = codificar_cursor(clave(filas[tamano - 1])) if len(filas) > tamano else None
+    return filas[:tamano], siguiente
@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+
+from models import db, Predio, Lectura, Factura, Pago, MovimientoCuenta
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from facturacion import totales_por_periodo
+from cartera import actualizar_cartera, registrar_recaudo
+from saldos import abonar_pago
+import metricas
+
+
+def pendientes(predio_id):
+    """[(lectura, factura_pendiente o None, total)] de los meses sin pagar del predio, del más reciente al más antiguo.
+
+    Si el mes ya fue facturado se cobra el valor de su factura; si no, el de su cargo en el
+    estado de cuenta. Solo las lecturas anteriores al estado de cuenta se recalculan con la tarifa.
+    """
+    pagadas = db.aliased(Factura)
+    pagada = db.session.query(pagadas.id).filter(
+        pagadas.lectura_id == Lectura.id, pagadas.estado == 'Pagado'
+    ).exists()
+    filas = db.session.query(Lectura, Factura, MovimientoCuenta.valor).outerjoin(
+        Factura, db.and_(Factura.lectura_id == Lectura.id, Factura.estado == 'Pendiente')
+    ).outerjoin(
+        MovimientoCuenta, db.and_(MovimientoCuenta.lectura_id == Lectura.id, MovimientoCuenta.tipo == 'Cargo')
+    ).filter(Lectura.predio_id == predio_id, ~pagada).order_by(
+        Lectura.anio.desc(), Lectura.mes.desc()
+    ).all()
+
+    sin_valor = [lectura for lectura, factura, cargo in filas if factura is None and cargo is None]
+    calculados = dict(zip((l.id for l in sin_valor), totales_por_periodo(sin_valor)))
+    return [
+        (lectura, factura, factura.total_a_pagar if factura else cargo if cargo is not None else calculados[lectura.id])
+        for lectura, factura, cargo in filas
+    ]
+
+
+def registrar_pago(predio, usuario_id, metodo_pago='Efectivo', lectura_ids=None, clave=None):
+    """Cobra los meses pendientes del predio (o exactamente 'lectura_ids') en un solo Pago. No hace commit.
+
+    Las facturas pendientes se marcan pagadas y los meses sin facturar reciben su factura,
+    todas con pago_id. Devuelve el Pago, o None si no había nada que cobrar. Lanza
+    ValueError si alguno de los meses pedidos ya no está pendiente.
+    """
+    # Lo primero es una escritura: toma el bloqueo (la fila del predio; en SQLite, la base
+    # entera) antes de leer los pendientes. Hasta el commit, ni otra caja ni la facturación
+    # del periodo pueden facturar o cobrar esos meses entre la lectura y el cobro.
+    db.session.execute(update(Predio).where(Predio.id == predio.id).values(
+        saldo=Predio.saldo
+    ).execution_options(synchronize_session=False))
+    cobrar = pendientes(predio.id)
+    if lectura_ids is not None:
+        cobrar = [p for p in cobrar if p[0].id in lectura_ids]
+        if len(cobrar) != len(lectura_ids):
+            raise ValueError("Alguno de los meses ya fue cobrado. Revise el estado de cuenta.")
+    if not cobrar:
+        return None
+
+    # Desde aquí solo escrituras
+    ahora = datetime.now(timezone.utc)
+    pago = Pago(predio_id=predio.id, usuario_id=usuario_id, metodo_pago=metodo_pago, clave_idempotencia=clave,
+                total=sum(total for _, _, total in cobrar), meses=len(cobrar), fecha=ahora)
+    db.session.add(pago)
+    db.session.flush()
+
+    # Reclamo atómico: solo se marcan las facturas que siguen pendientes. Si otra caja se
+    # adelantó con alguna, el conteo no cuadra y se deshace todo.
+    facturadas = [factura.id for _, factura, _ in cobrar if factura]
+    if facturadas:
+        marcadas = db.session.execute(update(Factura).where(
+            Factura.id.in_(facturadas), Factura.estado == 'Pendiente'
+        ).values(
+            estado='Pagado', fecha_pago=ahora, metodo_pago=metodo_pago, pago_id=pago.id
+        ).execution_options(synchronize_session=False)).rowcount
+        if marcadas != len(facturadas):
+            raise ValueError("Otra caja acaba de cobrar alguno de estos meses. Revise el estado de cuenta.")
+
+    # Los meses sin factura quedan protegidos por uq_factura_lectura_pagada
+    nuevas = [{
+        'lectura_id': lectura.id,
+        'numero_factura': f"REC-{pago.id}-{lectura.id}",
+        'total_a_pagar': total,
+        'estado': 'Pagado',
+        'fecha_emision': ahora,
+        'fecha_pago': ahora,
+        'metodo_pago': metodo_pago,
+        'pago_id': pago.id
+    } for lectura, factura, total in cobrar if factura is None]
+    if nuevas:
+        db.session.execute(insert(Factura), nuevas)
+        metricas.contar(metricas.FACTURAS, len(nuevas), origen='caja')
+
+    abonar_pago(pago)
+    actualizar_cartera([predio.id])
+    registrar_recaudo(predio.sector, pago.total, pago.meses, ahora.date())
+    metricas.contar(metricas.PAGOS)
+    metricas.contar(metricas.RECAUDO, pago.total)
+    return pago
+
+
+def cobrar(predio, usuario_id, metodo_pago='Efectivo', lectura_ids=None, clave=None):
+    """Registra el pago en su propia transacción (hace commit) y devuelve el Pago o None.
+
+    Con 'clave', repetir la misma petición (doble clic, reintento del navegador) devuelve el
+    pago ya registrado en lugar de cobrar otra vez. Lanza ValueError si otra caja cobró
+    alguno de los meses primero.
+    """
+    if clave:
+        existente = Pago.query.filter_by(clave_idempotencia=clave).first()
+        if existente:
+            return existente
+
+    try:
+        pago = registrar_pago(predio, usuario_id, metodo_pago, lectura_ids, clave)
+        db.session.commit()
+        return pago
+    except (ValueError, IntegrityError) as e:
+        # Otra petición ganó la carrera: con la misma clave (es el mismo pago, que esta esperó
+        # detrás del bloqueo) o por los mismos meses
+        db.session.rollback()
+        existente = Pago.query.filter_by(clave_idempotencia=clave).first() if clave else None
+        if existente:
+            return existente
+        if isinstance(e, ValueError):
+            raise
+        raise ValueError("Otra caja acaba de cobrar alguno de estos meses. Revise el estado de cuenta.")
@@ -0,0 +1,68 @@
+import re
+
+from models import db, Lectura, Factura, AuditoriaLog
+from sqlalchemy import select, text
+
+# Consultas frecuentes de la aplicación, con valores de ejemplo. Solo importa la forma:
+# cada una debe resolverse con un índice (SEARCH) y nunca recorriendo la tabla completa (SCAN).
+# Si se agrega una consulta caliente nueva, conviene sumarla aquí. tests/test_planes.py hace
+# la misma revisión sobre las sentencias que ejecutan de verdad las rutas y funciones calientes.
+CONSULTAS = {
+    'ultima_lectura_predio': select(Lectura.id, Lectura.lectura_actual).where(
+        Lectura.predio_id == 1
+    ).order_by(Lectura.id.desc()).limit(1),
+    'historial_predio': select(Lectura.id).where(
+        Lectura.predio_id == 1
+    ).order_by(Lectura.anio.desc(), Lectura.mes.desc()),
+    'lectura_predio_periodo': select(Lectura.id).where(
+        Lectura.predio_id == 1, Lectura.anio == 2026, Lectura.mes == 1
+    ),
+    'lecturas_periodo': select(Lectura.id).where(Lectura.anio == 2026, Lectura.mes == 1),
+    'pendientes_predio': select(Lectura.id).outerjoin(Factura).where(
+        Lectura.predio_id == 1, db.or_(Factura.id == None, Factura.estado != 'Pagado')
+    ),
+    'sin_factura_periodo': select(Lectura.id).outerjoin(Factura).where(
+        Lectura.anio == 2026, Lectura.mes == 1, Factura.id == None
+    ),
+    'factura_de_lectura': select(Factura.id).where(Factura.lectura_id == 1),
+    'recaudo_mes': select(db.func.sum(Factura.total_a_pagar)).where(
+        Factura.estado == 'Pagado',
+        Factura.fecha_pago >= '2026-01-01', Factura.fecha_pago < '2026-02-01'
+    ),
+    'facturas_de_pago': select(Factura.id).where(Factura.pago_id == 1),
+    'bitacora_usuario': select(AuditoriaLog.id).where(
+        AuditoriaLog.usuario_id == 1, AuditoriaLog.id < 1000
+    ).order_by(AuditoriaLog.id.desc()).limit(51),
+}
+
+# "SCAN lecturas" o "SCAN lecturas USING INDEX ..." recorren la tabla entera; las subconsultas
+# aparecen como "SCAN (subquery-1)" y no cuentan. Los alias de SQLAlchemy (facturas_1) se
+# reportan con el nombre de la tabla.
+_RECORRIDO = re.compile(r'^SCAN (\w+?)(?:_\d+)?(?: |$)')
+
+
+def plan(consulta):
+    sql = str(consulta.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [fila.detail for fila in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def plan_sql(sentencia, parametros=()):
+    """Plan de una sentencia tal como la envió SQLAlchemy al driver (con sus parámetros)."""
+    return [fila[-1] for fila in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sentencia}", parametros)]
+
+
+def tablas_recorridas(detalle):
+    return [m.group(1) for m in map(_RECORRIDO.match, detalle) if m and m.group(1) != 'CONSTANT']
+
+
+def recorridos(consulta):
+    """Tablas que la consulta recorre completas según el plan de SQLite."""
+    return tablas_recorridas(plan(consulta))
+
+
+def verificar():
+    """Devuelve {nombre: (plan, tablas_recorridas)} de cada consulta frecuente."""
+    resultado = {}
+    for nombre, consulta in CONSULTAS.items():
+        resultado[nombre] = (plan(consulta), recorridos(consulta))
+    return resultado
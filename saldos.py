@@ -0,0 +1,165 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from models import db, Predio, Lectura, Factura, Pago, MovimientoCuenta
+from sqlalchemy import case, func, insert, update
+import facturacion # Módulo y no nombres: facturacion.py también usa este módulo
+
+# --- ESTADO DE CUENTA ---
+# Cada mes cobrado deja un Cargo y cada pago un Abono en movimientos_cuenta, y Predio.saldo
+# se mueve en la misma transacción. Así "cuánto debe" es leer una fila, y el historial de
+# movimientos queda como soporte para reclamos y auditoría. Si al facturar el mes la factura
+# no vale lo mismo que su cargo (la tarifa del periodo cambió después de la lectura), la
+# diferencia queda como un Ajuste.
+
+
+def registrar_movimientos(movimientos):
+    """Aplica los movimientos [{predio_id, tipo, valor, descripcion, lectura_id?, pago_id?, fecha?}].
+
+    Un solo UPDATE ajusta el saldo de todos los predios (saldo = saldo + delta, sin carreras
+    entre cajas) y un insert masivo guarda los movimientos con el saldo resultante. No hace commit.
+    """
+    if not movimientos:
+        return
+    deltas = defaultdict(float)
+    for m in movimientos:
+        deltas[m['predio_id']] += m['valor']
+
+    db.session.execute(update(Predio).where(Predio.id.in_(deltas)).values(
+        saldo=Predio.saldo + case(deltas, value=Predio.id, else_=0.0)
+    ).execution_options(synchronize_session=False))
+    for predio in db.session.identity_map.values():
+        if isinstance(predio, Predio) and predio.id in deltas:
+            db.session.expire(predio, ['saldo'])
+
+    # Con el saldo final de cada predio se reconstruye el saldo tras cada movimiento
+    saldos = dict(db.session.query(Predio.id, Predio.saldo).filter(Predio.id.in_(deltas)))
+    ahora = datetime.now(timezone.utc)
+    filas = []
+    for m in reversed(movimientos):
+        filas.append({
+            'predio_id': m['predio_id'],
+            'fecha': m.get('fecha') or ahora,
+            'tipo': m['tipo'],
+            'descripcion': m.get('descripcion'),
+            'valor': m['valor'],
+            'saldo': saldos[m['predio_id']],
+            'lectura_id': m.get('lectura_id'),
+            'pago_id': m.get('pago_id')
+        })
+        saldos[m['predio_id']] -= m['valor']
+    filas.reverse()
+    db.session.execute(insert(MovimientoCuenta), filas)
+
+
+def cargos_de_lecturas(lecturas, totales=None):
+    # Un Cargo por lectura, con la tarifa de su periodo. 'lecturas': objetos con id, predio_id, anio, mes, consumo_mes
+    if totales is None:
+        totales = facturacion.totales_por_periodo(lecturas)
+    return [{
+        'predio_id': l.predio_id,
+        'tipo': 'Cargo',
+        'valor': total,
+        'descripcion': f"Consumo {l.mes}/{l.anio} ({l.consumo_mes:g} m³)",
+        'lectura_id': l.id
+    } for l, total in zip(lecturas, totales)]
+
+
+def cargar_lecturas(lecturas):
+    registrar_movimientos(cargos_de_lecturas(lecturas))
+
+
+def ajustar_cargos(anio, mes):
+    """Lleva lo cargado por cada lectura facturada del periodo al valor de su factura. No hace commit.
+
+    Devuelve cuántos ajustes registró. Las lecturas sin cargo (anteriores al estado de cuenta) no se tocan.
+    """
+    cargado = func.sum(MovimientoCuenta.valor)
+    filas = db.session.query(
+        Lectura.id, Lectura.predio_id, Factura.numero_factura, Factura.total_a_pagar, cargado
+    ).join(Factura, Factura.lectura_id == Lectura.id).join(
+        MovimientoCuenta, db.and_(MovimientoCuenta.lectura_id == Lectura.id,
+                                  MovimientoCuenta.tipo.in_(('Cargo', 'Ajuste')))
+    ).filter(Lectura.anio == anio, Lectura.mes == mes).group_by(
+        Lectura.id, Lectura.predio_id, Factura.numero_factura, Factura.total_a_pagar
+    ).having(func.abs(Factura.total_a_pagar - cargado) >= 0.005).all()
+
+    registrar_movimientos([{
+        'predio_id': predio_id,
+        'tipo': 'Ajuste',
+        'valor': total - valor_cargado,
+        'descripcion': f"Ajuste al valor de la factura {numero}",
+        'lectura_id': lectura_id
+    } for lectura_id, predio_id, numero, total, valor_cargado in filas])
+    return len(filas)
+
+
+def abonar_pago(pago):
+    registrar_movimientos([{
+        'predio_id': pago.predio_id,
+        'tipo': 'Abono',
+        'valor': -pago.total,
+        'descripcion': f"Pago recibo N° {pago.id} ({pago.meses} meses)",
+        'pago_id': pago.id,
+        'fecha': pago.fecha
+    }])
+
+
+def recalcular_saldos(tamano_lote=500):
+    """Reconstruye movimientos y saldos desde lecturas, facturas y pagos. Devuelve los predios procesados.
+
+    Los meses ya facturados se cargan por el valor de su factura; los demás con la tarifa de
+    su periodo. Los pagos anteriores a la tabla 'pagos' se abonan factura por factura.
+    """
+    db.session.query(MovimientoCuenta).delete()
+    db.session.execute(update(Predio).values(saldo=0.0))
+    db.session.commit()
+
+    procesados, ultimo_id = 0, 0
+    while True:
+        ids = [i for (i,) in db.session.query(Predio.id).filter(Predio.id > ultimo_id)
+               .order_by(Predio.id).limit(tamano_lote)]
+        if not ids:
+            break
+
+        lecturas = db.session.query(Lectura).filter(Lectura.predio_id.in_(ids)).all()
+        facturado = {}
+        for lectura_id, total, estado in db.session.query(
+            Factura.lectura_id, Factura.total_a_pagar, Factura.estado
+        ).join(Lectura).filter(Lectura.predio_id.in_(ids)):
+            if estado == 'Pagado' or lectura_id not in facturado:
+                facturado[lectura_id] = total
+        sin_factura = [l for l in lecturas if l.id not in facturado]
+        facturado.update(zip((l.id for l in sin_factura), facturacion.totales_por_periodo(sin_factura)))
+
+        movimientos = [
+            dict(cargo, fecha=l.fecha_toma)
+            for l, cargo in zip(lecturas, cargos_de_lecturas(lecturas, [facturado[l.id] for l in lecturas]))
+        ]
+        movimientos += [{
+            'predio_id': p.predio_id, 'tipo': 'Abono', 'valor': -p.total, 'pago_id': p.id, 'fecha': p.fecha,
+            'descripcion': f"Pago recibo N° {p.id} ({p.meses} meses)"
+        } for p in Pago.query.filter(Pago.predio_id.in_(ids))]
+        movimientos += [{
+            'predio_id': predio_id, 'tipo': 'Abono', 'valor': -total, 'fecha': fecha,
+            'descripcion': f"Pago factura {numero}"
+        } for predio_id, total, fecha, numero in db.session.query(
+            Lectura.predio_id, Factura.total_a_pagar, Factura.fecha_pago, Factura.numero_factura
+        ).join(Factura.lectura).filter(
+            Lectura.predio_id.in_(ids), Factura.estado == 'Pagado', Factura.pago_id == None
+        )]
+
+        # Orden cronológico dentro de cada predio para que el saldo de cada movimiento tenga sentido
+        movimientos.sort(key=lambda m: (m['predio_id'], _sin_zona(m['fecha'])))
+        registrar_movimientos(movimientos)
+        db.session.commit()
+        procesados += len(ids)
+        ultimo_id = ids[-1]
+    return procesados
+
+
+def _sin_zona(fecha):
+    # SQLite devuelve las fechas sin zona horaria; se comparan todas como UTC ingenuo
+    if fecha is None:
+        return datetime.min
+    return fecha.replace(tzinfo=None) if fecha.tzinfo else fecha
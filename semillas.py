@@ -0,0 +1,243 @@
+import math
+import random
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from models import db, Socio, Predio, Lectura, Factura, Pago, MovimientoCuenta, ConfiguracionTarifa
+from sqlalchemy import event, insert, text
+from facturacion import calcular_totales
+from tarifas import tarifa_para, invalidar as invalidar_tarifas
+from estadisticas import recalcular_todo, recalcular_consumo_sectores
+from cartera import recalcular_cartera
+import busqueda
+
+# --- DATOS DE PRUEBA ---
+# Genera socios, predios y su historia (lecturas, facturas, pagos y estado de cuenta) por
+# lotes de predios, con un insert masivo por tabla y lote. Todo sale de un generador con
+# semilla: dos corridas con los mismos parámetros producen la misma base.
+SECTORES = {'Sector Alto': 3, 'Sector Bajo': 3, 'Centro': 4}
+PREDIOS_POR_LOTE = 2000
+
+# Columnas de cada tabla, en el orden en que generar() arma sus filas (tuplas)
+COLUMNAS = {
+    Socio: ('id', 'nombre', 'cedula', 'telefono', 'fecha_registro'),
+    Predio: ('id', 'numero_cuenta', 'socio_id', 'sector', 'serial_medidor', 'estado', 'saldo'),
+    Lectura: ('id', 'predio_id', 'anio', 'mes', 'fecha_toma', 'lectura_anterior', 'lectura_actual', 'consumo_mes'),
+    Factura: ('id', 'lectura_id', 'numero_factura', 'total_a_pagar', 'estado', 'fecha_emision', 'fecha_pago',
+              'metodo_pago', 'pago_id'),
+    Pago: ('id', 'predio_id', 'usuario_id', 'metodo_pago', 'total', 'meses', 'fecha', 'clave_idempotencia'),
+    MovimientoCuenta: ('predio_id', 'fecha', 'tipo', 'valor', 'saldo', 'descripcion', 'lectura_id', 'pago_id'),
+}
+
+NOMBRES = ['María', 'José', 'Luis', 'Ana', 'Carlos', 'Luz', 'Jorge', 'Carmen', 'Pedro', 'Rosa',
+           'Juan', 'Marta', 'Diego', 'Gloria', 'Andrés', 'Sandra', 'Fabio', 'Blanca', 'Hernán', 'Olga']
+APELLIDOS = ['Gómez', 'Rodríguez', 'López', 'Martínez', 'García', 'Pérez', 'Sánchez', 'Ramírez',
+             'Torres', 'Díaz', 'Vargas', 'Rojas', 'Moreno', 'Castro', 'Ortiz', 'Muñoz', 'Suárez', 'Cárdenas']
+
+
+def interpretar_sectores(texto):
+    """'Centro:4,Sector Alto:3' -> {'Centro': 4.0, 'Sector Alto': 3.0}. Un sector sin peso vale 1."""
+    sectores = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition(':')
+        nombre = nombre.strip()
+        try:
+            peso = float(peso) if peso.strip() else 1.0
+        except ValueError:
+            raise ValueError(f"Peso inválido para el sector '{nombre}': {peso}")
+        if not nombre or peso <= 0:
+            raise ValueError(f"Sector inválido: '{parte.strip()}'")
+        sectores[nombre] = peso
+    return sectores
+
+
+def periodos_anteriores(meses):
+    """Los 'meses' periodos (anio, mes) anteriores al actual, del más antiguo al más reciente."""
+    hoy = datetime.now()
+    actual = hoy.year * 12 + hoy.month - 1
+    return [(i // 12, i % 12 + 1) for i in range(actual - meses, actual)]
+
+
+def _consumos(rng, estacion):
+    # Consumo base del hogar (lognormal) * época del año * variación del mes, con casas
+    # desocupadas, meses sin lectura de consumo y alguna fuga
+    if rng.random() < 0.03:
+        return [0.0] * len(estacion), True
+    base = rng.lognormvariate(2.6, 0.45)
+    consumos = []
+    for factor in estacion:
+        if rng.random() < 0.01:
+            consumos.append(0.0)
+        else:
+            fuga = rng.uniform(2, 4) if rng.random() < 0.005 else 1
+            consumos.append(round(base * factor * rng.lognormvariate(0, 0.18) * fuga, 1))
+    return consumos, False
+
+
+def _insertar(modelo, columnas, filas):
+    # executemany del driver con las tuplas tal cual. El insert de Core arma un dict de
+    # parámetros por fila y pasa cada valor por el procesador de su tipo: con millones de
+    # filas eso costaba más que escribirlas
+    if not filas:
+        return
+    conexion = db.session.connection()
+    sentencia = insert(modelo.__table__).compile(dialect=conexion.dialect, column_keys=columnas)
+    if not sentencia.positional:
+        filas = [dict(zip(columnas, fila)) for fila in filas]
+    elif tuple(sentencia.positiontup) != columnas: # Los parámetros van en el orden de la tabla
+        filas = list(map(itemgetter(*[columnas.index(c) for c in sentencia.positiontup]), filas))
+    elif not isinstance(filas[0], tuple): # SQLAlchemy solo acepta tuplas
+        filas = list(map(tuple, filas))
+    conexion.exec_driver_sql(sentencia.string, filas)
+
+
+def _sin_esperar_al_disco(conexion_dbapi, registro, proxy):
+    cursor = conexion_dbapi.cursor()
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("PRAGMA journal_mode = MEMORY")
+    cursor.execute("PRAGMA cache_size = -262144") # 256 MB para ordenar al crear los índices
+    cursor.close()
+
+
+@contextmanager
+def _carga_masiva():
+    # Mantener los índices secundarios y el índice de búsqueda fila por fila costaba más que
+    # crearlos al final de una vez. En SQLite, además, la carga no pasa por el WAL ni espera al
+    # disco: si se cae a la mitad, la base de prueba se vuelve a generar
+    conexion = db.session.connection()
+    indices = [indice for modelo in COLUMNAS for indice in modelo.__table__.indexes]
+    sqlite = conexion.dialect.name == 'sqlite'
+    for indice in indices:
+        indice.drop(conexion, checkfirst=True)
+    if sqlite:
+        for sql in busqueda.TRIGGERS:
+            conexion.execute(text("DROP TRIGGER IF EXISTS " + re.search(r'EXISTS (\w+)', sql).group(1)))
+        # En cada conexión que tome la sesión, fuera de una transacción: dentro no cambia el journal
+        event.listen(db.engine, 'checkout', _sin_esperar_al_disco)
+    db.session.commit()
+    try:
+        yield
+    finally:
+        db.session.rollback() # Lo que haya quedado sin confirmar si la carga falló
+        conexion = db.session.connection()
+        for indice in indices:
+            indice.create(conexion, checkfirst=True)
+        db.session.commit()
+        if sqlite:
+            busqueda.crear_indice()
+            busqueda.reconstruir_indice()
+            event.remove(db.engine, 'checkout', _sin_esperar_al_disco)
+            # Conexiones nuevas, con el WAL y el synchronous de basedatos.preparar_motores
+            db.session.close()
+            db.engine.dispose()
+
+
+def _fecha_para(dialecto):
+    """Convierte una fecha a lo que recibe el driver sin el procesador de SQLAlchemy: en SQLite,
+    el mismo texto que guarda SQLAlchemy ('2025-03-20 07:00:00.000000'); los demás, el datetime."""
+    if dialecto.name == 'sqlite':
+        return lambda fecha: fecha.isoformat(' ', 'microseconds')
+    return lambda fecha: fecha
+
+
+def generar(socios=300, meses=24, proporcion_pago=0.85, sectores=None, semilla=None):
+    """Llena una base sin socios con 'socios' socios y predios y 'meses' meses de historia.
+
+    Cada mes el socio paga todo lo pendiente con probabilidad 'proporcion_pago'; si no, la
+    deuda se acumula y se cobra junta en el siguiente pago. Los saldos y el estado de cuenta
+    quedan como los dejaría el POS. Si no hay tarifas, crea una. Devuelve un dict con las
+    filas creadas de cada tipo. Lanza ValueError si la base ya tiene socios.
+    """
+    if db.session.query(Socio.id).first() is not None:
+        raise ValueError("La base ya tiene socios; los datos de prueba se generan sobre una base vacía.")
+    rng = random.Random(semilla)
+    nombres_sector, pesos = zip(*(sectores or SECTORES).items())
+    periodos = periodos_anteriores(meses)
+    ahora = datetime.now()
+    inicio_historia = datetime(*periodos[0], 1) if periodos else ahora
+
+    if tarifa_para(*(periodos[0] if periodos else (ahora.year, ahora.month))) is None:
+        db.session.add(ConfiguracionTarifa(cargo_fijo=5000, valor_m3=1200, limite_basico=20,
+                                           valor_m3_extra=2500, fecha_desde=inicio_historia))
+        db.session.commit()
+        invalidar_tarifas()
+    tarifas = [tarifa_para(anio, mes) for anio, mes in periodos]
+    # Más consumo en los meses secos de mitad y final de año
+    estacion = [1 + 0.12 * math.cos((mes - 7) * math.pi / 6) ** 2 for _, mes in periodos]
+
+    creados = dict.fromkeys(('socios', 'lecturas', 'facturas', 'pagos', 'movimientos'), 0)
+    lectura_id = pago_id = 0
+    fecha_sql = _fecha_para(db.session.connection().dialect)
+    with _carga_masiva():
+        for primero in range(1, socios + 1, PREDIOS_POR_LOTE):
+            ids = range(primero, min(primero + PREDIOS_POR_LOTE, socios + 1))
+            generados = [_consumos(rng, estacion) for _ in ids]
+            # Los totales se calculan por periodo para todo el lote, cada uno con su tarifa
+            por_periodo = [calcular_totales([c[k] for c, _ in generados], tarifas[k]) for k in range(len(periodos))]
+
+            filas = {modelo: [] for modelo in COLUMNAS}
+            for n, predio_id in enumerate(ids):
+                consumos, desocupado = generados[n]
+                filas[Socio].append((
+                    predio_id, f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}",
+                    str(10000000 + predio_id * 7 + rng.randrange(7)), f"3{rng.randrange(10**9):09d}",
+                    fecha_sql(inicio_historia - timedelta(days=rng.randrange(3650)))
+                ))
+
+                acumulado = round(rng.uniform(0, 2000), 1)
+                saldo, deuda = 0.0, [] # Facturas pendientes del predio
+                for k, (anio, mes) in enumerate(periodos):
+                    lectura_id += 1
+                    consumo, total = consumos[k], por_periodo[k][n]
+                    toma = datetime(anio, mes, 20 + int(rng.random() * 8), 7 + int(rng.random() * 10))
+                    toma_sql = fecha_sql(toma)
+                    actual = round(acumulado + consumo, 1)
+                    filas[Lectura].append((lectura_id, predio_id, anio, mes, toma_sql, acumulado, actual, consumo))
+                    acumulado = actual
+                    # Lista y no tupla: si se paga, cambian el estado y los datos del pago
+                    factura = [lectura_id, lectura_id, f"FAC-{anio}-CTA-{predio_id:06d}-{lectura_id}", total,
+                               'Pendiente', fecha_sql(toma + timedelta(days=2)), None, None, None]
+                    filas[Factura].append(factura)
+                    deuda.append(factura)
+                    saldo += total
+                    filas[MovimientoCuenta].append((predio_id, toma_sql, 'Cargo', total, saldo,
+                                                    f"Consumo {mes}/{anio} ({consumo:g} m³)", lectura_id, None))
+
+                    # El pago llega entre una y tres semanas después de la toma
+                    fecha_pago = toma + timedelta(days=6 + int(rng.random() * 20), minutes=int(rng.random() * 480))
+                    if rng.random() >= proporcion_pago or fecha_pago > ahora:
+                        continue
+                    pago_id += 1
+                    metodo = 'Efectivo' if rng.random() < 0.8 else 'Transferencia'
+                    pago_sql = fecha_sql(fecha_pago)
+                    valor = sum(f[3] for f in deuda) # total_a_pagar
+                    filas[Pago].append((pago_id, predio_id, None, metodo, valor, len(deuda), pago_sql, None))
+                    for f in deuda:
+                        # estado, fecha_pago, metodo_pago y pago_id
+                        f[4], f[6], f[7], f[8] = 'Pagado', pago_sql, metodo, pago_id
+                    saldo -= valor
+                    filas[MovimientoCuenta].append((predio_id, pago_sql, 'Abono', -valor, saldo,
+                                                    f"Pago recibo N° {pago_id} ({len(deuda)} meses)", None, pago_id))
+                    deuda = []
+
+                filas[Predio].append((
+                    predio_id, f"CTA-{predio_id:06d}", predio_id, rng.choices(nombres_sector, pesos)[0],
+                    f"SN-{rng.randrange(10**6):06d}", 'Suspendido' if desocupado and rng.random() < 0.5 else 'Activo',
+                    saldo
+                ))
+
+            for modelo, lote in filas.items():
+                _insertar(modelo, COLUMNAS[modelo], lote)
+            db.session.commit()
+            for clave, modelo in (('socios', Socio), ('lecturas', Lectura), ('facturas', Factura),
+                                  ('pagos', Pago), ('movimientos', MovimientoCuenta)):
+                creados[clave] += len(filas[modelo])
+
+    # Las tablas de resumen salen de las mismas reconstrucciones de los comandos de mantenimiento,
+    # una sola vez al final y ya con los índices
+    recalcular_todo()
+    recalcular_consumo_sectores()
+    recalcular_cartera()
+    return creados
@@ -0,0 +1,40 @@
+// Autocompletado contra /api/buscar (índice de cuentas y socios).
+// 'alElegir(item)' recibe el resultado que el usuario seleccionó.
+function autocompletar(input, url, tipo, alElegir) {
+    const lista = document.createElement('div');
+    lista.className = 'list-group position-absolute w-100 shadow';
+    lista.style.zIndex = 1000;
+    input.parentNode.style.position = 'relative';
+    input.parentNode.appendChild(lista);
+
+    let temporizador = null;
+    input.addEventListener('input', function () {
+        clearTimeout(temporizador);
+        const q = input.value.trim();
+        if (q.length < 2) {
+            lista.innerHTML = '';
+            return;
+        }
+        // Esperamos a que el usuario deje de escribir un momento antes de consultar
+        temporizador = setTimeout(function () {
+            fetch(url + '?tipo=' + tipo + '&q=' + encodeURIComponent(q))
+                .then(r => r.json())
+                .then(items => {
+                    lista.innerHTML = '';
+                    items.forEach(item => {
+                        const opcion = document.createElement('button');
+                        opcion.type = 'button';
+                        opcion.className = 'list-group-item list-group-item-action small';
+                        opcion.textContent = tipo === 'socio'
+                            ? item.nombre + ' (' + item.cedula + ')'
+                            : item.numero_cuenta + ' - ' + item.nombre + ' (' + item.cedula + ')';
+                        opcion.addEventListener('click', function () {
+                            lista.innerHTML = '';
+                            alElegir(item);
+                        });
+                        lista.appendChild(opcion);
+                    });
+                });
+        }, 150);
+    });
+}
@@ -0,0 +1,86 @@
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from models import db, ConfiguracionTarifa
+
+# Copia inmutable de una versión de tarifas, con los atributos que espera facturacion.py
+Tarifa = namedtuple('Tarifa', 'id cargo_fijo valor_m3 limite_basico valor_m3_exceso fecha_desde')
+
+# Segundos que se confía en la caché antes de releer la tabla. Cubre los cambios hechos
+# desde otro proceso del servidor; en este proceso guardar_tarifa() la invalida de inmediato.
+VIGENCIA_CACHE = 60
+
+# Lo cargado se publica de una sola vez: un hilo que lee mientras otro recarga ve la copia
+# anterior completa o la nueva completa, nunca las versiones de una con las fechas de la otra
+_Cache = namedtuple('_Cache', 'versiones fechas por_periodo cargada_en')
+_cache = None # versiones: [Tarifa] ordenadas por fecha_desde; por_periodo: (anio, mes) -> Tarifa
+
+
+def _cargar():
+    global _cache
+    filas = ConfiguracionTarifa.query.filter_by(activa=True).order_by(
+        ConfiguracionTarifa.fecha_desde, ConfiguracionTarifa.id
+    ).all()
+    versiones = [
+        Tarifa(t.id, t.cargo_fijo, t.valor_m3, t.limite_basico, t.valor_m3_extra, t.fecha_desde)
+        for t in filas
+    ]
+    _cache = _Cache(versiones, [t.fecha_desde for t in versiones], {}, time.monotonic())
+    return _cache
+
+
+def _vigente():
+    cache = _cache
+    if cache is None or time.monotonic() - cache.cargada_en > VIGENCIA_CACHE:
+        cache = _cargar()
+    return cache
+
+
+def invalidar():
+    global _cache
+    _cache = None
+
+
+def tarifa_para(anio, mes):
+    """Tarifa vigente para el periodo (anio, mes), o None si ninguna versión rige desde ese periodo o antes."""
+    cache = _vigente()
+    tarifa = cache.por_periodo.get((anio, mes))
+    if tarifa is None and cache.versiones:
+        i = bisect_right(cache.fechas, datetime(anio, mes, 1))
+        # Un periodo anterior a la primera versión no tiene tarifa: cobrarlo con la más
+        # antigua le aplicaría valores que todavía no regían
+        if i == 0:
+            return None
+        tarifa = cache.versiones[i - 1]
+        cache.por_periodo[(anio, mes)] = tarifa
+    return tarifa
+
+
+def tarifa_actual():
+    ahora = datetime.now()
+    return tarifa_para(ahora.year, ahora.month)
+
+
+def historial():
+    return list(reversed(_vigente().versiones))
+
+
+def guardar_tarifa(cargo_fijo, valor_m3, limite_basico, valor_m3_exceso, anio, mes):
+    # Crea una versión nueva vigente desde (anio, mes). Los periodos ya cerrados no se
+    # tocan, así un cambio de tarifas no puede recalcular meses viejos sin pagar.
+    desde = datetime(anio, mes, 1)
+    ahora = datetime.now()
+    if desde < datetime(ahora.year, ahora.month, 1):
+        raise ValueError("No se pueden cambiar las tarifas de periodos anteriores al actual.")
+
+    # Si ya había una versión para ese mismo periodo, queda reemplazada
+    ConfiguracionTarifa.query.filter_by(fecha_desde=desde, activa=True).update({'activa': False})
+    db.session.add(ConfiguracionTarifa(
+        cargo_fijo=cargo_fijo,
+        valor_m3=valor_m3,
+        limite_basico=limite_basico,
+        valor_m3_extra=valor_m3_exceso,
+        fecha_desde=desde
+    ))
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+from flask import has_app_context
+
+# Base SQLite temporal, nunca la real: DATABASE_URL se lee al importar la aplicación
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+CARPETA = tempfile.mkdtemp(prefix='pruebas_acueducto_')
+BASE = os.path.join(CARPETA, 'pruebas.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + BASE
+
+from app import app as aplicacion, preparar_base
+from models import db, Usuario, ConfiguracionTarifa, Socio, Predio, Lectura
+import busqueda
+import cartera
+import tarifas
+import usuarios
+
+
+@pytest.fixture(scope='session')
+def app():
+    aplicacion.config['TESTING'] = True
+    return aplicacion
+
+
+@pytest.fixture
+def base(app):
+    """Base vacía con un administrador ('admin'/'clave') y la tarifa vigente desde el año 2000.
+
+    Deja un contexto de aplicación abierto para usar los modelos directamente. Las pruebas
+    con el cliente usan 'cliente': el cliente reutiliza el contexto abierto (y su 'g') si lo hay.
+    """
+    preparar(app)
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def cliente(app):
+    preparar(app)
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'clave'})
+    return cliente
+
+
+def preparar(app):
+    with app.app_context():
+        db.drop_all()
+        preparar_base()
+        busqueda.reconstruir_indice() # El índice de búsqueda no es un modelo: drop_all no lo vacía
+        usuario = Usuario(username='admin', rol='admin')
+        usuario.set_password('clave')
+        db.session.add(usuario)
+        db.session.add(ConfiguracionTarifa(cargo_fijo=5000, valor_m3=1200, limite_basico=20,
+                                           valor_m3_extra=2500, fecha_desde=datetime(2000, 1, 1)))
+        db.session.commit()
+        tarifas.invalidar()
+        cartera.invalidar()
+        usuarios.invalidar()
+        db.session.remove()
+        # Conexiones nuevas: las del pool guardan el esquema anterior a drop_all y, con el hilo
+        # de auditoría escribiendo a la vez, SQLite puede responder "database is locked" sin esperar
+        db.engine.dispose()
+
+
+def crear_predio(numero, sector='Centro', lecturas=((2026, 1, 12.0),)):
+    """Socio con un predio y sus lecturas [(anio, mes, consumo)] acumuladas desde cero.
+
+    Sin contexto de aplicación abierto (pruebas con 'cliente') se abre uno solo para crearlo.
+    """
+    if not has_app_context():
+        with aplicacion.app_context():
+            return crear_predio(numero, sector, lecturas)
+    socio = Socio(nombre=f'Socio {numero}', cedula=str(1000 + numero))
+    db.session.add(socio)
+    db.session.flush()
+    predio = Predio(numero_cuenta=f'CTA-{numero:06d}', socio_id=socio.id, sector=sector)
+    db.session.add(predio)
+    db.session.flush()
+    anterior = 0.0
+    for anio, mes, consumo in lecturas:
+        db.session.add(Lectura(predio_id=predio.id, anio=anio, mes=mes, lectura_anterior=anterior,
+                               lectura_actual=anterior + consumo, consumo_mes=consumo))
+        anterior += consumo
+    db.session.commit()
+    db.session.refresh(predio)
+    return predio
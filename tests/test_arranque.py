@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+from conftest import BASE, RAIZ
+from models import db, Trabajo
+
+
+def _importar_como_proceso_hijo(base):
+    # Lo que hace un proceso 'spawn' del tiraje de facturas al arrancar con 'python app.py'
+    codigo = "import runpy; runpy.run_path('app.py', run_name='__mp_main__')"
+    subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, check=True,
+                   env=dict(os.environ, DATABASE_URL=f'sqlite:///{base}'))
+
+
+def test_importar_la_aplicacion_no_interrumpe_trabajos(app, base):
+    # Con latido: un trabajo sin él lo puede cerrar el hilo de trabajos de otra prueba
+    trabajo = Trabajo(tipo='facturacion', estado='En proceso', proceso='otro:1:a', latido=datetime.utcnow())
+    db.session.add(trabajo)
+    db.session.commit()
+
+    _importar_como_proceso_hijo(BASE)
+
+    db.session.expire_all()
+    assert db.session.get(Trabajo, trabajo.id).estado == 'En proceso'
+
+
+def test_importar_la_aplicacion_no_crea_tablas(app, tmp_path):
+    vacia = tmp_path / 'vacia.db'
+    _importar_como_proceso_hijo(vacia)
+    assert not vacia.exists() or vacia.stat().st_size == 0
+
+
+def test_la_primera_peticion_prepara_la_base(cliente):
+    assert cliente.get('/dashboard').status_code == 200
@@ -0,0 +1,43 @@
+import pytest
+from flask_login import login_user
+
+from app import auditar_escritura
+from conftest import crear_predio
+from models import Pago, Usuario
+import auditoria
+
+
+@pytest.fixture
+def eventos(monkeypatch):
+    registrados = []
+    monkeypatch.setattr(auditoria, 'registrar', lambda accion, usuario_id=None, ruta=None: registrados.append(accion))
+    return registrados
+
+
+def test_formulario_rechazado_no_queda_en_la_bitacora(cliente, eventos):
+    crear_predio(1)
+    # Cédula repetida: la ruta redirige con el error sin escribir nada
+    respuesta = cliente.post('/socio/nuevo', data={'nombre': 'Otro', 'cedula': '1001', 'telefono': ''})
+    assert respuesta.status_code == 302
+    assert eventos == []
+
+
+def test_escritura_sin_descripcion_queda_con_la_ruta(app, base, eventos):
+    # Una ruta que no llama a auditar(): solo cuenta si confirmó algún cambio
+    with app.test_request_context('/pruebas/escribir', method='POST'):
+        login_user(Usuario.query.first())
+        auditar_escritura(app.response_class('sin cambios'))
+        crear_predio(2)
+        auditar_escritura(app.response_class('con cambios'))
+    assert eventos == ['POST /pruebas/escribir']
+
+
+def test_cobro_repetido_con_la_misma_clave_se_registra_una_vez(app, cliente, eventos):
+    predio = crear_predio(1, lecturas=[(2026, 1, 12.0), (2026, 2, 8.0)])
+    for _ in range(2):
+        respuesta = cliente.post('/pos/confirmar-pago', data={'predio_id': predio.id, 'clave': 'doble-clic'})
+        assert respuesta.status_code == 302
+    with app.app_context():
+        pago = Pago.query.one()
+    assert eventos == [f"Cobró el recibo N° {pago.id} de {predio.numero_cuenta}: 2 meses, "
+                       f"$ {pago.total:,.0f} (Efectivo)"]
@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import basedatos
+
+
+def motores(monkeypatch, principal, lectura):
+    monkeypatch.setenv('DATABASE_URL', principal)
+    monkeypatch.setenv('DATABASE_URL_LECTURA', lectura)
+    app = Flask(__name__)
+    basedatos.configurar(app, 'sqlite://')
+    return app
+
+
+def test_replica_postgresql_abre_sus_conexiones_en_solo_lectura(monkeypatch):
+    app = motores(monkeypatch, 'postgres://u:c@principal/acueducto', 'postgres://u:c@replica/acueducto')
+    lectura = app.config['SQLALCHEMY_BINDS'][basedatos.MOTOR_LECTURA]
+    assert lectura['url'] == 'postgresql://u:c@replica/acueducto'
+    # En las opciones de la conexión y no en un SET que el primer rollback deshaga
+    assert lectura['connect_args'] == {'options': '-c default_transaction_read_only=on'}
+
+
+def test_el_motor_de_lectura_rechaza_escrituras(monkeypatch, tmp_path):
+    url = f'sqlite:///{tmp_path / "base.db"}'
+    app = motores(monkeypatch, url, url)
+    db = SQLAlchemy(app)
+    basedatos.preparar_motores(app, db)
+    with app.app_context():
+        with db.engine.begin() as conexion:
+            conexion.execute(text("CREATE TABLE cuentas (id INTEGER PRIMARY KEY)"))
+
+        with db.engines[basedatos.MOTOR_LECTURA].connect() as conexion:
+            for _ in range(2): # También después de un rollback
+                with pytest.raises(OperationalError, match='readonly'):
+                    conexion.execute(text("INSERT INTO cuentas (id) VALUES (1)"))
+                conexion.rollback()
+            assert conexion.execute(text("SELECT count(*) FROM cuentas")).scalar() == 0
@@ -0,0 +1,18 @@
+from models import db, Socio, Predio
+import busqueda
+
+COMUNES = 600 # Más coincidencias de las que cabían en la ventana de candidatos de antes
+
+
+def test_la_mejor_coincidencia_gana_aunque_llegue_de_ultima(base):
+    # Cientos de dueños que se llaman Ana y, después de todos, un medidor ANA-1 que pesa más
+    for n in range(1, COMUNES + 2):
+        db.session.add(Socio(id=n, nombre=f'Ana {n}' if n <= COMUNES else 'Pedro Pérez', cedula=str(1000 + n)))
+        db.session.add(Predio(id=n, numero_cuenta=f'CTA-{n:06d}', socio_id=n,
+                              serial_medidor='ANA-1' if n > COMUNES else f'SN-{n}'))
+    db.session.commit()
+
+    resultados = busqueda.buscar('ana', limite=5)
+    assert len(resultados) == 5
+    assert resultados[0]['predio_id'] == COMUNES + 1
+    assert busqueda.buscar('perez', limite=5)[0]['nombre'] == 'Pedro Pérez'
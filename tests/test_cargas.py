@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pytest
+
+from conftest import crear_predio
+from models import db, CargaMasiva, Trabajo
+from cargas import abrir_carga
+import trabajos
+
+HACE_UNA_HORA = datetime.utcnow() - timedelta(hours=1)
+
+
+def test_carga_nueva_empieza_en_proceso(base):
+    carga, retomada = abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+    assert not retomada
+    assert (carga.estado, carga.filas_procesadas, carga.exitos) == ('En proceso', 0, 0)
+
+
+def test_no_se_retoma_una_carga_que_sigue_corriendo(base):
+    abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+    with pytest.raises(ValueError):
+        abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+    # Otro archivo no tiene por qué esperar
+    assert abrir_carga('lecturas', 'otro.csv', 'otra huella', None)[1] is False
+
+
+def test_una_carga_interrumpida_se_retoma_una_sola_vez(app, base):
+    carga, _ = abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+    carga.filas_procesadas = 500
+    carga.fecha_actualizacion = HACE_UNA_HORA # Nadie la ha vuelto a tocar
+    db.session.commit()
+    trabajos.iniciar(app) # Reinicio del servidor: lo que estaba corriendo queda interrumpido
+    db.session.expire_all()
+    assert db.session.get(CargaMasiva, carga.id).estado == 'Interrumpida'
+
+    retomada, es_retomada = abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+    assert es_retomada and retomada.id == carga.id
+    assert (retomada.estado, retomada.filas_procesadas) == ('En proceso', 500)
+    with pytest.raises(ValueError):
+        abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+
+
+def test_reiniciar_un_worker_no_interrumpe_los_trabajos_de_otro(app, base):
+    vivo, _ = abrir_carga('lecturas', 'vivo.csv', 'huella viva', None)
+    caido, _ = abrir_carga('lecturas', 'caido.csv', 'huella caida', None)
+    caido.fecha_actualizacion = HACE_UNA_HORA
+    # Uno de otro worker que sigue latiendo y otro de un worker que dejó de hacerlo
+    db.session.add_all([
+        Trabajo(tipo='carga_lecturas', estado='En proceso', carga_id=vivo.id, proceso='otro:7:a', latido=datetime.utcnow()),
+        Trabajo(tipo='carga_lecturas', estado='En proceso', carga_id=caido.id, proceso='caido:8:b', latido=HACE_UNA_HORA),
+    ])
+    db.session.commit()
+
+    trabajos.iniciar(app)
+    trabajos.iniciar(app) # Otro worker que arranca
+    db.session.expire_all()
+    estados = dict(db.session.query(Trabajo.proceso, Trabajo.estado))
+    assert estados == {'otro:7:a': 'En proceso', 'caido:8:b': 'Interrumpido'}
+    assert (vivo.estado, caido.estado) == ('En proceso', 'Interrumpida')
+    with pytest.raises(ValueError):
+        abrir_carga('lecturas', 'vivo.csv', 'huella viva', None)
+    assert abrir_carga('lecturas', 'caido.csv', 'huella caida', None)[1] is True
+
+
+def test_el_latido_mantiene_vivos_los_trabajos_del_proceso(app, base, monkeypatch):
+    monkeypatch.setitem(app.config, 'TRABAJOS_LATIDO', 0.05)
+    monkeypatch.setattr(trabajos, '_hilo', None) # Un hilo nuevo, con el latido corto
+    trabajos.iniciar(app)
+    inicio = datetime.utcnow()
+    trabajo = Trabajo(tipo='generar_periodo', estado='En proceso', proceso=trabajos.proceso(), latido=inicio)
+    db.session.add(trabajo)
+    db.session.commit()
+    # Más de LATIDOS_PERDIDOS latidos después sigue vivo
+    while trabajo.latido < inicio + timedelta(seconds=0.3):
+        time.sleep(0.01)
+        db.session.expire_all()
+    assert trabajo.estado == 'En proceso'
+
+
+def test_un_trabajo_fallido_deja_su_carga_para_retomar(app, base):
+    def falla(trabajo):
+        carga, _ = abrir_carga('lecturas', 'lecturas.csv', 'huella', None)
+        trabajo.carga_id = carga.id
+        db.session.commit()
+        raise RuntimeError('se cayó la conexión')
+
+    trabajos.iniciar(app)
+    trabajo = trabajos.encolar('carga_lecturas', falla)
+    while trabajo.estado not in ('Completado', 'Fallido'):
+        time.sleep(0.01)
+        db.session.expire_all()
+    assert trabajo.estado == 'Fallido'
+    assert db.session.get(CargaMasiva, trabajo.carga_id).estado == 'Interrumpida'
+    assert abrir_carga('lecturas', 'lecturas.csv', 'huella', None)[1] is True
+
+
+def test_carga_masiva_de_lecturas(app, cliente):
+    predio = crear_predio(1, lecturas=[(2025, 1, 10.0)])
+    archivo = BytesIO(f"numero_cuenta,lectura_actual\n{predio.numero_cuenta},25\nNO-EXISTE,3\n".encode())
+    respuesta = cliente.post('/lectura/carga-masiva', content_type='multipart/form-data',
+                             data={'archivo_csv': (archivo, 'lecturas.csv')})
+    assert respuesta.status_code == 302
+    trabajo_id = int(respuesta.headers['Location'].rsplit('/', 1)[1])
+    while not (estado := cliente.get(f'/trabajos/{trabajo_id}/estado').get_json())['terminado']:
+        time.sleep(0.01)
+    assert (estado['estado'], estado['exitos'], estado['errores']) == ('Completado', 1, 1)
+    with app.app_context():
+        assert CargaMasiva.query.one().estado == 'Completada'
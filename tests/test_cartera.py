@@ -0,0 +1,39 @@
+from datetime import date
+
+from conftest import crear_predio
+from models import db, CarteraSector, RecaudoDiario
+from facturacion import facturar_periodo
+import cartera
+import pagos
+
+
+def volcar():
+    return ([(s.sector, s.predios, s.predios_mora, s.lecturas_pendientes, s.saldo_pendiente)
+             for s in CarteraSector.query.order_by(CarteraSector.sector)],
+            [(r.fecha, r.sector, r.pagos, r.total) for r in RecaudoDiario.query.order_by(RecaudoDiario.sector)])
+
+
+def test_lo_incremental_cuadra_con_la_reconstruccion(base):
+    predios = [crear_predio(n, sector=('Centro', 'Alto', None)[n % 3], lecturas=[(2025, 1, 12.0), (2025, 2, 30.0)])
+               for n in range(1, 7)]
+    cartera.actualizar_cartera([p.id for p in predios])
+    facturar_periodo(2025, 1)
+    facturar_periodo(2025, 2)
+    db.session.commit()
+    for predio in predios[:4]:
+        pagos.cobrar(predio, None)
+    incremental = volcar()
+    assert {s for s, *_ in incremental[0]} == {'Centro', 'Alto', ''}
+    assert sum(r[2] for r in incremental[1]) == 8 # Dos meses por cada uno de los cuatro pagos
+
+    cartera.recalcular_cartera()
+    assert volcar() == incremental
+
+
+def test_recaudo_del_dia_se_suma_en_la_misma_fila(base):
+    hoy = date(2025, 3, 15)
+    cartera.registrar_recaudo('Centro', 1000.0, fecha=hoy)
+    cartera.registrar_recaudo('Centro', 500.0, pagos=2, fecha=hoy)
+    cartera.registrar_recaudo(None, 200.0, fecha=hoy)
+    db.session.commit()
+    assert volcar()[1] == [(hoy, '', 1, 200.0), (hoy, 'Centro', 3, 1500.0)]
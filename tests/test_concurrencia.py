@@ -0,0 +1,114 @@
+import threading
+import uuid
+
+from conftest import crear_predio
+from models import db, Factura, Lectura, Pago, Predio
+from facturacion import facturar_periodo
+from saldos import cargar_lecturas
+
+HILOS = 8
+
+
+def en_paralelo(funciones):
+    """Corre las funciones a la vez (arrancan juntas) y devuelve sus resultados en el mismo orden."""
+    resultados = [None] * len(funciones)
+    salida = threading.Barrier(len(funciones))
+
+    def correr(i):
+        salida.wait()
+        try:
+            resultados[i] = funciones[i]()
+        except Exception as e: # Una excepción en un hilo también es un fallo de la prueba
+            resultados[i] = e
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(len(funciones))]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return resultados
+
+
+def cajero(app):
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'clave'})
+    return cliente
+
+
+def predio_con_cargos(app, numero, meses=(1, 2, 3)):
+    with app.app_context():
+        predio = crear_predio(numero, lecturas=[(2026, mes, 10.0 + mes) for mes in meses])
+        cargar_lecturas(predio.lecturas)
+        db.session.commit()
+        return predio.id, [l.id for l in predio.lecturas]
+
+
+def comprobar_cuenta(app, predio_id):
+    """Cada mes pagado una sola vez, por el pago que lo cobró, y la cuenta en cero."""
+    with app.app_context():
+        for lectura in Lectura.query.filter_by(predio_id=predio_id):
+            facturas = Factura.query.filter_by(lectura_id=lectura.id).all()
+            assert [f.estado for f in facturas] == ['Pagado'], f"lectura {lectura.id}: {facturas}"
+        for pago in Pago.query.filter_by(predio_id=predio_id):
+            cobrado = db.session.query(db.func.sum(Factura.total_a_pagar)).filter_by(pago_id=pago.id).scalar()
+            assert pago.total == cobrado
+        assert db.session.get(Predio, predio_id).saldo == 0
+
+
+def test_doble_clic_con_la_misma_clave_cobra_una_vez(app, cliente):
+    predio_id, lectura_ids = predio_con_cargos(app, 1)
+    cajeros = [cajero(app) for _ in range(HILOS)]
+    datos = {'predio_id': predio_id, 'lectura_id': lectura_ids, 'clave': 'misma-clave'}
+
+    respuestas = en_paralelo([lambda c=c: c.post('/pos/confirmar-pago', data=datos) for c in cajeros])
+
+    assert [r.status_code for r in respuestas] == [302] * HILOS
+    with app.app_context():
+        pago = Pago.query.one()
+        assert pago.clave_idempotencia == 'misma-clave' and pago.meses == 3
+    # Todas las respuestas llevan al mismo recibo
+    assert {r.headers['Location'] for r in respuestas} == {f'/imprimir-recibo/{pago.id}'}
+    comprobar_cuenta(app, predio_id)
+
+
+def test_cajas_distintas_sobre_la_misma_cuenta_cobran_una_vez(app, cliente):
+    predio_id, lectura_ids = predio_con_cargos(app, 1)
+    cajeros = [cajero(app) for _ in range(HILOS)]
+
+    respuestas = en_paralelo([
+        lambda c=c: c.post('/pos/confirmar-pago', data={'predio_id': predio_id, 'lectura_id': lectura_ids,
+                                                        'clave': uuid.uuid4().hex})
+        for c in cajeros
+    ])
+
+    assert all(r.status_code == 302 for r in respuestas), [r.status_code for r in respuestas]
+    recibos = [r for r in respuestas if r.headers['Location'].startswith('/imprimir-recibo/')]
+    assert len(recibos) == 1
+    with app.app_context():
+        assert Pago.query.count() == 1
+    comprobar_cuenta(app, predio_id)
+
+
+def test_facturar_el_periodo_mientras_se_cobra(app, cliente):
+    cuentas = [predio_con_cargos(app, n) for n in range(1, HILOS + 1)]
+    cajeros = [cajero(app) for _ in cuentas]
+
+    def facturar(mes):
+        with app.app_context():
+            creadas = facturar_periodo(2026, mes)
+            db.session.commit()
+            return creadas
+
+    def cobrar(cliente, predio_id):
+        return cliente.post('/pos/pagar-masivo', data={'predio_id': predio_id, 'clave': uuid.uuid4().hex})
+
+    tareas = [lambda mes=mes: facturar(mes) for mes in (1, 2, 3)]
+    tareas += [lambda c=c, p=p: cobrar(c, p) for c, (p, _) in zip(cajeros, cuentas)]
+    resultados = en_paralelo(tareas)
+
+    assert not [r for r in resultados if isinstance(r, Exception)], resultados
+    assert [r.status_code for r in resultados[3:]] == [302] * len(cuentas)
+    with app.app_context():
+        assert Pago.query.count() == len(cuentas)
+    for predio_id, _ in cuentas:
+        comprobar_cuenta(app, predio_id)
@@ -0,0 +1,58 @@
+import logging
+
+import pytest
+from sqlalchemy.orm import contains_eager, joinedload
+
+from conftest import crear_predio
+from models import db, Predio, Socio
+from detector_sql import ConsultasRepetidas, vigilar
+
+PREDIOS = 12 # Más que DETECTOR_SQL_REPETICIONES (10)
+
+
+@pytest.fixture
+def predios(app, base):
+    for n in range(1, PREDIOS + 1):
+        crear_predio(n)
+    # Sin los socios en la sesión: cada dueño se tiene que pedir a la base
+    db.session.expunge_all()
+
+
+def nombres_de_duenos(consulta):
+    return [p.dueno.nombre for p in consulta.order_by(Predio.id)]
+
+
+def test_dueno_perezoso_en_un_listado_falla(predios):
+    with pytest.raises(ConsultasRepetidas, match='socios'):
+        with vigilar():
+            nombres_de_duenos(Predio.query)
+
+
+@pytest.mark.parametrize('consulta', [
+    lambda: Predio.query.options(joinedload(Predio.dueno)),
+    lambda: Predio.query.join(Predio.dueno).options(contains_eager(Predio.dueno)),
+])
+def test_dueno_cargado_con_el_listado_pasa(predios, consulta):
+    with vigilar() as vigilancia:
+        assert len(nombres_de_duenos(consulta())) == PREDIOS
+    assert vigilancia.repetidas() == []
+
+
+def test_peticion_con_n_mas_1_falla_en_pruebas(app, predios):
+    # Los mismos ganchos que corren en cada petición del cliente
+    with app.test_request_context('/pruebas/listado'):
+        app.preprocess_request()
+        nombres_de_duenos(Predio.query)
+        with pytest.raises(ConsultasRepetidas, match='GET /pruebas/listado'):
+            app.process_response(app.response_class('listado'))
+
+
+def test_consulta_lenta_se_registra_con_su_plan(app, predios, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, 'DETECTOR_SQL_LENTA_MS', 0) # Todas cuentan como lentas
+    with caplog.at_level(logging.WARNING):
+        with vigilar():
+            Socio.query.filter_by(cedula='1001').first()
+        Predio.query.filter_by(numero_cuenta='CTA-000001').first() # Fuera de una petición
+    lentas = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Consulta lenta')]
+    assert any('bloque vigilado' in m and 'FROM socios' in m and 'Plan: ' in m for m in lentas), lentas
+    assert any('segundo plano' in m and 'FROM predios' in m and 'SEARCH predios' in m for m in lentas), lentas
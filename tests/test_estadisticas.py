@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import crear_predio
+from models import db, ConsumoSector, Lectura
+from estadisticas import actualizar_consumo_sectores, sumar_lectura_a_sector
+
+EXACTOS = ('lecturas', 'medidores_activos', 'total', 'promedio', 'maximo')
+
+
+def fila(sector):
+    db.session.expire_all()
+    consumo = db.session.get(ConsumoSector, (2025, 3, sector))
+    return {campo: getattr(consumo, campo) for campo in EXACTOS + ('p50', 'p90', 'p95')}
+
+
+def test_lectura_manual_suma_su_consumo_sin_releer_el_periodo(base):
+    for n, consumo in enumerate((12.0, 0.0, 30.5), start=1):
+        crear_predio(n, lecturas=[(2025, 3, consumo)])
+    actualizar_consumo_sectores([(2025, 3, 'Centro')])
+    antes = fila('Centro')
+
+    # Dos lecturas nuevas del periodo, como las registra la ruta de lectura manual
+    for n, consumo in ((4, 41.0), (5, 7.25)):
+        predio = crear_predio(n, lecturas=[])
+        db.session.add(Lectura(predio_id=predio.id, anio=2025, mes=3, lectura_anterior=0,
+                               lectura_actual=consumo, consumo_mes=consumo))
+        db.session.flush()
+        sumar_lectura_a_sector(2025, 3, 'Centro', consumo)
+    db.session.commit()
+    sumado = fila('Centro')
+
+    actualizar_consumo_sectores([(2025, 3, 'Centro')])
+    recalculado = fila('Centro')
+    assert {c: sumado[c] for c in EXACTOS} == pytest.approx({c: recalculado[c] for c in EXACTOS})
+    assert sumado['lecturas'] == 5 and sumado['maximo'] == 41.0
+    # Los percentiles esperan al recálculo del periodo
+    assert (sumado['p50'], sumado['p95']) == (antes['p50'], antes['p95'])
+
+
+def test_primera_lectura_del_sector_crea_la_fila(base):
+    sumar_lectura_a_sector(2025, 3, None, 18.5)
+    db.session.commit()
+    assert fila('') == {'lecturas': 1, 'medidores_activos': 1, 'total': 18.5, 'promedio': 18.5,
+                        'maximo': 18.5, 'p50': 18.5, 'p90': 18.5, 'p95': 18.5}
@@ -0,0 +1,35 @@
+import threading
+
+from conftest import crear_predio
+from models import db, Factura, Predio
+from facturacion import facturar_periodo
+from saldos import cargar_lecturas
+import pagos
+
+
+def test_facturar_el_periodo_durante_un_cobro_no_cobra_dos_veces(app, base, monkeypatch):
+    predio = crear_predio(1, lecturas=[(2026, 1, 12.0)])
+    cargar_lecturas(predio.lecturas)
+    db.session.commit()
+
+    def facturar():
+        with app.app_context():
+            facturar_periodo(2026, 1)
+            db.session.commit()
+
+    # La facturación del periodo arranca justo después de que la caja leyó los pendientes
+    leer_pendientes = pagos.pendientes
+    facturacion = threading.Thread(target=facturar)
+    def pendientes_y_facturar(predio_id):
+        filas = leer_pendientes(predio_id)
+        facturacion.start()
+        facturacion.join(0.5) # Con el bloqueo tomado se queda esperando el commit del cobro
+        return filas
+    monkeypatch.setattr(pagos, 'pendientes', pendientes_y_facturar)
+
+    pago = pagos.cobrar(predio, None)
+    facturacion.join()
+
+    facturas = Factura.query.filter_by(lectura_id=predio.lecturas[0].id).all()
+    assert [(f.estado, f.pago_id) for f in facturas] == [('Pagado', pago.id)]
+    assert db.session.get(Predio, predio.id).saldo == 0
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from conftest import crear_predio
+from models import db, Socio, Predio, Lectura, Factura, Pago, MovimientoCuenta, AuditoriaLog
+from saldos import cargar_lecturas
+from facturacion import facturar_periodo
+from estadisticas import actualizar_estadisticas, actualizar_consumo_sectores, claves_de_predios
+import cartera
+import pagos
+import planes
+
+# Tablas que crecen con cada mes y cada predio: nunca se deben recorrer completas en las
+# rutas calientes. Las pequeñas (tarifas, sectores, resúmenes) pueden recorrerse. Los nombres
+# salen de los modelos: escritos a mano, uno mal escrito deja su tabla sin vigilar
+GRANDES = {modelo.__tablename__ for modelo in (Lectura, Factura, MovimientoCuenta, Pago, AuditoriaLog, Predio, Socio)}
+
+
+@contextmanager
+def consultas_ejecutadas():
+    """Las SELECT que la aplicación envía de verdad a la base dentro del bloque, con sus parámetros."""
+    ejecutadas = []
+
+    def anotar(conexion, cursor, sentencia, parametros, contexto, varias):
+        if not varias and sentencia.lstrip().upper().startswith(('SELECT', 'WITH')):
+            ejecutadas.append((sentencia, parametros))
+
+    motor = db.engine
+    event.listen(motor, 'before_cursor_execute', anotar)
+    try:
+        yield ejecutadas
+    finally:
+        event.remove(motor, 'before_cursor_execute', anotar)
+
+
+def recorridos(ejecutadas):
+    encontrados = []
+    for sentencia, parametros in ejecutadas:
+        detalle = planes.plan_sql(sentencia, parametros)
+        # Una página por clave recorre la tabla en el orden de un índice y para en el LIMIT:
+        # solo cuenta como recorrido completo si además hay que ordenar aparte
+        por_indice = ' LIMIT ' in sentencia and not any('TEMP B-TREE' in d for d in detalle)
+        if GRANDES & set(planes.tablas_recorridas(detalle)) and not por_indice:
+            encontrados.append(f"{' '.join(sentencia.split())}\n    {' | '.join(detalle)}")
+    return encontrados
+
+
+@pytest.fixture
+def datos(app):
+    with app.app_context():
+        predios = [crear_predio(n, sector=('Centro', 'Alto')[n % 2],
+                                lecturas=[(2025, mes, 10.0 + n + mes) for mes in range(1, 13)])
+                   for n in range(1, 21)]
+        ids = [p.id for p in predios]
+        for p in predios:
+            cargar_lecturas(p.lecturas)
+        actualizar_estadisticas(ids)
+        actualizar_consumo_sectores(claves_de_predios(ids))
+        for mes in range(1, 7):
+            facturar_periodo(2025, mes)
+        db.session.commit()
+        pagos.cobrar(predios[0], None)
+        cartera.recalcular_cartera()
+        return ids
+
+
+def test_funciones_calientes_usan_indices(app, cliente, datos):
+    with app.app_context():
+        with consultas_ejecutadas() as ejecutadas:
+            pagos.pendientes(datos[3])
+            cartera._estado_predios(datos[:5])
+            actualizar_estadisticas(datos[:5])
+            actualizar_consumo_sectores(claves_de_predios(datos[:5]))
+            db.session.rollback()
+        assert ejecutadas
+        encontrados = recorridos(ejecutadas)
+        assert not encontrados, '\n'.join(encontrados)
+
+
+@pytest.mark.parametrize('ruta', [
+    '/dashboard',
+    '/pos?search=CTA-000004',
+    '/pos?predio_id=4',
+    '/predio/4/estado-cuenta',
+    '/auditoria/consumos',
+    '/auditoria/bitacora',
+    '/reportes/consumo-sectores',
+    '/facturacion/vista-previa',
+    '/predios',
+    '/socios',
+    '/api/buscar?q=socio 4',
+])
+def test_rutas_calientes_usan_indices(app, cliente, datos, ruta):
+    with app.app_context():
+        with consultas_ejecutadas() as ejecutadas:
+            assert cliente.get(ruta).status_code == 200
+        encontrados = recorridos(ejecutadas)
+        assert not encontrados, '\n'.join(encontrados)
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from conftest import crear_predio
+from models import db, Predio, Factura, MovimientoCuenta
+from facturacion import facturar_periodo
+from saldos import cargar_lecturas
+import pagos
+import tarifas
+
+
+def test_factura_con_tarifa_cambiada_ajusta_el_cargo(base):
+    ahora = datetime.now()
+    predio = crear_predio(1, lecturas=[(ahora.year, ahora.month, 30.0)])
+    cargar_lecturas(predio.lecturas)
+    db.session.commit()
+    cargado = db.session.get(Predio, predio.id).saldo
+    assert cargado == 5000 + 20 * 1200 + 10 * 2500
+
+    # La tarifa del mes se reemplaza después de la lectura y antes de facturar
+    tarifas.guardar_tarifa(8000, 1500, 20, 3000, ahora.year, ahora.month)
+    db.session.commit()
+    tarifas.invalidar()
+    assert facturar_periodo(ahora.year, ahora.month) == 1
+    db.session.commit()
+
+    factura = Factura.query.filter_by(lectura_id=predio.lecturas[0].id).one()
+    assert factura.total_a_pagar == 8000 + 20 * 1500 + 10 * 3000
+    assert db.session.get(Predio, predio.id).saldo == factura.total_a_pagar
+    ajuste = MovimientoCuenta.query.filter_by(predio_id=predio.id, tipo='Ajuste').one()
+    assert ajuste.valor == factura.total_a_pagar - cargado
+
+    # Pagar todo deja la cuenta en cero, y volver a facturar no ajusta dos veces
+    pagos.cobrar(predio, None)
+    assert facturar_periodo(ahora.year, ahora.month) == 0
+    db.session.commit()
+    assert db.session.get(Predio, predio.id).saldo == 0
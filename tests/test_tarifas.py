@@ -0,0 +1,65 @@
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+from conftest import crear_predio
+from models import ConfiguracionTarifa
+from facturacion import facturar_periodo
+import tarifas
+
+
+def test_periodo_anterior_a_la_primera_version_no_tiene_tarifa(base):
+    # La de conftest rige desde enero de 2000
+    assert tarifas.tarifa_para(1999, 12) is None
+    primera = tarifas.tarifa_para(2000, 1)
+    assert primera.cargo_fijo == 5000
+    assert tarifas.tarifa_para(2025, 6) == primera
+
+
+def test_sin_tarifa_el_periodo_no_se_factura(base):
+    crear_predio(1, lecturas=[(1999, 12, 15.0)])
+    with pytest.raises(ValueError, match='12/1999'):
+        facturar_periodo(1999, 12)
+
+
+def test_version_nueva_rige_desde_su_periodo(base):
+    base.session.add(ConfiguracionTarifa(cargo_fijo=7000, valor_m3=1300, limite_basico=20,
+                                         valor_m3_extra=2600, fecha_desde=datetime(2024, 3, 1)))
+    base.session.commit()
+    tarifas.invalidar()
+    assert tarifas.tarifa_para(2024, 2).cargo_fijo == 5000
+    assert tarifas.tarifa_para(2024, 3).cargo_fijo == 7000
+
+
+def test_recargar_mientras_otros_hilos_leen(app, base):
+    base.session.add(ConfiguracionTarifa(cargo_fijo=7000, valor_m3=1300, limite_basico=20,
+                                         valor_m3_extra=2600, fecha_desde=datetime(2024, 3, 1)))
+    base.session.commit()
+    tarifas.invalidar()
+    leidas, fallas = [], []
+
+    def leer():
+        with app.app_context():
+            try:
+                for _ in range(300):
+                    leidas.append((tarifas.tarifa_para(2024, 2).cargo_fijo, tarifas.tarifa_para(2024, 3).cargo_fijo))
+            except Exception as e:
+                fallas.append(e)
+
+    hilos = [threading.Thread(target=leer) for _ in range(4)]
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # Cambios de hilo lo más seguido posible
+    try:
+        for hilo in hilos:
+            hilo.start()
+        for _ in range(300):
+            tarifas.invalidar()
+            tarifas.tarifa_para(2024, 3)
+        for hilo in hilos:
+            hilo.join()
+    finally:
+        sys.setswitchinterval(intervalo)
+    assert fallas == []
+    assert set(leidas) == {(5000, 7000)}
@@ -0,0 +1,25 @@
+import pytest
+
+from models import db, Usuario
+
+
+@pytest.mark.parametrize('metodo', ['pbkdf2:sha256', 'pbkdf2:sha256:1000', 'scrypt', 'scrypt:16384:8:1'])
+def test_hash_con_el_metodo_configurado_no_se_rehace(app, base, monkeypatch, metodo):
+    # Werkzeug completa el método con sus valores por defecto al guardar el hash
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METODO', metodo)
+    usuario = Usuario(username='cajero')
+    usuario.set_password('clave')
+    assert not usuario.hash_desactualizado()
+
+
+def test_hash_con_otro_costo_se_rehace_al_iniciar_sesion(app, cliente, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_METODO', 'pbkdf2:sha256:1000')
+    with app.app_context():
+        admin = Usuario.query.filter_by(username='admin').one()
+        assert admin.hash_desactualizado()
+
+    cliente.post('/login', data={'username': 'admin', 'password': 'clave'})
+    with app.app_context():
+        admin = db.session.get(Usuario, admin.id)
+        assert admin.password_hash.startswith('pbkdf2:sha256:1000$')
+        assert not admin.hash_desactualizado() and admin.check_password('clave')
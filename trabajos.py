@@ -0,0 +1,142 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from models import db, Trabajo, CargaMasiva
+from sqlalchemy import select
+import auditoria
+
+# Ejecutor local de trabajos largos (facturación, cargas masivas). El estado de cada
+# trabajo vive en la tabla 'trabajos', así que no hace falta un broker externo.
+#
+# Con varios procesos (workers de gunicorn) cada trabajo lleva el proceso que lo corre, y un
+# hilo de ese proceso renueva su 'latido' cada TRABAJOS_LATIDO segundos. Solo se dan por
+# interrumpidos los trabajos que dejaron de latir: los del proceso que se cayó o reinició,
+# nunca los que otro worker sigue corriendo.
+LATIDOS_PERDIDOS = 4 # Latidos sin renovar para dar un trabajo por abandonado
+ACTIVOS = ('En cola', 'En proceso')
+
+_ejecutor = None
+_hilo = None
+_pid = None
+_proceso = None
+_candado = threading.Lock()
+
+
+def proceso():
+    """'equipo:pid:aleatorio' de este proceso. El aleatorio distingue a un proceso reiniciado
+    que recibe el mismo pid (pasa en contenedores, donde el servidor suele ser el pid 1)."""
+    global _proceso, _pid
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _proceso = f"{socket.gethostname()[:60]}:{_pid}:{uuid.uuid4().hex[:8]}"
+    return _proceso
+
+
+def iniciar(app):
+    global _ejecutor, _hilo
+    _ejecutor = ThreadPoolExecutor(max_workers=app.config['TRABAJOS_HILOS'], thread_name_prefix='trabajo')
+
+    # Lo que quedó a medias al reiniciar el proceso ya no tiene quién lo termine
+    with app.app_context():
+        interrumpir_abandonados(app.config['TRABAJOS_LATIDO'])
+    with _candado:
+        if _hilo is None or not _hilo.is_alive(): # Los hilos no pasan a los procesos hijos del fork
+            _hilo = threading.Thread(target=_latir, args=(app,), name='trabajos-latido', daemon=True)
+            _hilo.start()
+
+
+def interrumpir_abandonados(latido):
+    """Marca como interrumpidos los trabajos sin latido en LATIDOS_PERDIDOS * 'latido' segundos y
+    las cargas masivas que quedaron 'En proceso' sin un trabajo vivo. Devuelve los trabajos."""
+    limite = datetime.utcnow() - timedelta(seconds=LATIDOS_PERDIDOS * latido)
+    interrumpidos = Trabajo.query.filter(
+        Trabajo.estado.in_(ACTIVOS), (Trabajo.latido < limite) | Trabajo.latido.is_(None)
+    ).update({'estado': 'Interrumpido', 'fecha_fin': datetime.utcnow()}, synchronize_session=False)
+
+    # Sus cargas masivas se retoman cuando alguien vuelva a subir el mismo archivo. Una carga
+    # recién abierta todavía no tiene trabajo: cuenta su última actualización
+    con_trabajo_vivo = select(Trabajo.id).where(Trabajo.carga_id == CargaMasiva.id, Trabajo.estado.in_(ACTIVOS))
+    CargaMasiva.query.filter(
+        CargaMasiva.estado == 'En proceso', CargaMasiva.fecha_actualizacion < limite, ~con_trabajo_vivo.exists()
+    ).update({'estado': 'Interrumpida'}, synchronize_session=False)
+    db.session.commit()
+    return interrumpidos
+
+
+def _latir(app):
+    while True:
+        latido = app.config['TRABAJOS_LATIDO']
+        time.sleep(latido)
+        with app.app_context():
+            try:
+                Trabajo.query.filter(Trabajo.proceso == proceso(), Trabajo.estado.in_(ACTIVOS)).update(
+                    {'latido': datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+                # Si otro worker se cayó, sus trabajos no esperan a que alguien reinicie el servidor
+                interrumpir_abandonados(latido)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("No se pudo renovar el latido de los trabajos")
+
+
+def encolar(tipo, funcion, *args, usuario_id=None):
+    # Registra el trabajo y lo manda al ejecutor; 'funcion' recibe (trabajo, *args)
+    trabajo = Trabajo(tipo=tipo, usuario_id=usuario_id, proceso=proceso(), latido=datetime.utcnow())
+    db.session.add(trabajo)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _ejecutor.submit(_ejecutar, app, trabajo.id, funcion, args)
+    return trabajo
+
+
+def _ejecutar(app, trabajo_id, funcion, args):
+    with app.app_context():
+        trabajo = db.session.get(Trabajo, trabajo_id)
+        trabajo.estado = 'En proceso'
+        trabajo.fecha_inicio = trabajo.latido = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            funcion(trabajo, *args)
+            trabajo.estado = 'Completado'
+        except Exception as e:
+            db.session.rollback()
+            trabajo = db.session.get(Trabajo, trabajo_id)
+            trabajo.estado = 'Fallido'
+            trabajo.mensaje = str(e)[:500]
+            if trabajo.carga_id:
+                CargaMasiva.query.filter_by(id=trabajo.carga_id, estado='En proceso').update(
+                    {'estado': 'Interrumpida'}, synchronize_session=False
+                )
+
+        trabajo.fecha_fin = datetime.utcnow()
+        db.session.commit()
+        # Como las rutas, cada trabajo deja su resultado en la bitácora de auditoría
+        auditoria.registrar(f"Trabajo {trabajo.id} ({trabajo.tipo}) {trabajo.estado.lower()}: "
+                            f"{trabajo.exitos} exitosos, {trabajo.errores} con error", trabajo.usuario_id,
+                            f"trabajo:{trabajo.tipo}")
+
+
+def estado_json(trabajo, errores=()):
+    porcentaje = round(100 * trabajo.procesados / trabajo.total, 1) if trabajo.total else 0
+    return {
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'total': trabajo.total,
+        'procesados': trabajo.procesados,
+        'exitos': trabajo.exitos,
+        'errores': trabajo.errores,
+        'porcentaje': porcentaje,
+        'mensaje': trabajo.mensaje,
+        'detalle_errores': list(errores),
+        'terminado': trabajo.estado in ('Completado', 'Fallido', 'Interrumpido')
+    }
@@ -0,0 +1,67 @@
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from models import db, Usuario
+from basedatos import SesionAcueducto
+
+# --- USUARIO DE CADA PETICIÓN ---
+# Flask-Login pide el usuario en cada petición autenticada. En lugar de leer la tabla cada
+# vez, se guarda una copia (id, username, rol) por proceso durante VIGENCIA_CACHE segundos.
+# Los cambios hechos en este proceso la invalidan al confirmarse; los de otros procesos
+# se ven cuando vence la copia.
+VIGENCIA_CACHE = 300
+
+_usuarios = {} # id -> (UsuarioActual, leido_en)
+
+
+class UsuarioActual(UserMixin):
+    """Copia de solo lectura del usuario con sesión iniciada; es lo que queda en current_user."""
+
+    def __init__(self, id, username, rol):
+        self.id = id
+        self.username = username
+        self.rol = rol
+
+
+def cargar(usuario_id):
+    entrada = _usuarios.get(usuario_id)
+    if entrada and time.monotonic() - entrada[1] <= VIGENCIA_CACHE:
+        return entrada[0]
+
+    fila = db.session.query(Usuario.id, Usuario.username, Usuario.rol).filter(Usuario.id == usuario_id).first()
+    if fila is None: # Usuario borrado: la sesión deja de ser válida
+        _usuarios.pop(usuario_id, None)
+        return None
+    usuario = UsuarioActual(*fila)
+    _usuarios[usuario_id] = (usuario, time.monotonic())
+    return usuario
+
+
+def invalidar(usuario_id=None):
+    if usuario_id is None:
+        _usuarios.clear()
+    else:
+        _usuarios.pop(usuario_id, None)
+
+
+# Cambios de rol, nombre o contraseña y borrados hechos con el ORM. Se invalida después del
+# commit para que otra petición no vuelva a guardar el valor viejo mientras tanto. Los
+# UPDATE/DELETE masivos (query.update) no pasan por aquí: deben llamar a invalidar().
+@event.listens_for(Usuario, 'after_update')
+@event.listens_for(Usuario, 'after_delete')
+def _marcar_modificado(mapper, conexion, usuario):
+    object_session(usuario).info.setdefault('usuarios_modificados', set()).add(usuario.id)
+
+
+@event.listens_for(SesionAcueducto, 'after_commit')
+def _invalidar_modificados(sesion):
+    for usuario_id in sesion.info.pop('usuarios_modificados', ()):
+        invalidar(usuario_id)
+
+
+@event.listens_for(SesionAcueducto, 'after_rollback')
+def _descartar_modificados(sesion):
+    sesion.info.pop('usuarios_modificados', None)